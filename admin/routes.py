@@ -2,55 +2,65 @@
 from flask import Blueprint, render_template, request, jsonify, current_app, redirect, url_for
 import os
 import json
+from datetime import datetime
 from functools import wraps
 from flask_login import current_user, login_required
+from sqlalchemy import tuple_
+from models import Feedback
 from utils.decorators import admin_required # import the decorator
+from utils.graph_store import MAP_OPS
+from utils.log import get_logger
+
+logger = get_logger(__name__)
 
 # --- Add url_prefix here ---
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+def _connectivity(map_name):
+    """Connectivity report for a saved map, logging nodes routes cannot reach"""
+    report = current_app.pathfinder.connectivity_report(map_name)
+    if report and (report['disconnected_count'] or report['one_way_count']):
+        logger.warning("Map has unreachable nodes", extra={
+            'map': map_name,
+            'disconnected': report['disconnected_count'],
+            'one_way': report['one_way_count']
+        })
+    return report
+
 # Route for /admin/
 @admin_bp.route('/')
 @admin_required
 def dashboard():
-    # The print statements from the decorator should run *before* this executes
-    print("Executing admin dashboard view", flush=True)
     return render_template('admin/dashboard.html')
 
 # Route for /admin/map_editor
 @admin_bp.route('/map_editor')
 @admin_required
 def map_editor():
-    # The print statements from the decorator should run *before* this executes
-    print("Executing map_editor view", flush=True)
     map_name = request.args.get('map', 'campus')
 
-    # Determine map type and path
+    # Determine map type and floor plan (loaded in tiles by the editor)
     if map_name.startswith('building_'):
         map_type = 'building'
         building = map_name.split('_')[1]
-        map_path = f'maps/building_{building}_floor1.svg'  # Default to floor 1
+        map_file = f'building_{building}_floor1'  # Default to floor 1
     else:
         map_type = 'campus'
-        map_path = 'maps/campus.svg'
+        map_file = 'campus'
 
-    # Load existing node data
-    data_file = f'{map_name}_nodes.json'
-    data_path = os.path.join(current_app.config['DATA_FOLDER'], data_file)
-
-    if os.path.exists(data_path):
-        with open(data_path, 'r') as f:
-            data = json.load(f)
-        nodes = data.get('nodes', {})
-        edges = data.get('edges', {})
-    else:
-        nodes = {}
-        edges = {}
+    # Load existing node data (snapshot plus any journaled edits)
+    try:
+        data, _ = current_app.pathfinder.store.load(map_name)
+    except ValueError:
+        return jsonify({'error': 'Invalid map name'}), 400
+    nodes = data.get('nodes', {})
+    edges = data.get('edges', {})
 
     return render_template('admin/map_editor.html',
                            map_name=map_name.capitalize(),
+                           map_id=map_name,
                            map_type=map_type,
-                           map_path=map_path,
+                           map_file=map_file,
                            nodes=nodes,
                            edges=edges)
 
@@ -58,8 +68,9 @@ def map_editor():
 @admin_bp.route('/api/save_map', methods=['POST'])
 @admin_required
 def save_map():
-    print("Executing save_map API endpoint", flush=True) # Added for debug
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
     map_name = data.get('map')
     nodes = data.get('nodes', {})
     edges = data.get('edges', {})
@@ -67,22 +78,124 @@ def save_map():
     if not map_name:
         return jsonify({'error': 'Missing map name'}), 400
 
-    # Save to JSON file
-    data_file = f'{map_name}_nodes.json'
-    data_path = os.path.join(current_app.config['DATA_FOLDER'], data_file)
+    # Save to JSON file (atomic write-then-rename); the store rejects
+    # anything but objects for nodes and edges. Routes switch over once
+    # the background reload has compiled the new map.
+    try:
+        current_app.pathfinder.store.save(map_name, {'nodes': nodes, 'edges': edges})
+        current_app.pathfinder.schedule_reload()
+        logger.info("Map saved", extra={'map': map_name, 'user_id': current_user.id, 'nodes': len(nodes)})
+        return jsonify({'success': True, 'connectivity': _connectivity(map_name)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Route for /admin/api/patch_map
+@admin_bp.route('/api/patch_map', methods=['POST'])
+@admin_required
+def patch_map():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    map_name = data.get('map')
+    ops = data.get('ops', [])
+
+    if not map_name:
+        return jsonify({'error': 'Missing map name'}), 400
+    if not isinstance(ops, list) or not all(isinstance(op, dict) and op.get('op') in MAP_OPS for op in ops):
+        return jsonify({'error': f"ops must be a list of objects with op one of {', '.join(MAP_OPS)}"}), 400
 
+    # Deltas are appended to the map's journal instead of rewriting the file
     try:
-        with open(data_path, 'w') as f:
-            json.dump({'nodes': nodes, 'edges': edges}, f, indent=2)
-        return jsonify({'success': True})
+        current_app.pathfinder.patch_map(map_name, ops)
+        logger.info("Map patched", extra={'map': map_name, 'user_id': current_user.id, 'ops': len(ops)})
+        return jsonify({'success': True, 'applied': len(ops)})
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f'Invalid operation: {e}'}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Route for /admin/api/connectivity
+@admin_bp.route('/api/connectivity')
+@admin_required
+def connectivity():
+    map_name = request.args.get('map', 'campus')
+    report = _connectivity(map_name)
+    if report is None:
+        return jsonify({'error': 'Invalid map name'}), 400
+    return jsonify(report)
+
+# Route for /admin/api/overlay
+@admin_bp.route('/api/overlay', methods=['GET', 'POST'])
+@admin_required
+def overlay():
+    """Closures and weight multipliers applied on top of the saved maps
+
+    POST {map, node, factor} or {map, from, to, factor, both}: a null
+    factor closes, 1 reopens, anything else multiplies the edge weights.
+    """
+    pathfinder = current_app.pathfinder
+    if request.method == 'GET':
+        return jsonify({'overlay': pathfinder.snapshot.overlay.to_dict(), 'profiles': pathfinder.profiles})
+
+    data = request.get_json(silent=True) or {}
+    map_name = data.get('map')
+    factor = data.get('factor')
+    try:
+        if data.get('node'):
+            result = pathfinder.set_node_rule(map_name, data['node'], factor)
+        elif data.get('from') and data.get('to'):
+            result = pathfinder.set_edge_rule(map_name, data['from'], data['to'], factor, bool(data.get('both')))
+        else:
+            return jsonify({'error': 'Missing node, or from and to'}), 400
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    logger.info("Overlay updated", extra={
+        'map': map_name, 'user_id': current_user.id, 'factor': factor,
+        'node': data.get('node'), 'from': data.get('from'), 'to': data.get('to')
+    })
+    return jsonify({'success': True, 'overlay': result.to_dict()})
+
+# Route for /admin/feedback
+@admin_bp.route('/feedback')
+@admin_required
+def feedback():
+    """Newest feedback first, one page at a time
+
+    Pages continue after the last row shown (?before=<created_at>,<id>)
+    instead of using an offset, so every page is a single range scan of
+    the (created_at, id) index however far back it is.
+    """
+    page_size = current_app.config.get('FEEDBACK_PAGE_SIZE', 50)
+    query = Feedback.query.order_by(Feedback.created_at.desc(), Feedback.id.desc())
+    before = request.args.get('before')
+    if before:
+        try:
+            created_at, row_id = before.rsplit(',', 1)
+            cursor = (datetime.fromisoformat(created_at), int(row_id))
+        except ValueError:
+            return jsonify({'error': 'Invalid before cursor'}), 400
+        query = query.filter(tuple_(Feedback.created_at, Feedback.id) < cursor)
+    rows = query.limit(page_size + 1).all()
+    older = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        older = f'{rows[-1].created_at.isoformat()},{rows[-1].id}'
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'feedback': [{'id': row.id, 'name': row.name, 'email': row.email, 'message': row.message,
+                          'created_at': row.created_at.isoformat()} for row in rows],
+            'before': older
+        })
+    return render_template('admin/feedback.html', feedback=rows, older=older, first_page=not before,
+                           pending=current_app.feedback_queue.depth)
+
 # Route for /admin/save_map_data
 @admin_bp.route('/save_map_data', methods=['POST'])
 @admin_required
 def save_map_data():
-    print("Executing save_map_data endpoint", flush=True) # Added for debug
     map_name = request.form.get('map_name')
     nodes = request.form.get('nodes')
     edges = request.form.get('edges')
@@ -90,16 +203,16 @@ def save_map_data():
     if not all([map_name, nodes, edges]):
         return jsonify({'error': 'Missing data'}), 400
 
-    filename = f"{map_name}_nodes.json"
-    filepath = os.path.join(current_app.config['DATA_FOLDER'], filename)
-
     try:
         data = {
             'nodes': json.loads(nodes),
             'edges': json.loads(edges)
         }
-        with open(filepath, 'w') as f:
-            json.dump(data, f, indent=2)
-        return jsonify({'success': True})
+        current_app.pathfinder.store.save(map_name, data)
+        current_app.pathfinder.schedule_reload()
+        logger.info("Map saved", extra={'map': map_name, 'user_id': current_user.id})
+        return jsonify({'success': True, 'connectivity': _connectivity(map_name)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
\ No newline at end of file
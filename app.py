@@ -1,15 +1,16 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
-import os
-from dotenv import load_dotenv
-from config import Config
+import time
+_import_started = time.perf_counter()
 
-# Load environment variables
-load_dotenv()
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response
+import hashlib
+import math
+import os
+import click
+from config import Config  # also loads .env
 
-# Flask-Login, SQLAlchemy, and Flask-Migrate Setup
+# Flask-Login and SQLAlchemy Setup
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from models import db, User
-from flask_migrate import Migrate
+from models import db, User, Feedback
 
 # Blueprints
 from auth.routes import auth_bp
@@ -18,43 +19,158 @@ from admin.routes import admin_bp
 
 # PathFinder Utility
 from utils.pathfinder import PathFinder
+from utils.route_executor import RouteBusy, RouteTimeout
+from utils.svg_optimizer import MapBuilder
+from utils.assets import AssetBuilder
+from utils.fragment_cache import FragmentCache
+from utils.startup import StartupProfile
+from utils.user_cache import UserCache
+from utils.write_behind import WriteBehindQueue
+from utils import metrics
+from utils import log
+from utils import route_encoding
+from utils.log import get_logger
+
+logger = get_logger(__name__)
 
 # Create App Factory
 login_manager = LoginManager()
-migrate = Migrate()
 
 def create_app(config_class=Config):
+    profile = StartupProfile(_import_started)
+    profile.record('imports', _import_started)
+
     app = Flask(__name__)
     app.config.from_object(config_class)
-
-    # Configure data folder
-    app.config['DATA_FOLDER'] = os.path.join(app.root_path, 'data')
+    app.startup_profile = profile
+    log.init_app(app)
 
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
-    migrate.init_app(app, db)
+
+    # Migrations are a CLI concern (`flask db ...`); serving workers skip
+    # importing Alembic
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        with profile.phase('migrate'):
+            from flask_migrate import Migrate
+            Migrate(app, db)
+
+    # current_user comes from a short-lived per-process cache, so most
+    # requests skip the users table entirely
+    app.user_cache = UserCache.from_config(app.config, lambda user_id: db.session.get(User, user_id))
+    app.user_cache.watch(User)
+
+    # Contact form submissions are inserted in batches off the request thread
+    app.feedback_queue = WriteBehindQueue.from_config(app, db, Feedback, 'feedback')
 
     @login_manager.user_loader
     def load_user(user_id):
-        print(f"Loading user with ID: {user_id}")  # Added print statement
-        return User.query.get(int(user_id))
+        logger.debug("Loading user", extra={'user_id': user_id})
+        try:
+            return app.user_cache.get(int(user_id))
+        except ValueError:
+            return None
 
     # Register blueprints (Correct Order)
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
     app.register_blueprint(admin_bp)
 
-    # Initialize PathFinder with app context
-    with app.app_context():
+    # Floor-plan SVGs are optimized once and served pre-compressed
+    app.map_builder = MapBuilder(os.path.join(app.root_path, 'templates', 'maps'),
+                                 app.config['MAP_BUILD_FOLDER'],
+                                 app.config['MAP_PRECISION'],
+                                 app.config['MAP_TILE_LEVELS'])
+
+    # CSS/JS are served as hashed bundles; templates ask for asset_url('site.css')
+    app.asset_builder = AssetBuilder(app.static_folder, app.config['ASSET_BUILD_FOLDER'], app.static_url_path)
+    app.jinja_env.globals['asset_url'] = lambda name: url_for('main.asset', filename=app.asset_builder.filename(name))
+
+    # Mostly static pages cache their rendered body ({% cache %} blocks)
+    # until the graph or the asset bundles change
+    app.fragment_cache = FragmentCache.init_app(app)
+    app.jinja_env.fragment_cache_key = lambda: (app.pathfinder.version, app.asset_builder.version,
+                                                request.script_root)
+
+    # Initialize PathFinder with app context; graphs load on first use
+    # unless GRAPH_LOADING is 'eager'. The schema comes from migrations
+    # (`flask db upgrade`, which also sets up an empty database).
+    with profile.phase('pathfinder'), app.app_context():
         app.pathfinder = PathFinder(app)  # Pass the app instance
 
-        # Create tables
-        db.create_all()
+    if app.config.get('METRICS_ENABLED'):
+        metrics.init_app(app)
+        cache = app.user_cache
+        metrics.REGISTRY.register(metrics.Callback(
+            'user_loads_total', 'Logged-in user lookups, by where they were answered', 'counter',
+            lambda: {(source,): count for source, count in cache.lookups.items()}, labels=('source',)))
+        feedback = app.feedback_queue
+        metrics.REGISTRY.register(metrics.Callback(
+            'feedback_queue_depth', 'Feedback submissions waiting to be inserted', 'gauge',
+            lambda: {(): feedback.depth}))
+        metrics.REGISTRY.register(metrics.Callback(
+            'feedback_rows_total', 'Feedback rows inserted, spilled to disk, replayed from disk or rejected',
+            'counter', lambda: {(outcome,): count for outcome, count in feedback.counts.items()}, labels=('outcome',)))
+        fragments = app.fragment_cache
+        metrics.REGISTRY.register(metrics.Callback(
+            'fragment_cache_lookups_total', 'Cached page fragments served (hit) or rendered (miss)', 'counter',
+            lambda: {('hit',): fragments.hits, ('miss',): fragments.misses}, labels=('result',)))
+
+    if app.config.get('GRAPH_RELOAD') == 'request':
+        @app.before_request
+        def reload_graphs_if_changed():
+            # Cheap stat check; parsing happens on a background thread
+            app.pathfinder.check_for_updates()
 
+    if app.config.get('STARTUP_PROFILE'):
+        logger.info(profile.report())
     return app
 
+def register_commands(app):
+    @app.cli.command('build-maps')
+    def build_maps():
+        """Optimize and pre-compress every floor-plan SVG"""
+        for name, manifest in app.map_builder.build_all().items():
+            print(f"{name}: {manifest['encodings']}")
+
+    @app.cli.command('build-assets')
+    def build_assets():
+        """Bundle, minify and pre-compress the site's CSS and JavaScript"""
+        for name, bundle in app.asset_builder.build()['bundles'].items():
+            print(f"{name}: {bundle['file']} {bundle['encodings']}")
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create every table on a fresh database and mark migrations as applied"""
+        from flask_migrate import stamp
+        db.create_all()
+        stamp()
+        print("Database initialized")
+
+    @app.cli.command('create-user')
+    @click.argument('email')
+    @click.argument('password')
+    @click.option('--admin', is_flag=True, help='Give the user the admin role')
+    def create_user(email, password, admin):
+        """Add a user account (or reset its password and role)"""
+        user = User.query.filter_by(email=email).first() or User(email=email)
+        user.set_password(password)
+        user.role = 'admin' if admin else 'user'
+        user.is_admin = admin
+        db.session.add(user)
+        db.session.commit()
+        print(f"{user.role.capitalize()} {email} saved")
+
+    @app.cli.command('startup-report')
+    def startup_report():
+        """Show how long building the app took, then time loading every graph"""
+        print(app.startup_profile.report())
+        began = time.perf_counter()
+        app.pathfinder.snapshot.router
+        print(f"  {'graphs (all maps)':<20} {(time.perf_counter() - began) * 1000:8.1f} ms")
+
 def create_initial_admin():
     with app.app_context():
         if User.query.count() == 0:
@@ -65,22 +181,126 @@ def create_initial_admin():
 
 # Create and run the app
 app = create_app()
+register_commands(app)
 
 # API: Find Path
 @app.route('/api/find_path')
 def find_path():
     start = request.args.get('start')
     end = request.args.get('end')
+    strategy = request.args.get('strategy')
+    profile = request.args.get('profile') or None
+    response_format = request.args.get('format', 'full')
+    precision = request.args.get('precision', 1, type=int)
 
     if not start or not end:
         return jsonify({'error': 'Missing start or end parameters'}), 400
+    if response_format not in ('full', 'compact'):
+        return jsonify({'error': 'format must be full or compact'}), 400
+    if not 0 <= precision <= route_encoding.MAX_PRECISION:
+        return jsonify({'error': f'precision must be between 0 and {route_encoding.MAX_PRECISION}'}), 400
+
+    # Same query on the same graph version: the client's copy is current
+    try:
+        version = app.pathfinder.route_version(start, end, strategy, profile)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    etag = hashlib.sha1(f"{version}|{request.query_string.decode('utf-8', 'replace')}".encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
 
-    path = app.pathfinder.find_path(start, end)
+    try:
+        path = app.pathfinder.find_path(start, end, strategy, profile)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RouteBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except RouteTimeout as e:
+        return jsonify({'error': str(e)}), 504
 
     if not path:
         return jsonify({'error': 'No path found'}), 404
 
-    return jsonify(path)
+    with metrics.serialize_seconds.time('find_path'):
+        if response_format == 'compact':
+            body = route_encoding.compact(path, request.args.get('coords', 'polyline'), precision)
+        else:
+            body = path
+        if request.args.get('directions'):
+            body = dict(body, directions=route_encoding.directions(path))
+        response = jsonify(body)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # revalidate, usually answered with 304
+    return response
+
+# API: Route Matrix
+@app.route('/api/route_matrix', methods=['POST'])
+def route_matrix():
+    data = request.get_json(silent=True) or {}
+    sources = data.get('sources')
+    targets = data.get('targets', sources)
+
+    if not isinstance(sources, list) or not isinstance(targets, list) or not sources or not targets:
+        return jsonify({'error': 'sources and targets must be non-empty lists'}), 400
+    if not all(isinstance(node_id, str) and node_id for node_id in sources + targets):
+        return jsonify({'error': 'sources and targets must be node ids (non-empty strings)'}), 400
+    profile = data.get('profile')
+    if profile is not None and not isinstance(profile, str):
+        return jsonify({'error': 'profile must be a string'}), 400
+    if len(sources) * len(targets) > app.config['ROUTE_MATRIX_MAX_CELLS']:
+        return jsonify({'error': 'Matrix too large'}), 413
+
+    try:
+        result = app.pathfinder.find_paths(sources, targets, include_paths=bool(data.get('paths')),
+                                           profile=profile)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RouteBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    with metrics.serialize_seconds.time('route_matrix'):
+        return jsonify(result)
+
+# API: Nearest node/edge to a point, or nodes in a box
+@app.route('/api/nearest')
+def nearest():
+    map_name = request.args.get('map', 'campus')
+    floor = request.args.get('floor', 1, type=int)
+    bbox = request.args.get('bbox')
+
+    kind = request.args.get('kind', 'node')
+    if kind not in ('node', 'edge'):
+        return jsonify({'error': 'kind must be node or edge'}), 400
+
+    try:
+        if bbox:
+            x0, y0, x1, y1 = (float(v) for v in bbox.split(','))
+            if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+                raise ValueError
+            nodes = app.pathfinder.nodes_within(map_name, x0, y0, x1, y1, floor)
+            if nodes is None:
+                return jsonify({'error': 'Unknown map'}), 404
+            return jsonify({'nodes': nodes})
+        x = float(request.args['x'])
+        y = float(request.args['y'])
+        if not (math.isfinite(x) and math.isfinite(y)):
+            raise ValueError
+        result = app.pathfinder.nearest(map_name, x, y, floor, kind)
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Expected finite x and y, or bbox=x0,y0,x1,y1'}), 400
+
+    if result is None:
+        return jsonify({'error': 'Nothing found'}), 404
+    return jsonify(result)
+
+# Metrics for Prometheus (this worker's only)
+@app.route('/metrics')
+def metrics_endpoint():
+    if not app.config.get('METRICS_ENABLED'):
+        return jsonify({'error': 'Metrics disabled'}), 404
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 # Regular Routes (Removed duplicates)
 @app.route('/')
@@ -3,6 +3,7 @@ from flask import Blueprint, render_template, redirect, url_for, request, flash,
 from flask_login import login_user, logout_user, login_required
 from werkzeug.security import check_password_hash
 from models import User, db
+from utils.user_cache import forget_session_user
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -68,6 +69,7 @@ def admin_login():
 @login_required
 def logout():
     logout_user()
+    forget_session_user()
     return redirect(url_for('main.start'))
 
 @auth_bp.route('/admin/register', methods=['GET', 'POST'])
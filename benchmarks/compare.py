@@ -0,0 +1,58 @@
+"""Compare two benchmark result files
+
+    python -m benchmarks.compare benchmarks/results/abc123-medium.json benchmarks/results/def456-medium.json
+
+Prints the change in throughput and latency for every target/workload the
+two runs share, and exits with status 1 if any got slower than --threshold.
+"""
+import argparse
+import json
+import sys
+
+# (field, True if bigger is better)
+FIELDS = (('throughput_qps', True), ('p50_ms', False), ('p90_ms', False), ('p99_ms', False))
+
+
+def compare(baseline, current, threshold):
+    """Rows of (target, workload, field, old, new, change %, regressed)"""
+    old = {(r['target'], r['workload']): r for r in baseline['results']}
+    rows = []
+    for result in current['results']:
+        previous = old.get((result['target'], result['workload']))
+        if previous is None:
+            continue
+        for field, higher_is_better in FIELDS:
+            before, after = previous.get(field), result.get(field)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = -change if higher_is_better else change
+            rows.append((result['target'], result['workload'], field, before, after, change, worse > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent slower that counts as a regression')
+    options = parser.parse_args(argv)
+
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    with open(options.current) as f:
+        current = json.load(f)
+    if baseline.get('graphs') != current.get('graphs'):
+        print("Warning: the runs used different graphs", file=sys.stderr)
+
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    rows = compare(baseline, current, options.threshold)
+    for target, workload, field, before, after, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{target:<10} {workload:<15} {field:<15} {before:10.3f} -> {after:10.3f}  {change:+6.1f}%{flag}")
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Contraction hierarchy: preprocessing cost, query speedup and correctness
+
+    python -m benchmarks.contraction --size medium --queries 500
+
+Builds a hierarchy for the merged synthetic campus, checks every query
+against plain Dijkstra (same distance, and a path made of real edges that
+adds up to it) and compares query times with the search strategies. Exits
+with status 1 if any route disagrees.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+from benchmarks import synthetic
+from benchmarks.run import RESULTS_FOLDER, _commit, make_workload, measure, merged_graph
+from utils import graph as graphs
+from utils.contraction import ContractionHierarchy
+
+STRATEGIES = ('dijkstra', 'astar', 'bidirectional', 'ch')
+
+
+def path_length(graph, path):
+    """Length of a path over the graph's edges, or None if an edge is missing"""
+    total = 0.0
+    for a, b in zip(path, path[1:]):
+        i, j = graph.index[a], graph.index[b]
+        weight = min((w for target, w in graph.neighbors(i) if target == j), default=None)
+        if weight is None:
+            return None
+        total += weight
+    return total
+
+
+def check(graph, pairs):
+    """Pairs where the hierarchy's route differs from Dijkstra's"""
+    mismatches = []
+    for start, end in pairs:
+        expected = graphs.dijkstra(graph, start, end)
+        actual = graph.contraction.route(graph, start, end)
+        if expected is None or actual is None:
+            if expected is not actual:
+                mismatches.append((start, end))
+            continue
+        length = path_length(graph, actual['path'])
+        if (not math.isclose(expected['distance'], actual['distance'], rel_tol=1e-9, abs_tol=1e-9)
+                or length is None or not math.isclose(length, actual['distance'], rel_tol=1e-9, abs_tol=1e-9)
+                or actual['path'][0] != start or actual['path'][-1] != end):
+            mismatches.append((start, end))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', choices=sorted(synthetic.SIZES), default='small')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--witness-limit', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/ch-<commit>-<size>.json)')
+    options = parser.parse_args(argv)
+
+    maps = synthetic.generate_campus(options.size, seed=options.seed)
+    graph = merged_graph(maps, 15.0, 25.0)
+    began = time.perf_counter()
+    hierarchy = ContractionHierarchy.build(graph, options.witness_limit)
+    build_seconds = time.perf_counter() - began
+    print(f"{len(graph)} nodes, {graph.edge_count} edges: built in {build_seconds:.2f} s, "
+          f"{hierarchy.shortcut_count} shortcuts", file=sys.stderr)
+
+    pairs = make_workload('uniform', maps, options.queries, options.seed)
+    graph.contraction = hierarchy
+    mismatches = check(graph, pairs)
+    print(f"Checked {len(pairs)} routes against Dijkstra: {len(mismatches)} mismatches", file=sys.stderr)
+
+    results = {}
+    for strategy in STRATEGIES:
+        settled = []
+
+        def query(start, end):
+            graphs.take_counters()
+            result = graphs.STRATEGIES[strategy](graph, start, end)
+            settled.append(graphs.take_counters()[0])
+            return result
+
+        result = measure(query, pairs, warmup=0)
+        result['mean_settled'] = sum(settled) / len(settled) if settled else None
+        results[strategy] = result
+        print(f"{strategy:<14} p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms  "
+              f"settled {result['mean_settled']:9.1f}", file=sys.stderr)
+
+    speedup = results['dijkstra']['mean_ms'] / results['ch']['mean_ms']
+    saved = results['dijkstra']['mean_ms'] - results['ch']['mean_ms']
+    print(f"Speedup over Dijkstra {speedup:.1f}x; preprocessing pays for itself after "
+          f"{build_seconds * 1000 / saved:.0f} queries" if saved > 0 else f"Speedup {speedup:.2f}x", file=sys.stderr)
+
+    report = {
+        'commit': _commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'options': {key: value for key, value in vars(options).items() if key != 'output'},
+        'graph': {'nodes': len(graph), 'edges': graph.edge_count},
+        'preprocessing': {'seconds': build_seconds, 'shortcuts': hierarchy.shortcut_count},
+        'mismatches': [list(pair) for pair in mismatches],
+        'speedup_over_dijkstra': speedup,
+        'results': [dict(result, target=strategy, workload='uniform') for strategy, result in results.items()]
+    }
+    output = Path(options.output) if options.output else \
+        RESULTS_FOLDER / f"ch-{report['commit'] or 'unknown'}-{options.size}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
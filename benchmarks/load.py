@@ -0,0 +1,338 @@
+"""Load test the app over HTTP with concurrent, logged-in clients
+
+    python -m benchmarks.load --size medium --workers 4 --threads 2
+    python -m benchmarks.load --database-url postgresql://localhost/campus_load --workers 8
+    python -m benchmarks.load --url http://127.0.0.1:8000 --size medium --email ... --password ...
+
+Without --url a server is started here: synthetic graphs in a temporary data
+folder, a fresh SQLite database (or --database-url), load-test accounts
+created with `flask create-user`, and the app under gunicorn (or the Flask
+dev server with --server flask). With --url the server must already be
+serving the same synthetic data; write it with --write-data DIR and start the
+server with DATA_FOLDER=DIR.
+
+Concurrency is stepped up (--concurrency 1,2,4,...) for --duration seconds
+each. Every step reports throughput, error rate and latency percentiles;
+the largest throughput is the saturation point. The client runs in one
+process, so at high concurrency check that it is not the bottleneck.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+from benchmarks import synthetic
+from benchmarks.run import RESULTS_FOLDER, WORKLOADS, _commit, make_workload, summarize
+
+ROOT = Path(__file__).resolve().parent.parent
+# Relative request weights; admin writes rewrite maps, so they are opt-in
+DEFAULT_MIX = {'find_path': 70, 'map': 10, 'waypoint': 10, 'admin_patch': 0, 'admin_save': 0}
+USER = ('load@example.com', 'load-test')
+ADMIN = ('load-admin@example.com', 'load-test')
+
+
+class LoginError(Exception):
+    pass
+
+
+class Server:
+    """The app on a local port, set up from scratch on synthetic data"""
+
+    def __init__(self, data_folder, database_url, kind='gunicorn', workers=2, threads=1, port=None):
+        self.data_folder = data_folder
+        self.database_url = database_url
+        self.kind = kind
+        self.workers = workers
+        self.threads = threads
+        self.port = port or _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.process = None
+
+    def _env(self):
+        env = dict(os.environ, FLASK_APP='app.py', DATA_FOLDER=str(self.data_folder),
+                   DATABASE_URL=self.database_url)
+        env.setdefault('SECRET_KEY', 'load-test')
+        return env
+
+    def _flask(self, *args):
+        subprocess.run([sys.executable, '-m', 'flask', *args], cwd=ROOT, env=self._env(), check=True,
+                       stdout=subprocess.DEVNULL)
+
+    def start(self, timeout=60):
+        self._flask('init-db')
+        self._flask('create-user', *USER)
+        self._flask('create-user', *ADMIN, '--admin')
+        if self.kind == 'gunicorn':
+            command = [sys.executable, '-m', 'gunicorn', '--workers', str(self.workers),
+                       '--threads', str(self.threads), '--bind', f'127.0.0.1:{self.port}', 'app:app']
+        else:
+            command = [sys.executable, '-m', 'flask', 'run', '--port', str(self.port), '--with-threads', '--no-reload']
+        self.process = subprocess.Popen(command, cwd=ROOT, env=self._env(),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.kind} exited with status {self.process.returncode}")
+            try:
+                urllib.request.urlopen(self.url + '/', timeout=1).close()
+                return self
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"{self.kind} did not answer on {self.url} within {timeout} s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class VirtualUser:
+    """One client with its own cookie jars, logged in once per role"""
+
+    def __init__(self, base_url, credentials, timeout=30):
+        self.base_url = base_url
+        self.credentials = credentials  # role -> (email, password)
+        self.timeout = timeout
+        self._openers = {}
+
+    def opener(self, role):
+        opener = self._openers.get(role)
+        if opener is None:
+            jar = http.cookiejar.CookieJar()
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+            email, password = self.credentials[role]
+            path = '/admin/login' if role == 'admin' else '/login'
+            form = urllib.parse.urlencode({'email': email, 'password': password}).encode('utf-8')
+            with opener.open(self.base_url + path, form, timeout=self.timeout) as response:
+                # A failed login redirects back to the login form
+                if urllib.parse.urlparse(response.geturl()).path.endswith('login'):
+                    raise LoginError(f"Could not log in as {email}")
+            self._openers[role] = opener
+        return opener
+
+    def request(self, role, path, body=None):
+        """Status code of one request; login redirects count as 401"""
+        data, headers = None, {}
+        if body is not None:
+            data, headers = json.dumps(body).encode('utf-8'), {'Content-Type': 'application/json'}
+        request = urllib.request.Request(self.base_url + path, data, headers)
+        try:
+            with self.opener(role).open(request, timeout=self.timeout) as response:
+                response.read()
+                if urllib.parse.urlparse(response.geturl()).path.endswith('login'):
+                    return 401
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except (urllib.error.URLError, OSError):
+            return 0  # connection refused/reset or timed out
+
+
+class Mix:
+    """Weighted choice of the next request: (scenario, role, path, JSON body)"""
+
+    def __init__(self, weights, maps, workload, seed=0):
+        self.scenarios = [name for name, weight in weights.items() if weight > 0]
+        self.weights = [weights[name] for name in self.scenarios]
+        self.roles = {'admin' if name.startswith('admin_') else 'user' for name in self.scenarios}
+        self.pairs = make_workload(workload, maps, 5000, seed)
+        self.campus = maps['campus']
+        self.campus_ids = list(self.campus['nodes'])
+
+    def next(self, rng):
+        scenario = rng.choices(self.scenarios, self.weights)[0]
+        if scenario == 'find_path':
+            start, end = rng.choice(self.pairs)
+            return scenario, 'user', '/api/find_path?' + urllib.parse.urlencode({'start': start, 'end': end}), None
+        if scenario in ('map', 'waypoint'):
+            return scenario, 'user', f'/{scenario}', None
+        if scenario == 'admin_patch':
+            # Rename a node to the name it already has: a real journal write
+            # and reload that leaves the map as it was
+            node_id = rng.choice(self.campus_ids)
+            op = {'op': 'update_node', 'id': node_id, 'node': {'name': self.campus['nodes'][node_id]['name']}}
+            return scenario, 'admin', '/admin/api/patch_map', {'map': 'campus', 'ops': [op]}
+        # admin_save: write the whole campus map back unchanged
+        return scenario, 'admin', '/admin/api/save_map', dict(self.campus, map='campus')
+
+
+def run_level(base_url, credentials, mix, concurrency, duration, seed=0):
+    """Drive `concurrency` users for `duration` seconds; returns the step's stats"""
+    records = []  # (scenario, seconds, status)
+    lock = threading.Lock()
+    users = [VirtualUser(base_url, credentials) for _ in range(concurrency)]
+    for user in users:
+        for role in mix.roles:
+            user.opener(role)  # log in before the clock starts
+    start = threading.Barrier(concurrency + 1)
+
+    def drive(user, rng):
+        own = []
+        clock = time.perf_counter
+        start.wait()
+        deadline = clock() + duration
+        while clock() < deadline:
+            scenario, role, path, body = mix.next(rng)
+            t = clock()
+            status = user.request(role, path, body)
+            own.append((scenario, clock() - t, status))
+        with lock:
+            records.extend(own)
+
+    threads = [threading.Thread(target=drive, args=(user, random.Random(seed * 1000 + i)))
+               for i, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - began
+
+    def stats(rows):
+        ok = [seconds for _, seconds, status in rows if 200 <= status < 400]
+        result = summarize(ok, wall, len(ok))
+        result['requests'] = len(rows)
+        result['errors'] = len(rows) - len(ok)
+        result['error_rate'] = result['errors'] / len(rows) if rows else 0.0
+        return result
+
+    level = stats(records)
+    level['concurrency'] = concurrency
+    level['statuses'] = {}
+    for _, _, status in records:
+        level['statuses'][str(status)] = level['statuses'].get(str(status), 0) + 1
+    level['scenarios'] = {name: stats([r for r in records if r[0] == name])
+                          for name in sorted({r[0] for r in records})}
+    return level
+
+
+def saturation(levels):
+    """Peak throughput, and the lowest concurrency reaching 90% of it"""
+    good = [level for level in levels if level['throughput_qps']]
+    if not good:
+        return None
+    peak = max(good, key=lambda level: level['throughput_qps'])
+    knee = min((level for level in good if level['throughput_qps'] >= 0.9 * peak['throughput_qps']),
+               key=lambda level: level['concurrency'])
+    return {'throughput_rps': peak['throughput_qps'], 'at_concurrency': peak['concurrency'],
+            'knee_concurrency': knee['concurrency'], 'p99_ms_at_knee': knee['p99_ms']}
+
+
+def load_test(options):
+    maps = synthetic.generate_campus(options.size, seed=options.seed)
+    mix = Mix(options.mix, maps, options.workload, options.seed)
+    report = {
+        'commit': _commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'options': {key: value for key, value in vars(options).items() if key not in ('output', 'password')},
+        'levels': []
+    }
+
+    with tempfile.TemporaryDirectory(prefix='campus-load-') as folder:
+        server = None
+        if options.url:
+            base_url = options.url.rstrip('/')
+            credentials = {'user': (options.email, options.password),
+                           'admin': (options.admin_email or options.email, options.admin_password or options.password)}
+        else:
+            synthetic.write(maps, os.path.join(folder, 'data'))
+            database_url = options.database_url or f"sqlite:///{os.path.join(folder, 'site.db')}"
+            server = Server(os.path.join(folder, 'data'), database_url, options.server,
+                            options.workers, options.threads).start()
+            base_url = server.url
+            credentials = {'user': USER, 'admin': ADMIN}
+            report['server'] = {'kind': options.server, 'workers': options.workers, 'threads': options.threads,
+                                'database': database_url.split(':', 1)[0]}
+        try:
+            for concurrency in options.concurrency:
+                level = run_level(base_url, credentials, mix, concurrency, options.duration, options.seed)
+                report['levels'].append(level)
+                print(f"{concurrency:>4} clients  {level['throughput_qps']:8.1f} req/s  "
+                      f"p50 {level['p50_ms'] or 0:8.2f} ms  p99 {level['p99_ms'] or 0:8.2f} ms  "
+                      f"errors {level['error_rate'] * 100:5.1f}%", file=sys.stderr)
+        finally:
+            if server is not None:
+                server.stop()
+
+    report['saturation'] = saturation(report['levels'])
+    return report
+
+
+def _mix(text):
+    weights = dict(DEFAULT_MIX)
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown scenario: {name}")
+        weights[name] = float(weight)
+    return weights
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', choices=sorted(synthetic.SIZES), default='small')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workload', choices=WORKLOADS, default='uniform', help='route query mix')
+    parser.add_argument('--mix', type=_mix, default=dict(DEFAULT_MIX),
+                        help='scenario weights, e.g. find_path=80,map=10,admin_patch=1 '
+                             f"(scenarios: {', '.join(DEFAULT_MIX)})")
+    parser.add_argument('--concurrency', type=lambda s: [int(n) for n in s.split(',')], default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per concurrency step')
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker')
+    parser.add_argument('--database-url', help='database for the started server (default: a new SQLite file)')
+    parser.add_argument('--url', help='test a server that is already running instead')
+    parser.add_argument('--email', default=USER[0])
+    parser.add_argument('--password', default=USER[1])
+    parser.add_argument('--admin-email')
+    parser.add_argument('--admin-password')
+    parser.add_argument('--write-data', metavar='DIR', help='only write the synthetic graphs to DIR')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/load-<commit>-<size>.json)')
+    options = parser.parse_args(argv)
+
+    if options.write_data:
+        synthetic.write(synthetic.generate_campus(options.size, seed=options.seed), options.write_data)
+        return
+
+    report = load_test(options)
+    output = Path(options.output) if options.output else \
+        RESULTS_FOLDER / f"load-{report['commit'] or 'unknown'}-{options.size}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    if report['saturation']:
+        print(f"Saturation: {report['saturation']['throughput_rps']:.1f} req/s "
+              f"(90% of it from {report['saturation']['knee_concurrency']} clients)", file=sys.stderr)
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
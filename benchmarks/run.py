@@ -0,0 +1,218 @@
+"""Routing benchmarks on synthetic campuses
+
+    python -m benchmarks.run --size medium --queries 2000
+    python -m benchmarks.run --size large --targets find_path --workloads cross_building
+
+Each run writes one JSON file (commit, machine, graph sizes and, per target
+and workload, throughput and latency percentiles) that benchmarks.compare
+can diff against a run from another commit.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks import synthetic
+
+TARGETS = ('dijkstra', 'find_path', 'endpoint')
+WORKLOADS = ('uniform', 'popular', 'cross_building')
+RESULTS_FOLDER = Path(__file__).parent / 'results'
+
+
+def _routable(maps):
+    """Node ids a user could route between, grouped by map"""
+    return {map_name: [node_id for node_id, node in graph['nodes'].items() if node.get('type') in ('room', 'entrance')]
+            for map_name, graph in maps.items()}
+
+
+def make_workload(kind, maps, count, seed=0):
+    """(start, end) pairs for one query mix
+
+    uniform: any two rooms or entrances on campus
+    popular: a couple of hundred routes asked for with a Zipf-like skew,
+             like the way to lecture halls before the hour (repeats hit caches)
+    cross_building: start and end in different buildings
+    """
+    rng = random.Random(seed)
+    by_map = _routable(maps)
+    everywhere = [node_id for ids in by_map.values() for node_id in ids]
+    if kind == 'uniform':
+        return [tuple(rng.sample(everywhere, 2)) for _ in range(count)]
+    if kind == 'popular':
+        routes = [tuple(rng.sample(everywhere, 2)) for _ in range(min(200, count))]
+        weights = [1 / (rank + 1) for rank in range(len(routes))]
+        return rng.choices(routes, weights, k=count)
+    if kind == 'cross_building':
+        buildings = [map_name for map_name in by_map if map_name != 'campus' and by_map[map_name]]
+        pairs = []
+        for _ in range(count):
+            a, b = rng.sample(buildings, 2)
+            pairs.append((rng.choice(by_map[a]), rng.choice(by_map[b])))
+        return pairs
+    raise ValueError(f"Unknown workload: {kind}")
+
+
+def merged_graph(maps, stair_cost, elevator_cost):
+    """Every map in one flat graph, for plain Dijkstra as a baseline"""
+    from utils.graph import compile_graph
+    from utils.hierarchy import link_floors
+    nodes, edges = {}, {}
+    for map_name, graph in maps.items():
+        if map_name != 'campus':
+            graph = link_floors(graph, stair_cost, elevator_cost)
+        nodes.update(graph['nodes'])
+        for node_id, neighbors in graph['edges'].items():
+            edges.setdefault(node_id, {}).update(neighbors)
+    return compile_graph({'nodes': nodes, 'edges': edges})
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(latencies, wall, found):
+    ordered = sorted(latencies)
+    return {
+        'queries': len(latencies),
+        'found': found,
+        'throughput_qps': len(latencies) / wall if wall else None,
+        'mean_ms': statistics.fmean(ordered) * 1000 if ordered else None,
+        'p50_ms': percentile(ordered, 0.50) * 1000 if ordered else None,
+        'p90_ms': percentile(ordered, 0.90) * 1000 if ordered else None,
+        'p99_ms': percentile(ordered, 0.99) * 1000 if ordered else None,
+        'max_ms': ordered[-1] * 1000 if ordered else None,
+    }
+
+
+def measure(query, pairs, warmup=20):
+    """Run query(start, end) over pairs; truthy results count as found"""
+    for start, end in pairs[:warmup]:
+        query(start, end)
+    latencies, found = [], 0
+    clock = time.perf_counter
+    began = clock()
+    for start, end in pairs:
+        t = clock()
+        if query(start, end):
+            found += 1
+        latencies.append(clock() - t)
+    return summarize(latencies, clock() - began, found)
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load_app(data_folder, options):
+    """The Flask app (routes included) serving graphs from data_folder"""
+    # app.py builds its app at import time from the environment
+    os.environ['DATA_FOLDER'] = str(data_folder)
+    os.environ['GRAPH_RELOAD'] = 'off'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('METRICS_ENABLED', 'false')
+    if options.no_cache:
+        os.environ['ROUTE_CACHE_SIZE'] = '0'
+    if options.all_pairs_max_nodes is not None:
+        os.environ['ALL_PAIRS_MAX_NODES'] = str(options.all_pairs_max_nodes)
+    if options.contraction_min_nodes is not None:
+        os.environ['CONTRACTION_MIN_NODES'] = str(options.contraction_min_nodes)
+    import app as appmod
+    return appmod.app
+
+
+def run(options):
+    maps = synthetic.generate_campus(options.size, seed=options.seed)
+    report = {
+        'commit': _commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'options': {key: value for key, value in vars(options).items() if key != 'output'},
+        'graphs': {map_name: {'nodes': len(graph['nodes']), 'edges': synthetic.edge_count(graph)}
+                   for map_name, graph in maps.items()},
+        'setup': {},
+        'results': []
+    }
+    workloads = {kind: make_workload(kind, maps, options.queries, options.seed) for kind in options.workloads}
+
+    with tempfile.TemporaryDirectory(prefix='campus-bench-') as data_folder:
+        synthetic.write(maps, data_folder)
+        app = _load_app(data_folder, options)
+        pathfinder = app.pathfinder
+        strategy = options.strategy
+
+        if 'dijkstra' in options.targets:
+            began = time.perf_counter()
+            flat = merged_graph(maps, pathfinder.stair_cost, pathfinder.elevator_cost)
+            report['setup']['merged_graph_s'] = time.perf_counter() - began
+        if 'find_path' in options.targets or 'endpoint' in options.targets:
+            began = time.perf_counter()
+            pathfinder.snapshot.router  # every map loaded, entrance table built
+            report['setup']['graph_load_s'] = time.perf_counter() - began
+        client = app.test_client()
+
+        queries = {
+            'dijkstra': lambda start, end: pathfinder.dijkstra(flat, start, end),
+            'find_path': lambda start, end: pathfinder.find_path(start, end, strategy),
+            'endpoint': lambda start, end: client.get(
+                '/api/find_path', query_string={'start': start, 'end': end, 'strategy': strategy or ''}
+            ).status_code == 200,
+        }
+        for target in options.targets:
+            for kind, pairs in workloads.items():
+                pathfinder.route_cache.clear()
+                result = measure(queries[target], pairs, options.warmup)
+                result.update(target=target, workload=kind)
+                report['results'].append(result)
+                print(f"{target:<10} {kind:<15} {result['throughput_qps']:10.1f} q/s  "
+                      f"p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms", file=sys.stderr)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', choices=sorted(synthetic.SIZES), default='small')
+    parser.add_argument('--queries', type=int, default=1000, help='queries per workload')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed queries before each run')
+    parser.add_argument('--targets', type=lambda s: s.split(','), default=list(TARGETS),
+                        help=f"comma-separated, from {', '.join(TARGETS)}")
+    parser.add_argument('--workloads', type=lambda s: s.split(','), default=list(WORKLOADS),
+                        help=f"comma-separated, from {', '.join(WORKLOADS)}")
+    parser.add_argument('--strategy', default=None, help='routing strategy (default: ROUTING_STRATEGY)')
+    parser.add_argument('--no-cache', action='store_true', help='disable the route cache')
+    parser.add_argument('--all-pairs-max-nodes', type=int, default=None,
+                        help='override ALL_PAIRS_MAX_NODES (0 disables distance tables)')
+    parser.add_argument('--contraction-min-nodes', type=int, default=None,
+                        help='override CONTRACTION_MIN_NODES (maps this large get a contraction hierarchy)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<commit>-<size>.json)')
+    options = parser.parse_args(argv)
+    for name, allowed in (('targets', TARGETS), ('workloads', WORKLOADS)):
+        unknown = set(getattr(options, name)) - set(allowed)
+        if unknown:
+            parser.error(f"unknown {name}: {', '.join(sorted(unknown))}")
+
+    report = run(options)
+    output = Path(options.output) if options.output else \
+        RESULTS_FOLDER / f"{report['commit'] or 'unknown'}-{options.size}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Synthetic campus graphs in the {'nodes', 'edges'} schema PathFinder loads
+
+A campus is a jittered grid of footpaths with every building's entrances on
+it. Each building floor is a corridor grid with rooms off the corridors;
+stair and elevator shafts join the floors the way the map editor marks them
+(type + shaft), so PathFinder's floor linking applies as it does to real maps.
+"""
+import json
+import math
+import os
+import random
+
+from utils.pathfinder import BUILDINGS
+
+# floors per building, corridor grid (columns x rows) per floor, rooms per
+# corridor node, campus footpath grid side; edge counts are approximate
+SIZES = {
+    'tiny': dict(floors=2, columns=4, rows=3, rooms=1, campus=6),            # ~600 edges
+    'small': dict(floors=3, columns=8, rows=6, rooms=2, campus=15),          # ~5k edges
+    'medium': dict(floors=5, columns=20, rows=15, rooms=2, campus=40),       # ~50k edges
+    'large': dict(floors=8, columns=50, rows=40, rooms=2, campus=120),       # ~550k edges
+    'huge': dict(floors=10, columns=80, rows=60, rooms=2, campus=200),       # ~1.7M edges
+}
+
+SPACING = 10.0  # map units between neighbouring corridor/footpath nodes
+
+
+def _link(edges, a, b, weight):
+    edges.setdefault(a, {})[b] = weight
+    edges.setdefault(b, {})[a] = weight
+
+
+def generate_building(name, floors, columns, rows, rooms, entrances=2, rng=None):
+    """One building graph: corridor grid per floor, rooms, shafts, entrances"""
+    rng = rng or random.Random(0)
+    prefix = f'building_{name}'
+    nodes, edges = {}, {}
+    # Stairs at opposite corners, one elevator in the middle
+    shafts = {
+        (0, 0): ('stairs', 'west'),
+        (columns - 1, rows - 1): ('stairs', 'east'),
+        (columns // 2, rows // 2): ('elevator', 'main'),
+    }
+
+    for floor in range(1, floors + 1):
+        def corridor(c, r):
+            return f'{prefix}_f{floor}_c{c}_{r}'
+
+        for c in range(columns):
+            for r in range(rows):
+                node_id = corridor(c, r)
+                node = {'x': c * SPACING, 'y': r * SPACING, 'floor': floor, 'type': 'corridor',
+                        'name': f'{name} {floor}.{c}-{r}'}
+                if (c, r) in shafts:
+                    kind, shaft = shafts[(c, r)]
+                    node.update(type=kind, shaft=shaft, name=f'{name} {shaft} {kind}')
+                nodes[node_id] = node
+                # Corridors are not all the same length to walk
+                if c:
+                    _link(edges, corridor(c - 1, r), node_id, SPACING * rng.uniform(1.0, 1.3))
+                if r:
+                    _link(edges, corridor(c, r - 1), node_id, SPACING * rng.uniform(1.0, 1.3))
+
+                for k in range(rooms):
+                    room_id = f'{prefix}_f{floor}_r{c}_{r}_{k}'
+                    angle = rng.uniform(0, 2 * math.pi)
+                    nodes[room_id] = {'x': c * SPACING + 3 * math.cos(angle), 'y': r * SPACING + 3 * math.sin(angle),
+                                      'floor': floor, 'type': 'room', 'name': f'{name}{floor}{c:02d}{r:02d}{k}'}
+                    _link(edges, node_id, room_id, 3.0)
+
+    # Ground-floor entrances along the front of the building; the same ids
+    # appear in the campus graph, which is how the router finds portals
+    entrance_ids = []
+    for k in range(entrances):
+        c = round(k * (columns - 1) / max(entrances - 1, 1))
+        entrance_id = f'{prefix}_entrance_{k}'
+        nodes[entrance_id] = {'x': c * SPACING, 'y': -SPACING / 2, 'floor': 1, 'type': 'entrance',
+                              'name': f'{name} entrance {k + 1}'}
+        _link(edges, entrance_id, f'{prefix}_f1_c{c}_0', SPACING / 2)
+        entrance_ids.append(entrance_id)
+
+    return {'nodes': nodes, 'edges': edges}, entrance_ids
+
+
+def generate_campus(size='small', buildings=BUILDINGS, seed=0, **overrides):
+    """{map name: graph} for the campus and every building
+
+    `size` names a preset from SIZES; keyword arguments override its fields.
+    The same seed always gives the same graphs.
+    """
+    params = dict(SIZES[size], **overrides)
+    rng = random.Random(seed)
+    side = params['campus']
+    maps = {}
+
+    nodes, edges = {}, {}
+
+    def footpath(c, r):
+        return f'campus_p{c}_{r}'
+
+    for c in range(side):
+        for r in range(side):
+            node_id = footpath(c, r)
+            nodes[node_id] = {'x': c * SPACING + rng.uniform(-2, 2), 'y': r * SPACING + rng.uniform(-2, 2),
+                              'type': 'path', 'name': f'Path {c}-{r}'}
+    for c in range(side):
+        for r in range(side):
+            # A few footpaths are missing, so routes are not plain grid walks
+            for dc, dr in ((1, 0), (0, 1)):
+                if c + dc < side and r + dr < side and rng.random() > 0.1:
+                    a, b = footpath(c, r), footpath(c + dc, r + dr)
+                    length = math.hypot(nodes[a]['x'] - nodes[b]['x'], nodes[a]['y'] - nodes[b]['y'])
+                    _link(edges, a, b, length)
+
+    for name in buildings:
+        building, entrance_ids = generate_building(
+            name, params['floors'], params['columns'], params['rows'], params['rooms'], rng=rng)
+        maps[f'building_{name}'] = building
+        # Place the building somewhere on campus and join its entrances to
+        # the nearest footpath nodes
+        c0, r0 = rng.randrange(side), rng.randrange(side)
+        for k, entrance_id in enumerate(entrance_ids):
+            c, r = min(side - 1, c0 + k), r0
+            x, y = nodes[footpath(c, r)]['x'] + 2, nodes[footpath(c, r)]['y'] + 2
+            nodes[entrance_id] = {'x': x, 'y': y, 'type': 'entrance', 'name': building['nodes'][entrance_id]['name']}
+            _link(edges, entrance_id, footpath(c, r), 2 * math.sqrt(2))
+
+    maps['campus'] = {'nodes': nodes, 'edges': edges}
+    return maps
+
+
+def edge_count(graph):
+    return sum(len(neighbors) for neighbors in graph['edges'].values())
+
+
+def write(maps, folder):
+    """Write maps as <name>_nodes.json files, the layout PathFinder reads"""
+    os.makedirs(folder, exist_ok=True)
+    for map_name, graph in maps.items():
+        with open(os.path.join(folder, f'{map_name}_nodes.json'), 'w') as f:
+            json.dump(graph, f)
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -7,7 +8,122 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///data/site.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    DATA_FOLDER = os.path.join(os.path.dirname(__file__), 'data')
+    # PostgreSQL (requirements-prod.txt): keep a pool of connections per
+    # worker and drop ones the server closed while they sat idle
+    if SQLALCHEMY_DATABASE_URI.startswith('postgresql'):
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+            'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': True
+        }
+    DATA_FOLDER = os.getenv('DATA_FOLDER', os.path.join(os.path.dirname(__file__), 'data'))
+
+    # Optimized floor-plan SVGs (built by `flask build-maps` or on first request)
+    MAP_BUILD_FOLDER = os.path.join(os.path.dirname(__file__), 'build', 'maps')
+    MAP_PRECISION = int(os.getenv('MAP_PRECISION', 1))
+    MAP_CACHE_MAX_AGE = int(os.getenv('MAP_CACHE_MAX_AGE', 30 * 24 * 3600))
+    MAP_TILE_LEVELS = int(os.getenv('MAP_TILE_LEVELS', 3))  # zoom levels below the whole-floor tile
+
+    # Minified CSS/JS bundles with content hashes in their names (built by
+    # `flask build-assets` or on first request), so they can be cached forever
+    ASSET_BUILD_FOLDER = os.path.join(os.path.dirname(__file__), 'build', 'assets')
+    ASSET_CACHE_MAX_AGE = int(os.getenv('ASSET_CACHE_MAX_AGE', 365 * 24 * 3600))
+    # Rendered page fragments kept per worker, until the graph or assets
+    # change or the TTL passes (0 = off; always off in debug)
+    FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', 64))
+    FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', 3600))
+
+    # Routing: 'auto', 'dijkstra', 'astar', 'bidirectional', 'bidirectional_astar' or 'ch'
+    ROUTING_STRATEGY = os.getenv('ROUTING_STRATEGY', 'auto')
+    # Cost of changing one floor, in map distance units
+    STAIRS_FLOOR_COST = float(os.getenv('STAIRS_FLOOR_COST', 15))
+    ELEVATOR_FLOOR_COST = float(os.getenv('ELEVATOR_FLOOR_COST', 25))
+    # Routing profiles (?profile=...): node type -> weight multiplier for
+    # edges along or onto nodes of that type, null closes them. Profiles in
+    # ROUTING_PROFILES (JSON) are added to, or replace, these
+    ROUTING_PROFILES = dict({
+        'no_stairs': {'stairs': None, 'staircase': None},
+        'elevator_only': {'stairs': None, 'staircase': None, 'escalator': None}
+    }, **json.loads(os.getenv('ROUTING_PROFILES', '{}')))
+
+    # Graphs up to this many nodes get a precomputed all-pairs table (0 = off).
+    # Building one costs O(n^2) memory and n searches: about 0.2 s and 1 MB
+    # at 300 nodes, 1.4 s and 6 MB at 700
+    ALL_PAIRS_MAX_NODES = int(os.getenv('ALL_PAIRS_MAX_NODES', 300))
+    # Larger graphs with at least this many nodes get a contraction
+    # hierarchy, built when the map changes (0 = off)
+    CONTRACTION_MIN_NODES = int(os.getenv('CONTRACTION_MIN_NODES', 0))
+
+    # Matrix routing: chunks of source rows run in parallel on the route
+    # executor's pool (0 = in-process; processes only with ROUTE_EXECUTOR
+    # 'process') and size cap
+    ROUTE_MATRIX_PROCESSES = int(os.getenv('ROUTE_MATRIX_PROCESSES', 0))
+    ROUTE_MATRIX_MAX_CELLS = int(os.getenv('ROUTE_MATRIX_MAX_CELLS', 250000))
+
+    # Route searches run off the request thread: 'thread' (one pool per
+    # worker), 'off' (inline, fastest under the GIL but without the limits
+    # below) or 'process' (opt-in: a pool forked once that shares the
+    # graphs; only where forking the server's worker is safe). Beyond
+    # ROUTE_QUEUE_LIMIT distinct queued searches requests get 503; waits
+    # past ROUTE_TIMEOUT get 504.
+    ROUTE_EXECUTOR = os.getenv('ROUTE_EXECUTOR', 'thread')
+    ROUTE_EXECUTOR_WORKERS = int(os.getenv('ROUTE_EXECUTOR_WORKERS', 2))
+    ROUTE_QUEUE_LIMIT = int(os.getenv('ROUTE_QUEUE_LIMIT', 32))
+    ROUTE_TIMEOUT = float(os.getenv('ROUTE_TIMEOUT', 5))
+
+    # Route cache: 'local' (per worker LRU) or 'memcached' (shared)
+    ROUTE_CACHE_BACKEND = os.getenv('ROUTE_CACHE_BACKEND', 'local')
+    ROUTE_CACHE_SIZE = int(os.getenv('ROUTE_CACHE_SIZE', 1024))
+    ROUTE_CACHE_TTL = int(os.getenv('ROUTE_CACHE_TTL', 300))
+    MEMCACHED_SERVERS = os.getenv('MEMCACHED_SERVERS', '127.0.0.1:11211')
+
+    # Logged-in users are cached per worker for this many seconds; changes
+    # made by this worker evict immediately, others within the TTL. Admin
+    # views always re-read the role, so a revoked admin is locked out at once
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 4096))
+    # Also keep the user's role in the signed session cookie and trust it
+    # for this many seconds, across workers (0 = off)
+    USER_SESSION_ROLE_TTL = int(os.getenv('USER_SESSION_ROLE_TTL', 0))
+
+    # Feedback is written behind the request: queued in memory, inserted in
+    # batches by a background thread, spilled to files in this folder while
+    # the queue is full or the database is failing
+    WRITE_BEHIND_FOLDER = os.getenv('WRITE_BEHIND_FOLDER', os.path.join(os.path.dirname(__file__), 'instance', 'spill'))
+    WRITE_BEHIND_QUEUE_SIZE = int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', 1000))
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 100))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', 1))
+    WRITE_BEHIND_RETRY_AFTER = float(os.getenv('WRITE_BEHIND_RETRY_AFTER', 5))
+    FEEDBACK_PAGE_SIZE = int(os.getenv('FEEDBACK_PAGE_SIZE', 50))
+
+    # 'lazy' loads each map's graph on first use; 'eager' loads all at startup
+    GRAPH_LOADING = os.getenv('GRAPH_LOADING', 'lazy')
+
+    # Request/search metrics served on /metrics in Prometheus text format
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    # Sample stacks of requests slower than this (0 = off), printed and
+    # written to the folder if one is set
+    SLOW_REQUEST_PROFILE_MS = float(os.getenv('SLOW_REQUEST_PROFILE_MS', 0))
+    SLOW_REQUEST_PROFILE_FOLDER = os.getenv('SLOW_REQUEST_PROFILE_FOLDER')
+
+    # Logging: records go through a bounded queue to a writer thread
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_DEBUG = os.getenv('LOG_DEBUG', '').lower() in ('1', 'true', 'yes')  # per-request debug detail
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' or 'text'
+    LOG_FILE = os.getenv('LOG_FILE')  # default: stderr
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))  # per message per minute
+
+    # Log how long each startup phase took
+    STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+    # Graph hot reload: 'request' (checked at request start), 'timer' or 'off'
+    GRAPH_RELOAD = os.getenv('GRAPH_RELOAD', 'request')
+    GRAPH_RELOAD_INTERVAL = float(os.getenv('GRAPH_RELOAD_INTERVAL', 2))
+    # Map editor deltas kept in the journal before it is folded into the JSON
+    JOURNAL_COMPACT_AFTER = int(os.getenv('JOURNAL_COMPACT_AFTER', 200))
     
     # Email configuration
     MAIL_SERVER = os.getenv('MAIL_SERVER')
@@ -27,4 +143,5 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
     WTF_CSRF_ENABLED = False
\ No newline at end of file
@@ -17,11 +17,14 @@ source venv/bin/activate
 # Install dependencies
 pip install -r requirements-prod.txt
 
-# Apply database migrations
+# Apply database migrations (creates the tables on an empty database)
 flask db upgrade
 
-# Collect static files (if needed)
-# python manage.py collectstatic --noinput
+# Optimize and pre-compress floor-plan SVGs
+flask build-maps
+
+# Bundle, minify and pre-compress CSS and JavaScript
+flask build-assets
 
 # Restart services
 sudo systemctl restart campus-navigator.service
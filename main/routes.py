@@ -1,7 +1,16 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for
+import re
+from datetime import datetime
+
+from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, abort, send_file, jsonify
 from flask_login import login_required, current_user  # Import current_user
-from models import db, Feedback
 from utils.pathfinder import PathFinder
+from utils.svg_tiler import tiles_for_viewport
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+MAP_FILE_NAME = re.compile(r'^[A-Za-z0-9_]+$')
+FEEDBACK_MAX_LENGTH = 5000
 
 main_bp = Blueprint('main', __name__)
 
@@ -12,31 +21,42 @@ def start():
 @main_bp.route('/home')
 @login_required
 def home():
-    print(f"Current user: {current_user}")  # Debugging print
-    print(f"Is authenticated: {current_user.is_authenticated}")  # Debugging print
+    logger.debug("Page view", extra={'user_id': current_user.id, 'path': request.path})
     return render_template('main/home.html')
 
 @main_bp.route('/map')
 @login_required
 def map():
-    print(f"Current user: {current_user}")  # Debugging print
-    print(f"Is authenticated: {current_user.is_authenticated}")  # Debugging print
+    logger.debug("Page view", extra={'user_id': current_user.id, 'path': request.path})
     return render_template('main/map.html')
 
 @main_bp.route('/submit_contact', methods=['POST'])
 def submit_contact():
-    name = request.form.get('name')
-    email = request.form.get('email')
-    message = request.form.get('message')
+    name = (request.form.get('name') or '').strip()
+    email = (request.form.get('email') or '').strip()
+    message = (request.form.get('message') or '').strip()
+
+    if not name or not email or not message:
+        flash('Please fill in your name, email and message.', 'error')
+        return redirect(url_for('main.home') + '#contact')
+    if len(name) > 100 or len(email) > 100 or len(message) > FEEDBACK_MAX_LENGTH:
+        flash('Your name, email or message is too long.', 'error')
+        return redirect(url_for('main.home') + '#contact')
 
+    # Queued, not committed here: a background thread inserts in batches
+    current_app.feedback_queue.submit({
+        'name': name,
+        'email': email,
+        'message': message,
+        'created_at': datetime.utcnow()
+    })
     flash('Thank you for your feedback! We will get back to you soon.', 'success')
     return redirect(url_for('main.home') + '#contact')
 
 @main_bp.route('/waypoint')
 @login_required
 def waypoint():
-    print(f"Current user: {current_user}")  # Debugging print
-    print(f"Is authenticated: {current_user.is_authenticated}")  # Debugging print
+    logger.debug("Page view", extra={'user_id': current_user.id, 'path': request.path})
     campus_nodes = [
         {"id": "main_gate", "name": "Main Gate"},
         {"id": "library", "name": "Library"},
@@ -51,4 +71,106 @@ def waypoint():
 
     return render_template('main/waypoint.html',
                            campus_nodes=campus_nodes,
-                           buildings=buildings)
\ No newline at end of file
+                           buildings=buildings)
+
+@main_bp.route('/maps/<name>.svg')
+def map_svg(name):
+    # Serve the optimized, pre-compressed build of a floor plan
+    if not MAP_FILE_NAME.match(name):
+        abort(404)
+    builder = current_app.map_builder
+    manifest = builder.manifest(name)
+    if manifest is None:
+        abort(404)
+
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in manifest['encodings'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+
+    return _send_map_file(builder.variant_path(name, encoding), f"{manifest['etag']}-{encoding}", encoding)
+
+@main_bp.route('/assets/<filename>')
+def asset(filename):
+    # Hashed CSS/JS bundles: the name changes with the content, so they
+    # never need revalidating
+    builder = current_app.asset_builder
+    bundle = builder.lookup(filename)
+    if bundle is None:
+        abort(404)
+
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in bundle['encodings'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+
+    response = send_file(builder.variant_path(filename, encoding),
+                         mimetype=builder.mimetype(filename),
+                         etag=f"{filename}-{encoding}",
+                         max_age=current_app.config['ASSET_CACHE_MAX_AGE'],
+                         conditional=True)
+    response.headers.pop('Content-Disposition', None)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@main_bp.route('/maps/<name>/tiles')
+def map_tiles(name):
+    # Tiles (at the right level of detail) covering the requested viewport
+    if not MAP_FILE_NAME.match(name):
+        abort(404)
+    tiles = current_app.map_builder.tiles(name)
+    if tiles is None:
+        abort(404)
+
+    view_x, view_y, view_width, view_height = tiles['viewBox']
+    x = request.args.get('x', view_x, type=float)
+    y = request.args.get('y', view_y, type=float)
+    width = request.args.get('w', view_width, type=float)
+    height = request.args.get('h', view_height, type=float)
+    pixels = request.args.get('px', 1024, type=int)
+    if width <= 0 or height <= 0:
+        abort(400)
+
+    zoom, selected = tiles_for_viewport(tiles, x, y, width, height, pixels)
+    return jsonify({
+        'viewBox': tiles['viewBox'],
+        'zoom': zoom,
+        'tiles': [{
+            'x': tile['x'],
+            'y': tile['y'],
+            'bounds': tile['bounds'],
+            'url': url_for('main.map_tile', name=name, zoom=zoom, x=tile['x'], y=tile['y'], v=tiles['etag'])
+        } for tile in selected]
+    })
+
+@main_bp.route('/maps/<name>/tiles/<int:zoom>/<int:x>_<int:y>.svg')
+def map_tile(name, zoom, x, y):
+    if not MAP_FILE_NAME.match(name):
+        abort(404)
+    tiles = current_app.map_builder.tiles(name)
+    if tiles is None:
+        abort(404)
+    encoding = 'gzip' if request.accept_encodings['gzip'] else 'identity'
+    path = current_app.map_builder.tile_path(name, zoom, x, y, encoding)
+    if not path.is_file():
+        abort(404)
+    return _send_map_file(path, f"{tiles['etag']}-{zoom}-{x}-{y}-{encoding}", encoding)
+
+def _send_map_file(path, etag, encoding):
+    response = send_file(path,
+                         mimetype='image/svg+xml',
+                         etag=etag,
+                         max_age=current_app.config['MAP_CACHE_MAX_AGE'],
+                         conditional=True)
+    response.headers.pop('Content-Disposition', None)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    return response
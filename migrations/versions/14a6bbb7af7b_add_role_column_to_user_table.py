@@ -1,7 +1,7 @@
 """Add role column to user table
 
 Revision ID: 14a6bbb7af7b
-Revises: 
+Revises: a3d1c9e07b52
 Create Date: 2025-04-12 18:08:37.232085
 
 """
@@ -11,12 +11,16 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = '14a6bbb7af7b'
-down_revision = None
+down_revision = 'a3d1c9e07b52'
 branch_labels = None
 depends_on = None
 
 
 def upgrade():
+    # Tables made by db.create_all() (before migrations) already have it
+    columns = [column['name'] for column in sa.inspect(op.get_bind()).get_columns('user')]
+    if 'role' in columns:
+        return
     # ### commands auto generated by Alembic - please adjust! ###
     with op.batch_alter_table('user', schema=None) as batch_op:
         batch_op.add_column(sa.Column('role', sa.String(length=20), nullable=True))
@@ -0,0 +1,45 @@
+"""Create user and feedback tables
+
+Revision ID: a3d1c9e07b52
+Revises: 
+Create Date: 2026-10-18 12:20:41.306518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d1c9e07b52'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases from before migrations existed got these tables from
+    # db.create_all() at startup; only create what is missing
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'user' not in existing:
+        op.create_table('user',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('email', sa.String(length=100), nullable=True),
+            sa.Column('password_hash', sa.String(length=128), nullable=True),
+            sa.Column('is_admin', sa.Boolean(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('email')
+        )
+    if 'feedback' not in existing:
+        op.create_table('feedback',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('email', sa.String(length=100), nullable=False),
+            sa.Column('message', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('feedback')
+    op.drop_table('user')
@@ -25,5 +25,8 @@ class Feedback(db.Model):
     message = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Newest-first admin listing pages through this index
+    __table_args__ = (db.Index('ix_feedback_created_at_id', 'created_at', 'id'),)
+
     def __repr__(self):
         return f'<Feedback {self.email}>'
\ No newline at end of file
@@ -68,27 +68,56 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     function loadBuildingMap(building, floor) {
-        // In a real app, this would fetch the SVG via AJAX
-        const mapUrl = `/maps/building_${building}_floor${floor}.svg`;
-        
-        fetch(mapUrl)
-            .then(response => response.text())
+        // Floor plans are tiled; only tiles in view are fetched, at a
+        // level of detail matching the on-screen size
+        const name = `building_${building}_floor${floor}`;
+        const svgElement = document.createElementNS('http://www.w3.org/2000/svg', 'svg');
+        svgElement.style.width = '100%';
+        svgElement.style.height = '100%';
+        buildingMaps.innerHTML = '';
+        buildingMaps.appendChild(svgElement);
+
+        const tiles = new MapTiles(svgElement, `/maps/${name}/tiles`);
+        tiles.load().then(() => {
+            if (!svgElement.getAttribute('viewBox')) {
+                buildingMaps.innerHTML = `<div class="error">Error loading map. Please try again.</div>`;
+            }
+        });
+
+        // Wheel zoom around the pointer, loading finer tiles as needed
+        svgElement.addEventListener('wheel', function(e) {
+            if (!tiles.viewBox) return;
+            e.preventDefault();
+            const [x, y, w, h] = svgElement.getAttribute('viewBox').split(' ').map(Number);
+            const factor = e.deltaY < 0 ? 0.8 : 1.25;
+            const rect = svgElement.getBoundingClientRect();
+            const px = x + w * (e.clientX - rect.left) / rect.width;
+            const py = y + h * (e.clientY - rect.top) / rect.height;
+            const width = Math.min(w * factor, tiles.viewBox[2]);
+            const height = Math.min(h * factor, tiles.viewBox[3]);
+            const newX = px - (px - x) * width / w;
+            const newY = py - (py - y) * height / h;
+            svgElement.setAttribute('viewBox', `${newX} ${newY} ${width} ${height}`);
+            tiles.refresh();
+        }, {passive: false});
+    }
+    
+    function loadCampusMap() {
+        fetch(campusMap.dataset.mapSrc)
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.text();
+            })
             .then(svg => {
-                buildingMaps.innerHTML = svg;
-                
-                // Add interactivity to the SVG if needed
-                const svgElement = buildingMaps.querySelector('svg');
-                if (svgElement) {
-                    svgElement.style.width = '100%';
-                    svgElement.style.height = '100%';
-                }
+                campusMap.innerHTML = svg;
             })
             .catch(error => {
-                console.error('Error loading map:', error);
-                buildingMaps.innerHTML = `<div class="error">Error loading map. Please try again.</div>`;
+                console.error('Error loading campus map:', error);
+                campusMap.innerHTML = `<div class="error">Error loading map. Please try again.</div>`;
             });
     }
     
     // Initialize with campus view
+    loadCampusMap();
     campusViewBtn.click();
 });
\ No newline at end of file
@@ -0,0 +1,114 @@
+// Loads a floor plan as tiles, fetching only what the current viewport needs
+// at a level of detail that matches the on-screen size.
+class MapTiles {
+    constructor(svgElement, tilesUrl) {
+        this.svgElement = svgElement;
+        this.tilesUrl = tilesUrl;
+        this.viewBox = null; // Full extent of the map
+        this.layers = {}; // One <g> per zoom level, kept once loaded
+        this.loaded = new Set();
+        this.defIds = new Set();
+        this.timer = null;
+
+        // Tiles sit underneath anything else drawn on the map
+        this.root = document.createElementNS('http://www.w3.org/2000/svg', 'g');
+        this.root.setAttribute('class', 'map-tiles');
+        this.svgElement.insertBefore(this.root, this.svgElement.firstChild);
+        this.defs = document.createElementNS('http://www.w3.org/2000/svg', 'defs');
+        this.root.appendChild(this.defs);
+    }
+
+    load() {
+        const params = new URLSearchParams({px: this.svgElement.clientWidth || 1024});
+        const current = this.svgElement.getAttribute('viewBox');
+        if (current) {
+            const [x, y, w, h] = current.split(/[\s,]+/).map(Number);
+            Object.entries({x, y, w, h}).forEach(([key, value]) => params.set(key, value));
+        }
+
+        return fetch(`${this.tilesUrl}?${params}`)
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .then(result => {
+                this.viewBox = result.viewBox;
+                if (!current) {
+                    this.svgElement.setAttribute('viewBox', result.viewBox.join(' '));
+                }
+                this.showLevel(result.zoom);
+                return Promise.all(result.tiles.map(tile => this.loadTile(result.zoom, tile.url)));
+            })
+            .catch(error => console.error('Error loading map tiles:', error));
+    }
+
+    // Call after panning or zooming; requests are debounced
+    refresh() {
+        clearTimeout(this.timer);
+        this.timer = setTimeout(() => this.load(), 150);
+    }
+
+    showLevel(zoom) {
+        if (!this.layers[zoom]) {
+            this.layers[zoom] = document.createElementNS('http://www.w3.org/2000/svg', 'g');
+            this.root.appendChild(this.layers[zoom]);
+        }
+        Object.entries(this.layers).forEach(([level, layer]) => {
+            layer.style.display = Number(level) === zoom ? '' : 'none';
+        });
+    }
+
+    loadTile(zoom, url) {
+        if (this.loaded.has(url)) return Promise.resolve();
+        this.loaded.add(url);
+        return fetch(url)
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.text();
+            })
+            .then(text => {
+                const tile = new DOMParser().parseFromString(text, 'image/svg+xml').documentElement;
+                Array.from(tile.children).filter(child => child.localName === 'defs').forEach(defs => {
+                    Array.from(defs.children).forEach(def => {
+                        if (this.defIds.has(def.id)) return;
+                        this.defIds.add(def.id);
+                        this.defs.appendChild(document.importNode(def, true));
+                    });
+                });
+                // Tiles finish loading in any order, so each element is placed
+                // by its index in the source document to keep its paint order
+                tile.querySelectorAll('[data-order]').forEach(leaf => this.place(zoom, tile, leaf));
+            })
+            .catch(error => {
+                this.loaded.delete(url);
+                console.error('Error loading map tile:', error);
+            });
+    }
+
+    // Insert one element, wrapped in shallow copies of its groups (for their
+    // transforms and styles), before the first element that comes later
+    place(zoom, tile, leaf) {
+        const order = Number(leaf.getAttribute('data-order'));
+        let node = document.importNode(leaf, true);
+        for (let parent = leaf.parentNode; parent !== tile; parent = parent.parentNode) {
+            const wrapper = document.importNode(parent, false);
+            wrapper.appendChild(node);
+            node = wrapper;
+        }
+        node.setAttribute('data-order', order);
+
+        const layer = this.layers[zoom];
+        const placed = layer.children;
+        let low = 0;
+        let high = placed.length;
+        while (low < high) {
+            const middle = (low + high) >> 1;
+            if (Number(placed[middle].getAttribute('data-order')) < order) {
+                low = middle + 1;
+            } else {
+                high = middle;
+            }
+        }
+        layer.insertBefore(node, placed[low] || null);
+    }
+}
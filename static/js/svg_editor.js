@@ -2,6 +2,7 @@ class SVGEditor {
     constructor(containerId, initialData) {
         this.container = document.getElementById(containerId);
         this.svgElement = this.container.querySelector('svg');
+        this.tiles = null; // Tiled floor plan, when the page provides one
         this.mode = 'add-node'; // 'add-node', 'add-edge', 'delete'
         this.selectedNode = null;
         this.tempEdge = null;
@@ -9,11 +10,18 @@ class SVGEditor {
         this.edgeData = initialData.edges || {};
         this.nodeElements = {};
         this.edgeElements = {};
+        this.pendingOps = []; // Deltas not yet saved on the server
+        this.sendingOps = 0; // How many of them a save in flight is sending
         
         this.init();
     }
     
     init() {
+        // Floor plan background is fetched tile by tile for the viewport
+        if (this.svgElement.dataset.mapTiles) {
+            this.tiles = new MapTiles(this.svgElement, this.svgElement.dataset.mapTiles);
+        }
+        
         // Set SVG viewBox if not set
         if (!this.svgElement.hasAttribute('viewBox') && 
             this.svgElement.hasAttribute('width') && 
@@ -22,6 +30,10 @@ class SVGEditor {
             const height = this.svgElement.getAttribute('height');
             this.svgElement.setAttribute('viewBox', `0 0 ${width} ${height}`);
         }
+        // Tiles are fetched once the viewBox is known, so only those in view load
+        if (this.tiles) {
+            this.tiles.load();
+        }
         
         // Add editor controls
         this.setupControls();
@@ -121,6 +133,7 @@ class SVGEditor {
             x: Math.round(x),
             y: Math.round(y)
         };
+        this.recordOp({op: 'add_node', id: nodeId, node: this.nodeData[nodeId]});
         
         this.createNodeElement(nodeId);
         this.selectNode(nodeId);
@@ -204,6 +217,7 @@ class SVGEditor {
         const node = this.nodeData[this.selectedNode];
         node.name = document.getElementById('node-name').value;
         node.type = document.getElementById('node-type').value;
+        this.recordOp({op: 'update_node', id: this.selectedNode, node: {name: node.name, type: node.type}});
         
         // Update visual
         const group = this.nodeElements[this.selectedNode];
@@ -216,6 +230,7 @@ class SVGEditor {
         
         // Remove from data
         delete this.nodeData[this.selectedNode];
+        this.recordOp({op: 'delete_node', id: this.selectedNode});
         
         // Remove any edges connected to this node
         Object.keys(this.edgeData).forEach(sourceId => {
@@ -267,6 +282,7 @@ class SVGEditor {
         // Add if not already connected
         if (!this.edgeData[sourceId].includes(targetId)) {
             this.edgeData[sourceId].push(targetId);
+            this.recordOp({op: 'add_edge', from: sourceId, to: targetId});
             this.updateEdgeVisuals();
         }
     }
@@ -324,6 +340,7 @@ class SVGEditor {
             // Remove edge from data
             if (this.edgeData[sourceId]) {
                 this.edgeData[sourceId] = this.edgeData[sourceId].filter(id => id !== targetId);
+                this.recordOp({op: 'delete_edge', from: sourceId, to: targetId});
             }
             
             // Remove visual
@@ -336,6 +353,7 @@ class SVGEditor {
         const node = this.nodeData[nodeId];
         node.x = Math.round(x);
         node.y = Math.round(y);
+        this.recordOp({op: 'move_node', id: nodeId, x: node.x, y: node.y});
         
         // Update visual
         const group = this.nodeElements[nodeId];
@@ -353,9 +371,15 @@ class SVGEditor {
         const newY = viewBox[1] + (viewBox[3] - newHeight) / 2;
         
         this.svgElement.setAttribute('viewBox', `${newX} ${newY} ${newWidth} ${newHeight}`);
+        if (this.tiles) this.tiles.refresh();
     }
     
     fitView() {
+        if (this.tiles && this.tiles.viewBox) {
+            this.svgElement.setAttribute('viewBox', this.tiles.viewBox.join(' '));
+            this.tiles.refresh();
+            return;
+        }
         // Simple implementation - reset to original viewBox
         const width = this.svgElement.getAttribute('width');
         const height = this.svgElement.getAttribute('height');
@@ -372,35 +396,76 @@ class SVGEditor {
         this.updateEdgeVisuals();
     }
     
+    recordOp(op) {
+        // Collapse repeated moves of the same node (dragging fires many),
+        // but never into an op a save in flight has already sent
+        const last = this.pendingOps.length > this.sendingOps ? this.pendingOps[this.pendingOps.length - 1] : null;
+        if (op.op === 'move_node' && last && last.op === 'move_node' && last.id === op.id) {
+            this.pendingOps[this.pendingOps.length - 1] = op;
+        } else {
+            this.pendingOps.push(op);
+        }
+    }
+    
     saveMap() {
-        // In a real app, this would send data to the server
-        console.log('Saving map data:', {
-            nodes: this.nodeData,
-            edges: this.edgeData
-        });
+        // Send only the edits made since the last save; edits made while
+        // this one is in flight stay pending for the next
+        if (this.sendingOps > 0) {
+            alert('A save is already in progress.');
+            return;
+        }
+        const ops = this.pendingOps.slice();
+        if (ops.length === 0) {
+            alert('No changes to save.');
+            return;
+        }
+        this.sendingOps = ops.length;
         
-        // Simulate API call
-        fetch('/api/save_map', {
+        fetch('/admin/api/patch_map', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                map: mapData.name,
-                nodes: this.nodeData,
-                edges: this.edgeData
+                map: mapData.id,
+                ops: ops
             })
         })
-        .then(response => response.json())
+        .then(response => {
+            if (!response.ok) throw new Error(`Save failed with status ${response.status}`);
+            return response.json();
+        })
         .then(data => {
-            alert('Map saved successfully!');
+            this.pendingOps = this.pendingOps.slice(ops.length);
+            this.sendingOps = 0;
+            return fetch(`/admin/api/connectivity?map=${encodeURIComponent(mapData.id)}`)
+                .then(response => response.ok ? response.json() : null)
+                .catch(() => null);
+        })
+        .then(report => {
+            alert('Map saved successfully!' + this.connectivityWarning(report));
         })
         .catch(error => {
+            this.sendingOps = 0; // unsaved ops stay pending for a retry
             console.error('Error saving map:', error);
             alert('Error saving map. Please try again.');
         });
     }
     
+    connectivityWarning(report) {
+        // Nodes routes cannot reach, as listed by the server after a save
+        if (!report) return '';
+        const list = (ids, count) => ids.slice(0, 10).join(', ') + (count > 10 ? `, ... (${count} in total)` : '');
+        let warning = '';
+        if (report.disconnected_count > 0) {
+            warning += `\n\nNot connected to the rest of the map: ${list(report.disconnected, report.disconnected_count)}`;
+        }
+        if (report.one_way_count > 0) {
+            warning += `\n\nReachable only one way: ${list(report.one_way, report.one_way_count)}`;
+        }
+        return warning;
+    }
+    
     resetMap() {
         if (confirm('Are you sure you want to reset all changes?')) {
             // Reload the page
@@ -23,6 +23,18 @@ document.addEventListener('DOMContentLoaded', function() {
         findPathBtn.disabled = !hasSelection;
     }
     
+    // Fill the first empty selection with a node, adding it as an option if needed
+    function chooseNode(nodeId, label) {
+        const select = !currentLocationSelect.value ? currentLocationSelect :
+                       !destinationSelect.value ? destinationSelect : null;
+        if (!select) return;
+        if (!Array.from(select.options).some(option => option.value === nodeId)) {
+            [currentLocationSelect, destinationSelect].forEach(s => s.add(new Option(label || nodeId, nodeId)));
+        }
+        select.value = nodeId;
+        updateFindPathButton();
+    }
+    
     // Initialize map interactivity
     function setupMapInteractivity() {
         const svg = waypointMap.querySelector('svg');
@@ -32,17 +44,24 @@ document.addEventListener('DOMContentLoaded', function() {
         clickableElements.forEach(el => {
             el.style.cursor = 'pointer';
             el.addEventListener('click', function() {
-                const nodeId = this.getAttribute('data-node-id');
-                
-                if (!currentLocationSelect.value) {
-                    currentLocationSelect.value = nodeId;
-                } else if (!destinationSelect.value) {
-                    destinationSelect.value = nodeId;
-                }
-                
-                updateFindPathButton();
+                chooseNode(this.getAttribute('data-node-id'));
             });
         });
+        
+        // Anywhere else on the map snaps to the nearest routable node
+        svg.addEventListener('click', function(e) {
+            if (e.target.closest('[data-node-id]')) return;
+            const point = svg.createSVGPoint();
+            point.x = e.clientX;
+            point.y = e.clientY;
+            const mapPoint = point.matrixTransform(svg.getScreenCTM().inverse());
+            fetch(`/api/nearest?map=campus&x=${mapPoint.x}&y=${mapPoint.y}`)
+                .then(response => response.ok ? response.json() : null)
+                .then(hit => {
+                    if (hit) chooseNode(hit.id, hit.node.name);
+                })
+                .catch(error => console.error('Error finding nearest node:', error));
+        });
     }
 
     // Reset button handler
@@ -178,9 +197,23 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // Fetch the campus map, then wire up its clickable nodes
+    function loadWaypointMap() {
+        fetch(waypointMap.dataset.mapSrc)
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.text();
+            })
+            .then(svg => {
+                waypointMap.innerHTML = svg;
+                setupMapInteractivity();
+            })
+            .catch(error => console.error('Error loading campus map:', error));
+    }
+
     // Initialize event listeners and map
     currentLocationSelect.addEventListener('change', updateFindPathButton);
     destinationSelect.addEventListener('change', updateFindPathButton);
-    setupMapInteractivity();
+    loadWaypointMap();
     updateFindPathButton();
 });
\ No newline at end of file
@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TestingConfig  # noqa: E402
+from utils.pathfinder import PathFinder  # noqa: E402
+
+
+# A 3 x 3 campus grid with coordinates, plus a one-way spur (g3 can be
+# reached from c3 but not left) and a node nothing links to
+#
+#   a1 - b1 - c1
+#   |    |    |
+#   a2 - b2 - c2
+#   |    |    |
+#   a3 - b3 - c3 -> g3      island
+CAMPUS = {
+    'nodes': {
+        'a1': {'x': 0, 'y': 0, 'type': 'path', 'name': 'A1'},
+        'b1': {'x': 10, 'y': 0, 'type': 'path', 'name': 'B1'},
+        'c1': {'x': 20, 'y': 0, 'type': 'path', 'name': 'C1'},
+        'a2': {'x': 0, 'y': 10, 'type': 'path', 'name': 'A2'},
+        'b2': {'x': 10, 'y': 10, 'type': 'stairs', 'name': 'B2'},
+        'c2': {'x': 20, 'y': 10, 'type': 'path', 'name': 'C2'},
+        'a3': {'x': 0, 'y': 20, 'type': 'path', 'name': 'A3'},
+        'b3': {'x': 10, 'y': 20, 'type': 'path', 'name': 'B3'},
+        'c3': {'x': 20, 'y': 20, 'type': 'path', 'name': 'C3'},
+        'g3': {'x': 30, 'y': 20, 'type': 'room', 'name': 'Garden'},
+        'island': {'x': 50, 'y': 50, 'type': 'room', 'name': 'Island'},
+    },
+    'edges': {
+        'a1': {'b1': 10, 'a2': 10},
+        'b1': {'a1': 10, 'c1': 10, 'b2': 10},
+        'c1': {'b1': 10, 'c2': 10},
+        'a2': {'a1': 10, 'b2': 10, 'a3': 10},
+        'b2': {'b1': 10, 'a2': 10, 'c2': 10, 'b3': 10},
+        'c2': {'c1': 10, 'b2': 10, 'c3': 10},
+        'a3': {'a2': 10, 'b3': 10},
+        'b3': {'b2': 10, 'a3': 10, 'c3': 10},
+        'c3': {'c2': 10, 'b3': 10, 'g3': 10},
+    }
+}
+
+
+@pytest.fixture
+def campus():
+    return json.loads(json.dumps(CAMPUS))
+
+
+@pytest.fixture
+def data_folder(tmp_path, campus):
+    with open(tmp_path / 'campus_nodes.json', 'w') as f:
+        json.dump(campus, f)
+    return tmp_path
+
+
+@pytest.fixture
+def app(data_folder):
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    app.config.update(DATA_FOLDER=str(data_folder), GRAPH_RELOAD='off', ROUTE_EXECUTOR='off',
+                      ROUTE_CACHE_SIZE=0, WRITE_BEHIND_FOLDER=str(data_folder / 'spill'))
+    return app
+
+
+@pytest.fixture
+def pathfinder(app):
+    with app.app_context():
+        pathfinder = PathFinder(app)
+    yield pathfinder
+    if pathfinder.executor is not None:
+        pathfinder.executor.shutdown()
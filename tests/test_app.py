@@ -0,0 +1,89 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from utils.pathfinder import PathFinder
+
+
+@pytest.fixture
+def client(data_folder, monkeypatch):
+    import app as appmod
+    app = appmod.app
+    monkeypatch.setitem(app.config, 'DATA_FOLDER', str(data_folder))
+    monkeypatch.setitem(app.config, 'ROUTE_EXECUTOR', 'off')
+    monkeypatch.setitem(app.config, 'ROUTE_CACHE_SIZE', 0)
+    with app.app_context():
+        monkeypatch.setattr(app, 'pathfinder', PathFinder(app))
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(client, monkeypatch):
+    import admin.routes
+    import app as appmod
+    import utils.decorators
+    from utils.user_cache import UserCache
+    user = SimpleNamespace(is_authenticated=True, id=1, email='admin@example.com', role='admin', is_admin=True)
+    monkeypatch.setattr(utils.decorators, 'current_user', user)
+    monkeypatch.setattr(admin.routes, 'current_user', user)
+    monkeypatch.setattr(appmod.app, 'user_cache', UserCache(lambda user_id: user))
+    return client
+
+
+def test_route_matrix(client):
+    response = client.post('/api/route_matrix', json={'sources': ['a1', 'g3'], 'targets': ['c3']})
+    assert response.status_code == 200
+    assert response.get_json()['distances'] == [[40], [None]]
+    for body in ({'sources': ['a1', 5]}, {'sources': [['a1']]}, {'sources': ['a1'], 'profile': 3}, {}):
+        assert client.post('/api/route_matrix', json=body).status_code == 400
+
+
+def test_nearest(client):
+    body = client.get('/api/nearest?x=11&y=9').get_json()
+    assert body['id'] == 'b2'
+    for query in ('x=nan&y=1', 'x=inf&y=1', 'x=1', 'bbox=0,0,inf,1', 'x=1&y=1&kind=room'):
+        assert client.get(f'/api/nearest?{query}').status_code == 400
+
+
+def test_find_path(client):
+    response = client.get('/api/find_path?start=a1&end=c3')
+    assert response.status_code == 200
+    assert response.get_json()['distance'] == 40
+    assert client.get('/api/find_path?start=a1&end=c3',
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/api/find_path?start=a1&end=island').status_code == 404
+    assert client.get('/api/find_path?start=a1').status_code == 400
+
+
+def test_find_path_compact(client):
+    body = client.get('/api/find_path?start=a1&end=c3&format=compact&precision=0').get_json()
+    assert body['precision'] == 0 and 'polyline' in body and 'nodes' not in body
+    for precision in (-1, 7, 400):
+        response = client.get(f'/api/find_path?start=a1&end=c3&format=compact&precision={precision}')
+        assert response.status_code == 400
+
+
+def test_save_map_rejects_bad_payloads(admin_client, data_folder):
+    saved = (data_folder / 'campus_nodes.json').read_bytes()
+    for body in ({'map': 'campus', 'nodes': [], 'edges': {}}, {'map': 'campus', 'nodes': {}, 'edges': 'a1'},
+                 {'map': 'campus', 'nodes': {'a1': 5}, 'edges': {}}, ['campus']):
+        assert admin_client.post('/admin/api/save_map', json=body).status_code == 400
+    for form in ({'map_name': 'campus', 'nodes': '[]', 'edges': '{}'},
+                 {'map_name': 'campus', 'nodes': '{}', 'edges': '{"a1": 3}'},
+                 {'map_name': 'campus', 'nodes': '{', 'edges': '{}'}):
+        assert admin_client.post('/admin/save_map_data', data=form).status_code == 400
+    assert (data_folder / 'campus_nodes.json').read_bytes() == saved
+
+
+def test_save_map_reloads_in_background(admin_client, data_folder, monkeypatch):
+    import app as appmod
+    pathfinder = appmod.app.pathfinder
+    monkeypatch.setattr(pathfinder, 'reload', None)  # never on the request thread
+    reloads = []
+    monkeypatch.setattr(pathfinder, 'schedule_reload', lambda: reloads.append(True))
+    campus = json.loads((data_folder / 'campus_nodes.json').read_bytes())
+    del campus['nodes']['island']
+    response = admin_client.post('/admin/api/save_map', json=dict(campus, map='campus'))
+    assert response.status_code == 200 and reloads == [True]
+    assert response.get_json()['connectivity']['disconnected_count'] == 0
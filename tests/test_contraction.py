@@ -0,0 +1,33 @@
+from utils import graph as graphs
+from utils.contraction import ContractionHierarchy
+
+from test_graph import check_route, fixed_graphs
+
+
+def test_hierarchy_agrees_with_dijkstra(campus):
+    for graph in fixed_graphs(campus):
+        hierarchy = ContractionHierarchy.build(graph)
+        for start in graph.ids:
+            for end in graph.ids:
+                expected = graphs.dijkstra(graph, start, end)
+                result = hierarchy.route(graph, start, end)
+                if expected is None:
+                    assert result is None, (start, end)
+                else:
+                    check_route(graph, result, start, end, expected['distance'])
+
+
+def test_auto_strategy_uses_hierarchy(campus):
+    graph = graphs.compile_graph(campus)
+    graph.contraction = ContractionHierarchy.build(graph)
+    assert graphs.search(graph, 'a1', 'c3')['distance'] == 40
+    assert graphs.search(graph, 'a1', 'c3', 'ch')['distance'] == 40
+
+
+def test_saved_hierarchy_is_tied_to_its_key(campus, tmp_path):
+    graph = graphs.compile_graph(campus)
+    path = tmp_path / 'campus.ch'
+    ContractionHierarchy.build(graph).save(path, 'v1')
+    loaded = ContractionHierarchy.load(path, 'v1')
+    assert loaded.route(graph, 'a1', 'g3')['distance'] == 50
+    assert ContractionHierarchy.load(path, 'v2') is None
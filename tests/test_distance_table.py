@@ -0,0 +1,32 @@
+from utils import graph as graphs
+from utils.distance_table import DistanceTable, routing_key
+
+from test_graph import check_route, fixed_graphs
+
+
+def test_table_agrees_with_dijkstra(campus):
+    for graph in fixed_graphs(campus):
+        table = DistanceTable.build(graph)
+        for start in graph.ids:
+            for end in graph.ids:
+                expected = graphs.dijkstra(graph, start, end)
+                result = table.route(graph, start, end)
+                if expected is None:
+                    assert result is None, (start, end)
+                else:
+                    check_route(graph, result, start, end, expected['distance'])
+
+
+def test_search_answers_from_table(campus):
+    graph = graphs.compile_graph(campus)
+    graph.all_pairs = DistanceTable.build(graph)
+    result = graphs.search(graph, 'a1', 'c3')
+    assert result['distance'] == 40 and result['settled'] == 0
+
+
+def test_routing_key_ignores_names(campus):
+    key = routing_key(graphs.compile_graph(campus))
+    campus['nodes']['a1']['name'] = 'Renamed'
+    assert routing_key(graphs.compile_graph(campus)) == key
+    campus['edges']['a1']['b1'] = 11
+    assert routing_key(graphs.compile_graph(campus)) != key
@@ -0,0 +1,71 @@
+import math
+
+import pytest
+
+from benchmarks import synthetic
+from utils import graph as graphs
+
+STRATEGIES = ['dijkstra', 'astar', 'bidirectional', 'bidirectional_astar']
+
+
+def edge_weight(graph, a, b):
+    i, j = graph.index[a], graph.index[b]
+    return min(weight for target, weight in graph.neighbors(i) if target == j)
+
+
+def check_route(graph, result, start, end, distance):
+    """The route runs start -> end, along edges adding up to distance"""
+    assert result['path'][0] == start and result['path'][-1] == end
+    assert result['distance'] == pytest.approx(distance)
+    walked = sum(edge_weight(graph, a, b) for a, b in zip(result['path'], result['path'][1:]))
+    assert walked == pytest.approx(distance)
+
+
+def fixed_graphs(campus):
+    building = synthetic.generate_building('T', 2, 4, 3, 2)[0]
+    return [graphs.compile_graph(campus), graphs.compile_graph(building)]
+
+
+def test_strategies_agree_with_dijkstra(campus):
+    for graph in fixed_graphs(campus):
+        for start in graph.ids:
+            for end in graph.ids:
+                expected = graphs.dijkstra(graph, start, end)
+                for strategy in STRATEGIES:
+                    result = graphs.search(graph, start, end, strategy)
+                    if expected is None:
+                        assert result is None, (strategy, start, end)
+                    else:
+                        check_route(graph, result, start, end, expected['distance'])
+
+
+def test_unknown_strategy(campus):
+    with pytest.raises(ValueError):
+        graphs.search(graphs.compile_graph(campus), 'a1', 'c3', 'teleport')
+
+
+def test_connectivity_labels(campus):
+    graph = graphs.compile_graph(campus)
+    labels = graph.connectivity
+    index = graph.index
+    assert labels.weak[index['a1']] == labels.weak[index['g3']] != labels.weak[index['island']]
+    # g3 is a dead end: reachable from the grid, but no way back
+    assert labels.strong[index['a1']] == labels.strong[index['c3']] != labels.strong[index['g3']]
+    assert labels.may_reach(index['a1'], index['g3'])
+    assert not labels.may_reach(index['g3'], index['a1'])
+    assert not labels.may_reach(index['a1'], index['island'])
+
+    report = labels.report(graph)
+    assert report['components'] == 2
+    assert report['disconnected'] == ['island']
+    assert report['one_way'] == ['g3']
+
+    assert graphs.unreachable(graph, 'g3', 'a1')
+    assert graphs.search(graph, 'g3', 'a1', 'dijkstra') is None
+    assert graphs.search(graph, 'a1', 'g3', 'dijkstra')['distance'] == 50
+
+
+def test_closed_edges_split_components(campus):
+    campus['edges']['c3']['g3'] = math.inf
+    graph = graphs.compile_graph(campus)
+    assert not graph.connectivity.may_reach(graph.index['c3'], graph.index['g3'])
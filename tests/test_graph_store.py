@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from utils.graph_store import GraphStore
+
+
+def test_patch_appends_to_journal(data_folder):
+    store = GraphStore(data_folder)
+    data, version = store.load('campus')
+    store.patch('campus', [{'op': 'add_node', 'id': 'd1', 'node': {'x': 30, 'y': 0, 'type': 'path'}},
+                           {'op': 'add_edge', 'from': 'c1', 'to': 'd1', 'weight': 10}])
+    assert store.journal_path('campus').exists()
+    # The snapshot file is untouched; load() replays the journal onto it
+    assert 'd1' not in json.loads(store.graph_path('campus').read_bytes())['nodes']
+    data, patched = store.load('campus')
+    assert data['nodes']['d1']['x'] == 30
+    assert data['edges']['c1']['d1'] == 10
+    assert patched != version and store.version('campus') == patched
+
+
+def test_patch_validates_before_writing(data_folder):
+    store = GraphStore(data_folder)
+    with pytest.raises(ValueError):
+        store.patch('campus', [{'op': 'delete_edge', 'from': 'a1', 'to': 'b1'}, {'op': 'explode'}])
+    assert not store.journal_path('campus').exists()
+
+
+def test_journal_compacts(data_folder):
+    store = GraphStore(data_folder, compact_after=2)
+    store.patch('campus', [{'op': 'move_node', 'id': 'a1', 'x': 1, 'y': 1}])
+    store.patch('campus', [{'op': 'delete_node', 'id': 'island'}])
+    assert not store.journal_path('campus').exists()
+    data = json.loads(store.graph_path('campus').read_bytes())
+    assert data['nodes']['a1']['x'] == 1 and 'island' not in data['nodes']
+
+
+def test_patch_version_matches_files(data_folder):
+    store = GraphStore(data_folder)
+    _, version = store.patch('campus', [{'op': 'add_edge', 'from': 'a1', 'to': 'b1', 'weight': 15}])
+    assert GraphStore(data_folder).version('campus') == version
+
+
+def test_patch_rejects_bad_ops(data_folder):
+    store = GraphStore(data_folder)
+    for op in [{'op': 'add_edge', 'from': 'a1', 'to': 'b3', 'weight': 'far'},
+               {'op': 'move_node', 'id': 'a1', 'x': float('nan'), 'y': 0},
+               {'op': 'add_node', 'id': '', 'node': {}}]:
+        with pytest.raises(ValueError):
+            store.patch('campus', [op])
+    assert not store.journal_path('campus').exists()
+
+
+def test_picks_up_writes_from_other_processes(data_folder):
+    store = GraphStore(data_folder)
+    store.load('campus')
+    GraphStore(data_folder).patch('campus', [{'op': 'delete_node', 'id': 'island'}])
+    assert 'island' not in store.load('campus')[0]['nodes']
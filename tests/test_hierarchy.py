@@ -0,0 +1,47 @@
+from utils import graph as graphs
+from utils.hierarchy import CampusRouter
+
+
+def wings_router(corridor=None):
+    """Campus with a gate and two entrances of building_W, whose wings
+    are joined only through the campus, or also by a corridor of the
+    given length"""
+    campus = {
+        'nodes': {'gate': {'x': 0, 'y': 0}, 'building_W_e1': {'x': 10, 'y': 0}, 'building_W_e2': {'x': 30, 'y': 0}},
+        'edges': {'gate': {'building_W_e1': 10}, 'building_W_e1': {'gate': 10, 'building_W_e2': 20},
+                  'building_W_e2': {'building_W_e1': 20}}
+    }
+    building = {
+        'nodes': {'building_W_e1': {'x': 10, 'y': 0}, 'building_W_r1': {'x': 10, 'y': 5},
+                  'building_W_e2': {'x': 30, 'y': 0}, 'building_W_r2': {'x': 30, 'y': 5}},
+        'edges': {'building_W_e1': {'building_W_r1': 5}, 'building_W_r1': {'building_W_e1': 5},
+                  'building_W_e2': {'building_W_r2': 5}, 'building_W_r2': {'building_W_e2': 5}}
+    }
+    if corridor is not None:
+        building['edges']['building_W_r1']['building_W_r2'] = corridor
+        building['edges']['building_W_r2']['building_W_r1'] = corridor
+    return CampusRouter({'campus': graphs.compile_graph(campus), 'building_W': graphs.compile_graph(building)})
+
+
+def test_wings_joined_only_through_campus():
+    router = wings_router()
+    result = router.route('building_W_r1', 'building_W_r2')
+    assert result['distance'] == 30
+    assert result['path'] == ['building_W_r1', 'building_W_e1', 'building_W_e2', 'building_W_r2']
+    assert [segment['map'] for segment in result['segments']] == ['building_W', 'campus', 'building_W']
+    assert router.route('gate', 'building_W_r2')['distance'] == 35
+
+    distances, paths = router.matrix(['building_W_r1'], ['building_W_r2', 'gate'], include_paths=True)
+    assert distances == [[30, 15]]
+    assert paths[0][0] == result['path']
+
+
+def test_same_map_route_takes_shorter_detour():
+    router = wings_router(corridor=50)
+    assert router.route('building_W_r1', 'building_W_r2')['distance'] == 30
+    assert router.matrix(['building_W_r1'], ['building_W_r2'])[0] == [[30]]
+
+    router = wings_router(corridor=20)
+    result = router.route('building_W_r1', 'building_W_r2')
+    assert result['distance'] == 20 and result['path'] == ['building_W_r1', 'building_W_r2']
+    assert router.matrix(['building_W_r1'], ['building_W_r2'])[0] == [[20]]
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+
+def test_reload_picks_up_patches(pathfinder):
+    assert pathfinder.find_path('a1', 'c1')['distance'] == 20
+    version = pathfinder.version
+    pathfinder.store.patch('campus', [{'op': 'delete_edge', 'from': 'a1', 'to': 'b1'}])
+    assert pathfinder.find_path('a1', 'c1')['distance'] == 20  # until reloaded
+    pathfinder.reload()
+    assert pathfinder.version != version
+    assert pathfinder.find_path('a1', 'c1')['path'] == ['a1', 'a2', 'b2', 'b1', 'c1']
+
+
+
+def test_patch_map_compiles_from_memory(pathfinder, monkeypatch):
+    assert pathfinder.find_path('a1', 'c1')['distance'] == 20
+    monkeypatch.setattr(pathfinder, 'schedule_reload', pathfinder.reload)
+
+    def read_from_disk(*args):
+        raise AssertionError('patched map was read back from disk')
+    monkeypatch.setattr(pathfinder, '_load_compiled', read_from_disk)
+
+    pathfinder.patch_map('campus', [{'op': 'delete_edge', 'from': 'a1', 'to': 'b1'}])
+    assert pathfinder.find_path('a1', 'c1')['path'] == ['a1', 'a2', 'b2', 'b1', 'c1']
+    assert pathfinder.snapshot.versions['campus'] == pathfinder.store.version('campus')
+    with pytest.raises(ValueError):
+        pathfinder.patch_map('nowhere', [])
+
+
+def test_close_and_reopen_edge(pathfinder, data_folder):
+    pathfinder.set_edge_rule('campus', 'a1', 'b1', None, both_ways=True)
+    assert pathfinder.find_path('a1', 'c1')['distance'] == 40
+    assert pathfinder.find_path('b1', 'a1')['distance'] == 30
+    assert len(json.loads((data_folder / 'overlay.json').read_text())['edges']) == 2
+
+    pathfinder.set_edge_rule('campus', 'a1', 'b1', 1, both_ways=True)
+    assert pathfinder.find_path('a1', 'c1')['path'] == ['a1', 'b1', 'c1']
+    assert json.loads((data_folder / 'overlay.json').read_text()) == {'edges': [], 'nodes': []}
+    assert pathfinder.snapshot.overlay.fingerprint() == ''
+
+
+def test_close_and_reopen_node(pathfinder):
+    version = pathfinder.version
+    pathfinder.set_node_rule('campus', 'c3', None)
+    assert pathfinder.find_path('a1', 'g3') is None
+    assert pathfinder.find_path('a3', 'c2')['distance'] == 30  # around c3 through b2
+
+    pathfinder.set_node_rule('campus', 'c3', 1)
+    assert pathfinder.find_path('a1', 'g3')['distance'] == 50
+    assert pathfinder.version == version
+
+
+def test_reweight_node(pathfinder):
+    pathfinder.set_node_rule('campus', 'b2', 3)
+    result = pathfinder.find_path('a2', 'c2')
+    assert result['distance'] == 40 and 'b2' not in result['path']
+
+
+def test_rule_on_unknown_node(pathfinder):
+    with pytest.raises(ValueError):
+        pathfinder.set_node_rule('campus', 'nowhere', None)
+    with pytest.raises(ValueError):
+        pathfinder.set_edge_rule('campus', 'a1', 'c3', None)
+
+
+def test_route_version_loads_only_touched_maps(pathfinder):
+    version = pathfinder.route_version('a1', 'c1')
+    assert version == pathfinder.store.version('campus')
+    assert set(pathfinder.snapshot._maps) == {'campus'} and not pathfinder.snapshot._routers
+
+
+def test_route_version_follows_detours(pathfinder, data_folder):
+    # building_A has two entrances, so trips inside it may cut across campus
+    pathfinder.store.patch('campus', [
+        {'op': 'add_node', 'id': 'building_A_e1', 'node': {'x': 0, 'y': -10}},
+        {'op': 'add_node', 'id': 'building_A_e2', 'node': {'x': 20, 'y': -10}},
+        {'op': 'add_edge', 'from': 'building_A_e1', 'to': 'a1', 'weight': 10},
+        {'op': 'add_edge', 'from': 'c1', 'to': 'building_A_e2', 'weight': 10}])
+    pathfinder.store.save('building_A', {
+        'nodes': {'building_A_e1': {'x': 0, 'y': -10}, 'building_A_e2': {'x': 20, 'y': -10}},
+        'edges': {'building_A_e1': {'building_A_e2': 100}}})
+    pathfinder.reload()
+    version = pathfinder.route_version('building_A_e1', 'building_A_e2')
+    assert pathfinder.find_path('building_A_e1', 'building_A_e2')['distance'] == 40
+
+    pathfinder.store.patch('campus', [{'op': 'delete_edge', 'from': 'a1', 'to': 'b1'}])
+    pathfinder.reload()
+    assert pathfinder.route_version('building_A_e1', 'building_A_e2') != version
+    assert pathfinder.find_path('building_A_e1', 'building_A_e2')['distance'] == 60
+
+
+@pytest.mark.parametrize('kind', ['thread', 'process'])
+def test_matrix_chunks_share_one_pool(pathfinder, kind):
+    from utils.route_executor import RouteExecutor
+    sources = ['a1', 'b2', 'c3', 'g3', 'island']
+    expected = pathfinder.find_paths(sources, include_paths=True)
+    pathfinder.executor = RouteExecutor(kind, workers=2, refresh=pathfinder._build_snapshot)
+    result = pathfinder.find_paths(sources, include_paths=True, processes=2)
+    pool = pathfinder.executor._pool
+    assert result == expected
+    assert pathfinder.find_paths(sources, processes=3)['distances'] == expected['distances']
+    assert pathfinder.executor._pool is pool
+    with pytest.raises(ValueError):
+        pathfinder.find_paths(sources, processes=2, profile='hovercraft')
@@ -0,0 +1,41 @@
+import random
+
+import pytest
+
+from utils import graph as graphs
+from utils import route_encoding
+
+
+def test_polyline_round_trip():
+    rng = random.Random(1)
+    points = [(rng.uniform(-500, 500), rng.uniform(-500, 500)) for _ in range(50)]
+    for precision in range(route_encoding.MAX_PRECISION + 1):
+        decoded = route_encoding.decode_polyline(route_encoding.encode_polyline(points, precision), precision)
+        assert len(decoded) == len(points)
+        for (x, y), (dx, dy) in zip(points, decoded):
+            assert abs(x - dx) <= 0.5 / 10 ** precision + 1e-9
+            assert abs(y - dy) <= 0.5 / 10 ** precision + 1e-9
+
+
+def test_delta_round_trip():
+    points = [(1.25, -3.5), (10.0, 0.04), (-7.75, 12.5)]
+    deltas = route_encoding.delta_encode(points, 2)
+    x = y = 0
+    for (px, py), (dx, dy) in zip(points, deltas):
+        x, y = x + dx, y + dy
+        assert (x / 100, y / 100) == (round(px, 2), round(py, 2))
+
+
+def test_compact(campus):
+    route = graphs.dijkstra(graphs.compile_graph(campus), 'a1', 'c3')
+    body = route_encoding.compact(route, 'polyline', 1)
+    assert body['path'] == route['path'] and 'nodes' not in body
+    decoded = route_encoding.decode_polyline(body['polyline'], 1)
+    assert decoded == [(node['x'], node['y']) for node in route['nodes']]
+    assert route_encoding.compact(route, 'delta', 0)['deltas'][0] == [0, 0]
+
+
+@pytest.mark.parametrize('precision', [-1, 7, 400])
+def test_precision_out_of_range(precision):
+    with pytest.raises(ValueError):
+        route_encoding.encode_polyline([(1.0, 2.0)], precision)
@@ -0,0 +1,37 @@
+import math
+import random
+
+import pytest
+
+from benchmarks import synthetic
+from utils import graph as graphs
+from utils.spatial_index import SpatialIndex
+
+
+def test_nearest_node_matches_brute_force():
+    graph = graphs.compile_graph(synthetic.generate_building('T', 2, 5, 4, 3)[0])
+    index = SpatialIndex(graph)
+    rng = random.Random(3)
+    for _ in range(200):
+        floor = rng.choice(sorted(index.floors))
+        x, y = rng.uniform(-200, 400), rng.uniform(-200, 400)
+        found, distance = index.nearest_node(x, y, floor)
+        best = min(math.hypot(graph.xs[i] - x, graph.ys[i] - y)
+                   for i in range(len(graph)) if graph.floors[i] == floor)
+        assert distance == pytest.approx(best)
+        assert graph.floors[found] == floor
+
+
+def test_within(campus):
+    graph = graphs.compile_graph(campus)
+    index = SpatialIndex(graph)
+    assert sorted(graph.ids[i] for i in index.within(-1, -1, 10, 10)) == ['a1', 'a2', 'b1', 'b2']
+    assert index.within(100, 100, 200, 200) == []
+
+
+def test_non_finite_coordinates(campus):
+    index = SpatialIndex(graphs.compile_graph(campus))
+    with pytest.raises(ValueError):
+        index.nearest_node(math.nan, 0)
+    with pytest.raises(ValueError):
+        index.within(0, 0, math.inf, 1)
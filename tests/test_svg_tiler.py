@@ -0,0 +1,23 @@
+import json
+import xml.etree.ElementTree as ET
+
+from utils.svg_tiler import SVG_NS, build_tiles
+
+# Four overlapping squares, one per quadrant, drawn in this order
+SOURCE = f'''<svg xmlns="{SVG_NS}" viewBox="0 0 100 100">
+  <rect id="r0" x="40" y="40" width="20" height="20"/>
+  <g transform="translate(10 0)"><rect id="r1" x="0" y="0" width="40" height="40"/></g>
+  <rect id="r2" x="55" y="55" width="40" height="40"/>
+  <rect id="r3" x="0" y="55" width="40" height="40"/>
+</svg>'''.encode('utf-8')
+
+
+def test_tiles_record_document_order(tmp_path):
+    manifest = build_tiles('plan', SOURCE, tmp_path, levels=1)
+    assert manifest == json.loads((tmp_path / 'plan' / 'tiles.json').read_text())
+    orders = {}
+    for tile in manifest['levels'][1]['tiles']:
+        root = ET.parse(tmp_path / 'plan' / '1' / f"{tile['x']}_{tile['y']}.svg").getroot()
+        for rect in root.iter(f'{{{SVG_NS}}}rect'):
+            orders[rect.get('id')] = int(rect.get('data-order'))
+    assert orders == {'r0': 0, 'r1': 1, 'r2': 2, 'r3': 3}
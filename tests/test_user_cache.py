@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+import pytest
+from werkzeug.exceptions import Forbidden
+
+import utils.decorators
+from utils.decorators import admin_required
+from utils.user_cache import UserCache
+
+
+def test_admin_checks_see_roles_revoked_elsewhere(app, monkeypatch):
+    # The row as the database has it; another worker revokes the role
+    row = SimpleNamespace(id=1, email='admin@example.com', role='admin', is_admin=True)
+    app.user_cache = UserCache(lambda user_id: row if user_id == 1 else None, ttl=60)
+    view = admin_required(lambda: 'ok')
+
+    with app.test_request_context():
+        user = app.user_cache.get(1)
+        monkeypatch.setattr(utils.decorators, 'current_user', SimpleNamespace(is_authenticated=True, **user.to_dict()))
+        assert view() == 'ok'
+
+        row.role, row.is_admin = 'user', False
+        assert app.user_cache.get(1).role == 'admin'  # this worker's copy, until the TTL
+        with pytest.raises(Forbidden):
+            view()
+        assert app.user_cache.get(1).role == 'user'  # refreshed by the check
+
+        row = None
+        with pytest.raises(Forbidden):
+            view()
@@ -0,0 +1,95 @@
+import json
+import subprocess
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db, Feedback
+from utils.write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def feedback_queue(app, tmp_path):
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "site.db"}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    queue = WriteBehindQueue(app, db, Feedback, tmp_path / 'spill', flush_interval=0.05)
+    yield queue
+    queue.stop()
+
+
+def _row(n):
+    return {'name': f'Visitor {n}', 'email': f'visitor{n}@example.com', 'message': f'Message {n}',
+            'created_at': datetime(2024, 5, 1, 12, n)}
+
+
+def _stored(app):
+    with app.app_context():
+        return sorted((row.name, row.created_at) for row in Feedback.query.all())
+
+
+def test_spill_and_replay(app, feedback_queue):
+    feedback_queue._spill([_row(1), _row(2)])
+    spilled = list(feedback_queue.spill_folder.glob('*.jsonl'))
+    assert len(spilled) == 1
+    assert json.loads(spilled[0].read_text().splitlines()[0])['created_at'] == '2024-05-01T12:01:00'
+
+    feedback_queue._replay()
+    assert _stored(app) == [('Visitor 1', datetime(2024, 5, 1, 12, 1)), ('Visitor 2', datetime(2024, 5, 1, 12, 2))]
+    assert feedback_queue.counts['spilled'] == 2 and feedback_queue.counts['replayed'] == 2
+    assert not list(feedback_queue.spill_folder.iterdir())
+
+
+def test_failed_insert_spills_until_retry(app, feedback_queue, monkeypatch):
+    insert = feedback_queue._insert
+
+    def failing(rows):
+        raise OperationalError('INSERT', {}, Exception('database is down'))
+
+    monkeypatch.setattr(feedback_queue, '_insert', failing)
+    feedback_queue._write([_row(3)])
+    feedback_queue._write([_row(4)])  # within retry_after: straight to disk
+    assert feedback_queue.counts['spilled'] == 2 and feedback_queue.counts['inserted'] == 0
+
+    monkeypatch.setattr(feedback_queue, '_insert', insert)
+    feedback_queue._retry_at = 0
+    feedback_queue._replay()
+    assert [name for name, _ in _stored(app)] == ['Visitor 3', 'Visitor 4']
+
+
+def test_replays_exited_process_file(app, feedback_queue):
+    # Left by a worker that crashed mid-append
+    exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                            capture_output=True, text=True).stdout.strip()
+    feedback_queue.spill_folder.mkdir(parents=True)
+    (feedback_queue.spill_folder / f'{exited}.jsonl').write_text(
+        json.dumps({'name': 'Whole', 'email': 'a@example.com', 'message': 'ok'}) + '\n{"name": "Tor')
+    feedback_queue._replay()
+    assert [name for name, _ in _stored(app)] == ['Whole']
+
+
+def test_submit_inserts_in_background(app, feedback_queue):
+    for n in range(5):
+        feedback_queue.submit(_row(n))
+    feedback_queue.stop()
+    assert len(_stored(app)) == 5
+    assert feedback_queue.counts['inserted'] == 5
+
+
+def test_counts_from_many_threads(feedback_queue):
+    def spill():
+        for _ in range(2000):
+            feedback_queue._count('spilled', 1)
+    threads = [threading.Thread(target=spill) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counts = feedback_queue.counts
+    assert counts['spilled'] == 16000
+    counts['spilled'] = 0  # a copy: /metrics cannot disturb the totals
+    assert feedback_queue.counts['spilled'] == 16000
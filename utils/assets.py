@@ -0,0 +1,268 @@
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from pathlib import Path
+
+from utils.graph_store import atomic_write
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip variants are built without it
+    brotli = None
+
+# Bundle name -> source files under static/, in include order. A page
+# loads the site bundles plus at most one bundle of its own.
+BUNDLES = {
+    'site.css': ['css/main.css', 'css/theme.css', 'css/animations.css', 'css/responsive.css'],
+    'site.js': ['js/main.js'],
+    'map.css': ['css/map.css'],
+    'map.js': ['js/map_tiles.js', 'js/map.js'],
+    'waypoint.css': ['css/waypoint.css'],
+    'waypoint.js': ['js/waypoint.js'],
+    'admin.css': ['css/admin.css'],
+    'editor.css': ['css/admin.css', 'css/svg_editor.css'],
+    'editor.js': ['js/admin.js', 'js/map_tiles.js', 'js/svg_editor.js'],
+}
+MIMETYPES = {'.css': 'text/css', '.js': 'application/javascript'}
+SUFFIXES = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+BUILT_FILE = re.compile(r'^[a-z]+\.[0-9a-f]{12}\.(css|js)$')
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)(?![\'"]?(?:[a-z]+:|/|#))([^\'")]+)\1\s*\)')
+IDENTIFIER = re.compile(r'[A-Za-z0-9_$\\]')
+# Characters after which a / starts a regular expression rather than a division
+REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+# CSS characters that need no whitespace on either side
+CSS_PUNCTUATION = set('{};,>')
+
+
+def _skip_string(source, i):
+    """Index just past the string, template literal or regex starting at i"""
+    quote = source[i]
+    i += 1
+    in_class = False
+    while i < len(source):
+        char = source[i]
+        if char == '\\':
+            i += 2
+            continue
+        if quote == '/':
+            if char == '[':
+                in_class = True
+            elif char == ']':
+                in_class = False
+            elif char == '/' and not in_class:
+                return i + 1
+            elif char == '\n':
+                return i  # not a regex after all; leave the rest alone
+        elif char == quote:
+            return i + 1
+        i += 1
+    return i
+
+
+def _skip_blank(source, i):
+    """Index past whitespace and comments starting at i, and whether they
+    contained a line break"""
+    newline = False
+    while i < len(source):
+        if source[i].isspace():
+            newline = newline or source[i] == '\n'
+            i += 1
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = len(source) if end < 0 else end + 2
+            newline = newline or '\n' in source[i:end]
+            i = end
+        else:
+            return i, newline
+    return i, newline
+
+
+def minify_js(source):
+    """Drop comments and indentation; line breaks are kept (one per run),
+    so automatic semicolon insertion works exactly as in the source"""
+    out = []
+    i = 0
+    while i < len(source):
+        char = source[i]
+        if source.startswith('//', i):
+            while i < len(source) and source[i] != '\n':
+                i += 1
+        elif char.isspace() or source.startswith('/*', i):
+            i, newline = _skip_blank(source, i)
+            if not out or i >= len(source) or source.startswith('//', i):
+                if newline and out and out[-1] != '\n':
+                    out.append('\n')
+                continue
+            prev, following = out[-1][-1], source[i]
+            if newline:
+                if prev != '\n':
+                    out.append('\n')
+            elif (IDENTIFIER.match(prev) and IDENTIFIER.match(following)) or \
+                    (prev in '+-' and following == prev):
+                # "a b" must stay apart, and so must "a + +b"
+                out.append(' ')
+        elif char in '"\'`' or (char == '/' and (not out or out[-1][-1] in REGEX_AFTER or out[-1] == '\n')):
+            end = _skip_string(source, i)
+            out.append(source[i:end])
+            i = end
+        else:
+            out.append(char)
+            i += 1
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css(source, base_url=None):
+    """Drop comments and redundant whitespace; relative url()s are made
+    absolute against base_url, since the bundle is served elsewhere"""
+    out = []
+    i = 0
+    while i < len(source):
+        char = source[i]
+        if char in '"\'':
+            end = _skip_string(source, i)
+            out.append(source[i:end])
+            i = end
+        elif char.isspace() or source.startswith('/*', i):
+            i, _ = _skip_blank(source, i)
+            if out and i < len(source) and out[-1][-1] not in CSS_PUNCTUATION \
+                    and source[i] not in CSS_PUNCTUATION and not source.startswith('/*', i):
+                out.append(' ')
+        else:
+            if char == '}' and out and out[-1] == ';':
+                out.pop()
+            out.append(char)
+            i += 1
+    css = ''.join(out).strip()
+    if base_url:
+        css = CSS_URL.sub(lambda m: f'url({m.group(1)}{base_url}/{m.group(2)}{m.group(1)})', css)
+    return css + '\n'
+
+
+class AssetBuilder:
+    """Builds concatenated, minified, content-hashed CSS/JS bundles
+
+    Each bundle is written as <name>.<hash>.<ext> (plus .gz and .br), so
+    its URL changes whenever its content does and it can be cached
+    forever. Sources are re-checked at most every check_interval seconds
+    and changed bundles rebuilt, which keeps development edits live.
+    """
+
+    def __init__(self, static_folder, build_folder, static_url='/static', bundles=None, check_interval=2.0):
+        self.static_folder = Path(static_folder)
+        self.build_folder = Path(build_folder)
+        self.static_url = static_url.rstrip('/')
+        self.bundles = bundles or BUNDLES
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._checked = 0.0
+
+    @property
+    def manifest_path(self):
+        return self.build_folder / 'manifest.json'
+
+    def _source_mtimes(self):
+        sources = {source for files in self.bundles.values() for source in files}
+        return {source: (self.static_folder / source).stat().st_mtime for source in sorted(sources)}
+
+    def build(self):
+        """Write every bundle and a manifest mapping names to hashed files"""
+        self.build_folder.mkdir(parents=True, exist_ok=True)
+        bundles = {}
+        for name, sources in self.bundles.items():
+            stem, ext = name.rsplit('.', 1)
+            parts = []
+            for source in sources:
+                text = (self.static_folder / source).read_text(encoding='utf-8')
+                if ext == 'css':
+                    base_url = f"{self.static_url}/{source.rsplit('/', 1)[0]}" if '/' in source else self.static_url
+                    parts.append(minify_css(text, base_url))
+                else:
+                    # A newline and semicolon keep one file's last statement
+                    # from running into the next file's first
+                    parts.append(minify_js(text) + ';')
+            payload = '\n'.join(parts).encode('utf-8')
+            digest = hashlib.sha1(payload).hexdigest()[:12]
+            filename = f'{stem}.{digest}.{ext}'
+
+            variants = {'identity': payload, 'gzip': gzip.compress(payload, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['br'] = brotli.compress(payload, quality=11)
+            for encoding, data in variants.items():
+                path = self.build_folder / f'{filename}{SUFFIXES[encoding]}'
+                if not path.exists():
+                    atomic_write(path, data)
+            bundles[name] = {
+                'file': filename,
+                'sources': sources,
+                'encodings': {encoding: len(data) for encoding, data in variants.items()}
+            }
+
+        manifest = {
+            'version': hashlib.sha1(''.join(entry['file'] for entry in bundles.values()).encode('utf-8')).hexdigest()[:12],
+            'source_mtimes': self._source_mtimes(),
+            'bundles': bundles
+        }
+        atomic_write(self.manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+        self._files = {entry['file']: entry for entry in bundles.values()}
+        return manifest
+
+    def manifest(self):
+        """Current manifest, rebuilt if a source changed since the last build"""
+        now = time.monotonic()
+        if self._manifest is not None and now - self._checked < self.check_interval:
+            return self._manifest
+        with self._lock:
+            if self._manifest is not None and now - self._checked < self.check_interval:
+                return self._manifest
+            manifest = self._manifest
+            if manifest is None:
+                try:
+                    manifest = json.loads(self.manifest_path.read_bytes())
+                except (OSError, ValueError):
+                    manifest = None
+            try:
+                current = manifest is not None and manifest['source_mtimes'] == self._source_mtimes() \
+                    and manifest['bundles'].keys() == self.bundles.keys()
+            except OSError:
+                current = manifest is not None  # a source is missing; keep serving the last build
+            if not current:
+                manifest = self.build()
+            self._manifest = manifest
+            self._files = {entry['file']: entry for entry in manifest['bundles'].values()}
+            self._checked = now
+        return manifest
+
+    @property
+    def version(self):
+        """Changes whenever any bundle's content does"""
+        return self.manifest()['version']
+
+    def filename(self, name):
+        """Hashed file name of a bundle, e.g. site.3f2a9c0d1e4b.css"""
+        return self.manifest()['bundles'][name]['file']
+
+    def lookup(self, filename):
+        """Manifest entry of a hashed file, or None if there is no such file
+
+        Files from earlier builds stay servable, so pages rendered before a
+        deploy (or still in a browser cache) keep working.
+        """
+        self.manifest()
+        entry = self._files.get(filename)
+        if entry is None and BUILT_FILE.match(filename) and self.variant_path(filename, 'identity').is_file():
+            entry = {'file': filename, 'encodings': {
+                encoding: 0 for encoding in SUFFIXES if self.variant_path(filename, encoding).is_file()
+            }}
+        return entry
+
+    def variant_path(self, filename, encoding):
+        return self.build_folder / f'{filename}{SUFFIXES[encoding]}'
+
+    @staticmethod
+    def mimetype(filename):
+        return MIMETYPES[Path(filename).suffix]
@@ -0,0 +1,127 @@
+import math
+from array import array
+
+
+class Connectivity:
+    """Component labels of a CompiledGraph, for O(1) "no route" answers
+
+    weak: weakly connected component of each node (edges taken both ways).
+    strong: strongly connected component, numbered by Tarjan's algorithm,
+    which finishes a component only after every component it can reach,
+    so an edge between components always goes to a lower number.
+    Closed edges (infinite weight) do not connect anything.
+    """
+
+    def __init__(self, graph):
+        self.weak = _weak_components(graph)
+        self.strong = _strong_components(graph)
+
+    def may_reach(self, i, j):
+        """False only if there is certainly no path from node i to node j"""
+        return self.weak[i] == self.weak[j] and self.strong[i] >= self.strong[j]
+
+    def report(self, graph, limit=200):
+        """Nodes cut off from the main part of the map
+
+        disconnected: not linked at all to the largest component.
+        one_way: linked, but a route cannot get both there and back
+        (outside the largest strongly connected component).
+        """
+        n = len(graph)
+        weak_sizes = {}
+        for label in self.weak:
+            weak_sizes[label] = weak_sizes.get(label, 0) + 1
+        main_weak = max(weak_sizes, key=weak_sizes.get) if n else None
+        strong_sizes = {}
+        for i in range(n):
+            if self.weak[i] == main_weak:
+                strong_sizes[self.strong[i]] = strong_sizes.get(self.strong[i], 0) + 1
+        main_strong = max(strong_sizes, key=strong_sizes.get) if strong_sizes else None
+
+        disconnected = [graph.ids[i] for i in range(n) if self.weak[i] != main_weak]
+        one_way = [graph.ids[i] for i in range(n) if self.weak[i] == main_weak and self.strong[i] != main_strong]
+        return {
+            'nodes': n,
+            'components': len(weak_sizes),
+            'strong_components': len(set(self.strong)),
+            'disconnected_count': len(disconnected),
+            'disconnected': disconnected[:limit],
+            'one_way_count': len(one_way),
+            'one_way': one_way[:limit]
+        }
+
+
+def _weak_components(graph):
+    n = len(graph)
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    for i in range(n):
+        for k in range(offsets[i], offsets[i + 1]):
+            if weights[k] == math.inf:
+                continue
+            a, b = find(i), find(targets[k])
+            if a != b:
+                parent[a] = b
+    labels = array('l', [0]) * n
+    numbers = {}
+    for i in range(n):
+        labels[i] = numbers.setdefault(find(i), len(numbers))
+    return labels
+
+
+def _strong_components(graph):
+    """Iterative Tarjan; components are numbered in the order they finish"""
+    n = len(graph)
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    labels = array('l', [0]) * n
+    stack = []
+    counter = 0
+    component = 0
+
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        work = [(root, offsets[root])]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        while work:
+            v, k = work[-1]
+            if k < offsets[v + 1]:
+                work[-1] = (v, k + 1)
+                if weights[k] == math.inf:
+                    continue
+                w = targets[k]
+                if index[w] < 0:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, offsets[w]))
+                elif on_stack[w]:
+                    low[v] = min(low[v], index[w])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[v])
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    labels[w] = component
+                    if w == v:
+                        break
+                component += 1
+    return labels
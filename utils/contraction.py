@@ -0,0 +1,296 @@
+import heapq
+import math
+import mmap
+import struct
+from array import array
+
+from utils import graph as graphs
+from utils.graph_store import atomic_write
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+MAGIC = b'CNCH'
+# magic, key length, nodes, upward edges, downward edges
+HEADER = struct.Struct('<4sIIII')
+
+
+class ContractionHierarchy:
+    """Contraction hierarchy over a CompiledGraph
+
+    Nodes are contracted one by one in order of importance; whenever removing
+    a node would lengthen a shortest path between two of its neighbours, a
+    shortcut edge remembering the contracted middle node takes its place.
+    A query then only searches upwards in rank from both ends, and the
+    shortcuts on the meeting path are unpacked back into original edges.
+
+    up_*: edges v -> w with rank[w] > rank[v], for the forward search.
+    down_*: edges u -> v with rank[u] > rank[v], stored at v, for the
+    backward search. middles hold the contracted node of a shortcut, or -1.
+    """
+
+    def __init__(self, rank, up, down):
+        self.rank = rank
+        self.up_offsets, self.up_targets, self.up_weights, self.up_middles = up
+        self.down_offsets, self.down_targets, self.down_weights, self.down_middles = down
+
+    @property
+    def shortcut_count(self):
+        return sum(1 for m in self.up_middles if m >= 0) + sum(1 for m in self.down_middles if m >= 0)
+
+    @classmethod
+    def build(cls, graph, witness_limit=100):
+        """Contract every node of a graph
+
+        Witness searches give up after settling witness_limit nodes, which
+        can only add redundant shortcuts, never drop needed ones.
+        """
+        n = len(graph)
+        outgoing = [dict() for _ in range(n)]
+        incoming = [dict() for _ in range(n)]
+        for v in range(n):
+            for w, weight in graph.neighbors(v):
+                if w != v and weight < outgoing[v].get(w, math.inf):
+                    outgoing[v][w] = weight
+                    incoming[w][v] = weight
+        middles = {}
+        contracted_neighbors = [0] * n
+        rank = array('q', [-1]) * n
+        up = [None] * n
+        down = [None] * n
+
+        def shortcuts(v):
+            """(u, w, length) shortcuts needed to contract v right now"""
+            needed = []
+            targets = outgoing[v]
+            if not targets:
+                return needed
+            for u, to_v in incoming[v].items():
+                limit = to_v + max(targets.values())
+                distances = _witness_search(outgoing, u, v, limit, witness_limit)
+                for w, from_v in targets.items():
+                    if w != u and distances.get(w, math.inf) > to_v + from_v:
+                        needed.append((u, w, to_v + from_v))
+            return needed
+
+        def priority(v):
+            # Edge difference plus a term that spreads contraction evenly
+            added = len(shortcuts(v))
+            return added - len(incoming[v]) - len(outgoing[v]) + contracted_neighbors[v]
+
+        queue = [(priority(v), v) for v in range(n)]
+        heapq.heapify(queue)
+        order = 0
+        while queue:
+            _, v = heapq.heappop(queue)
+            if rank[v] >= 0:
+                continue
+            # Lazy update: re-evaluate, and put back if no longer the cheapest
+            current = priority(v)
+            if queue and current > queue[0][0]:
+                heapq.heappush(queue, (current, v))
+                continue
+
+            for u, w, length in shortcuts(v):
+                if length < outgoing[u].get(w, math.inf):
+                    outgoing[u][w] = length
+                    incoming[w][u] = length
+                    middles[(u, w)] = v
+
+            rank[v] = order
+            order += 1
+            up[v] = [(w, weight, middles.get((v, w), -1)) for w, weight in outgoing[v].items()]
+            down[v] = [(u, weight, middles.get((u, v), -1)) for u, weight in incoming[v].items()]
+            for w in outgoing[v]:
+                del incoming[w][v]
+                contracted_neighbors[w] += 1
+            for u in incoming[v]:
+                del outgoing[u][v]
+                contracted_neighbors[u] += 1
+            outgoing[v] = {}
+            incoming[v] = {}
+
+        return cls(rank, _csr(up), _csr(down))
+
+    def route(self, graph, start, end):
+        """Route result from a bidirectional upward search, or None"""
+        source = graph.index.get(start)
+        target = graph.index.get(end)
+        if source is None or target is None:
+            return None
+        if source == target:
+            return graphs.build_result(graph, [source], 0.0, 1)
+
+        sides = (
+            (self.up_offsets, self.up_targets, self.up_weights),
+            (self.down_offsets, self.down_targets, self.down_weights),
+        )
+        distances = ({source: 0.0}, {target: 0.0})
+        predecessors = ({}, {})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        settled = (set(), set())
+        best = math.inf  # length of the shortest path met so far
+        pushes = 2
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        while heaps[0] or heaps[1]:
+            for side in (0, 1):
+                heap = heaps[side]
+                # A side is done once it cannot improve on the best meeting
+                if heap and heap[0][0] >= best:
+                    heap.clear()
+                if not heap:
+                    continue
+                distance, current = heappop(heap)
+                if current in settled[side]:
+                    continue
+                settled[side].add(current)
+                offsets, targets, weights = sides[side]
+                own, other = distances[side], distances[1 - side]
+                for k in range(offsets[current], offsets[current + 1]):
+                    neighbor = targets[k]
+                    candidate = distance + weights[k]
+                    if candidate < own.get(neighbor, math.inf):
+                        own[neighbor] = candidate
+                        predecessors[side][neighbor] = current
+                        heappush(heap, (candidate, neighbor))
+                        pushes += 1
+                        if neighbor in other and candidate + other[neighbor] < best:
+                            best = candidate + other[neighbor]
+
+        graphs._count(len(settled[0]) + len(settled[1]), pushes)
+        # Pick the meeting node from the final distances, which the
+        # predecessor maps agree with
+        forward, backward = distances
+        if len(backward) < len(forward):
+            forward, backward = backward, forward
+        best, meeting = math.inf, None
+        for node, distance in forward.items():
+            other = backward.get(node)
+            if other is not None and distance + other < best:
+                best, meeting = distance + other, node
+        if meeting is None:
+            return None
+
+        # Upward chains in original edge direction: source .. meeting .. target
+        chain = graphs.unwind(predecessors[0], source, meeting)
+        current = meeting
+        while current != target:
+            current = predecessors[1][current]
+            chain.append(current)
+        path = [source]
+        for a, b in zip(chain, chain[1:]):
+            self._unpack(a, b, path)
+        return graphs.build_result(graph, path, best, len(settled[0]) + len(settled[1]))
+
+    def _unpack(self, a, b, path):
+        """Append the original nodes of edge a -> b (after a) to path"""
+        stack = [(a, b)]
+        while stack:
+            a, b = stack.pop()
+            middle = self._middle(a, b)
+            if middle < 0:
+                path.append(b)
+            else:
+                stack.append((middle, b))
+                stack.append((a, middle))
+
+    def _middle(self, a, b):
+        if self.rank[a] < self.rank[b]:
+            offsets, targets, middles, owner, other = self.up_offsets, self.up_targets, self.up_middles, a, b
+        else:
+            offsets, targets, middles, owner, other = self.down_offsets, self.down_targets, self.down_middles, b, a
+        for k in range(offsets[owner], offsets[owner + 1]):
+            if targets[k] == other:
+                return middles[k]
+        raise KeyError((a, b))
+
+    def save(self, path, key):
+        """Persist the hierarchy; key ties it to one graph version"""
+        key = key.encode('utf-8')
+        header = HEADER.pack(MAGIC, len(key), len(self.rank), len(self.up_targets), len(self.down_targets)) + key
+        header += b'\0' * (-len(header) % 8)
+        sections = [array('q', self.rank)]
+        for offsets, targets, weights, middles in (
+                (self.up_offsets, self.up_targets, self.up_weights, self.up_middles),
+                (self.down_offsets, self.down_targets, self.down_weights, self.down_middles)):
+            sections += [array('q', offsets), array('q', targets), array('d', weights), array('q', middles)]
+        atomic_write(path, header + b''.join(section.tobytes() for section in sections))
+
+    @classmethod
+    def load(cls, path, key):
+        """Memory-map a persisted hierarchy, or return None if missing or stale"""
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(buffer) < HEADER.size:
+            return None
+        magic, key_length, n, up_count, down_count = HEADER.unpack_from(buffer)
+        if magic != MAGIC or bytes(buffer[HEADER.size:HEADER.size + key_length]) != key.encode('utf-8'):
+            return None
+        start = HEADER.size + key_length
+        start += -start % 8
+        if len(buffer) != start + 8 * (n + 2 * (n + 1) + 3 * up_count + 3 * down_count):
+            return None
+
+        view = memoryview(buffer)
+
+        def take(count, fmt):
+            nonlocal start
+            section = view[start:start + 8 * count].cast(fmt)
+            start += 8 * count
+            return section
+
+        rank = take(n, 'q')
+        up = (take(n + 1, 'q'), take(up_count, 'q'), take(up_count, 'd'), take(up_count, 'q'))
+        down = (take(n + 1, 'q'), take(down_count, 'q'), take(down_count, 'd'), take(down_count, 'q'))
+        return cls(rank, up, down)
+
+
+def _witness_search(outgoing, source, excluded, limit, max_settled):
+    """Distances from source that avoid `excluded`, up to `limit`"""
+    distances = {source: 0.0}
+    settled = 0
+    heap = [(0.0, source)]
+    while heap and settled < max_settled:
+        distance, current = heapq.heappop(heap)
+        if distance > distances[current]:
+            continue
+        if distance > limit:
+            break
+        settled += 1
+        for neighbor, weight in outgoing[current].items():
+            if neighbor == excluded:
+                continue
+            candidate = distance + weight
+            if candidate < distances.get(neighbor, math.inf):
+                distances[neighbor] = candidate
+                heapq.heappush(heap, (candidate, neighbor))
+    return distances
+
+
+def _csr(rows):
+    offsets, targets, weights, middles = array('q', [0]), array('q'), array('d'), array('q')
+    for row in rows:
+        for target, weight, middle in row:
+            targets.append(target)
+            weights.append(weight)
+            middles.append(middle)
+        offsets.append(len(targets))
+    return offsets, targets, weights, middles
+
+
+def load_or_build(graph, path, key):
+    """Reuse the hierarchy persisted next to the graph JSON, rebuilding it
+    when the graph version changed"""
+    hierarchy = ContractionHierarchy.load(path, key)
+    if hierarchy is None or len(hierarchy.rank) != len(graph):
+        hierarchy = ContractionHierarchy.build(graph)
+        try:
+            hierarchy.save(path, key)
+        except OSError as e:
+            logger.error("Error saving contraction hierarchy", extra={'path': str(path), 'error': str(e)})
+    return hierarchy
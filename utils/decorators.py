@@ -1,28 +1,31 @@
 # utils/decorators.py
 from functools import wraps
-from flask import abort
+from flask import abort, current_app
 from flask_login import current_user
+from utils.log import get_logger
+
+logger = get_logger(__name__)
 
 def admin_required(func):
     @wraps(func)
     def decorated_function(*args, **kwargs):
-        # Print statements for debugging (keep flush=True for now)
-        print(f"--- Admin Decorator Check ---", flush=True)
-        print(f"Current user: {current_user}", flush=True)
-        print(f"Is authenticated: {current_user.is_authenticated}", flush=True)
-
         # Check authentication status first
         if not current_user.is_authenticated:
-            print("User not authenticated. Aborting.", flush=True)
+            logger.info("Admin access denied: not authenticated", extra={'view': func.__name__})
             abort(403) # Forbidden
 
-        # If authenticated, check the role
-        print(f"User role: {current_user.role}", flush=True)
-        if current_user.role != 'admin':
-            print(f"User role '{current_user.role}' is not 'admin'. Aborting.", flush=True)
+        # If authenticated, check the role. current_user may be a copy cached
+        # by this worker (or kept in the session) from before another worker
+        # revoked the role, so admin views re-read it from the database.
+        cache = getattr(current_app, 'user_cache', None)
+        user = cache.fresh(current_user.id) if cache is not None else current_user
+        if user is None or user.role != 'admin':
+            logger.info("Admin access denied: role is not admin",
+                        extra={'view': func.__name__, 'user_id': current_user.id,
+                               'role': user.role if user is not None else None})
             abort(403) # Forbidden
 
         # If authenticated and role is 'admin', proceed
-        print("User is admin. Allowing access.", flush=True)
+        logger.debug("Admin access granted", extra={'view': func.__name__, 'user_id': current_user.id})
         return func(*args, **kwargs)
     return decorated_function
\ No newline at end of file
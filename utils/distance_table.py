@@ -0,0 +1,136 @@
+import hashlib
+import heapq
+import math
+import mmap
+import struct
+from array import array
+
+from utils.graph_store import atomic_write
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+MAGIC = b'CNAP'
+HEADER = struct.Struct('<4sII')  # magic, key length, node count
+
+
+class DistanceTable:
+    """All-pairs distances and next hops for a small graph, stored as flat
+    row-major n*n arrays so a route is a lookup plus path unrolling"""
+
+    def __init__(self, size, distances, next_hops):
+        self.size = size
+        self.distances = distances
+        self.next_hops = next_hops
+
+    @classmethod
+    def build(cls, graph):
+        """Run Dijkstra from every node, recording distance and first hop"""
+        n = len(graph)
+        distances = array('d', [math.inf]) * (n * n)
+        next_hops = array('i', [-1]) * (n * n)
+        offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        for source in range(n):
+            base = source * n
+            best = {source: 0.0}
+            first_hop = {source: source}
+            settled = set()
+            heap = [(0.0, source)]
+            while heap:
+                distance, current = heappop(heap)
+                if current in settled:
+                    continue
+                settled.add(current)
+                distances[base + current] = distance
+                next_hops[base + current] = first_hop[current]
+                hop = first_hop[current]
+                for k in range(offsets[current], offsets[current + 1]):
+                    neighbor = targets[k]
+                    candidate = distance + weights[k]
+                    if candidate < best.get(neighbor, math.inf):
+                        best[neighbor] = candidate
+                        first_hop[neighbor] = neighbor if current == source else hop
+                        heappush(heap, (candidate, neighbor))
+
+        return cls(n, distances, next_hops)
+
+    def route(self, graph, start, end):
+        """Route result from table lookups, or None if unreachable"""
+        source = graph.index.get(start)
+        target = graph.index.get(end)
+        if source is None or target is None:
+            return None
+        n = self.size
+        distance = self.distances[source * n + target]
+        if distance == math.inf:
+            return None
+
+        path = [source]
+        current = source
+        while current != target and len(path) <= n:
+            current = self.next_hops[current * n + target]
+            path.append(current)
+        ids, node_data = graph.ids, graph.node_data
+        return {
+            'path': [ids[i] for i in path],
+            'distance': distance,
+            'nodes': [node_data[i] for i in path],
+            'settled': 0
+        }
+
+    def save(self, path, key):
+        """Persist the table; key ties it to one graph version"""
+        key = key.encode('utf-8')
+        header = HEADER.pack(MAGIC, len(key), self.size) + key
+        header += b'\0' * (-len(header) % 8)  # keep the arrays 8-byte aligned
+        atomic_write(path, header + self.distances.tobytes() + self.next_hops.tobytes())
+
+    @classmethod
+    def load(cls, path, key):
+        """Memory-map a persisted table, or return None if missing or stale"""
+        try:
+            with open(path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(buffer) < HEADER.size:
+            return None
+        magic, key_length, n = HEADER.unpack_from(buffer)
+        stored_key = bytes(buffer[HEADER.size:HEADER.size + key_length])
+        if magic != MAGIC or stored_key != key.encode('utf-8'):
+            return None
+        start = HEADER.size + key_length
+        start += -start % 8
+        middle = start + 8 * n * n
+        if len(buffer) != middle + 4 * n * n:
+            return None
+        view = memoryview(buffer)
+        return cls(n, view[start:middle].cast('d'), view[middle:].cast('i'))
+
+
+def routing_key(graph):
+    """Digest of everything a table depends on: the edges and their weights
+
+    Map edits that leave these alone (renaming a room, say) keep the key,
+    so the persisted table is reused instead of rebuilt.
+    """
+    digest = hashlib.sha1()
+    for typecode, values in (('q', graph.offsets), ('q', graph.targets), ('d', graph.weights)):
+        digest.update(array(typecode, values).tobytes())
+    return digest.hexdigest()
+
+
+def load_or_build(graph, path, key):
+    """Reuse the table persisted next to the graph JSON, rebuilding it when
+    the graph version changed"""
+    table = DistanceTable.load(path, key)
+    if table is None or table.size != len(graph):
+        table = DistanceTable.build(graph)
+        try:
+            table.save(path, key)
+        except OSError as e:
+            logger.error("Error saving distance table", extra={'path': str(path), 'error': str(e)})
+    return table
@@ -0,0 +1,55 @@
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from utils.route_cache import LocalBackend
+
+
+class FragmentCache(Extension):
+    """{% cache 'name' %}...{% endcache %}: keep a rendered piece of template
+
+    A fragment is stored under its template, its name and whatever
+    fragment_cache_key() returns (the graph and asset versions), so it is
+    re-rendered when either changes and otherwise served as a string.
+    Only wrap markup that depends on nothing else: per-user parts (the
+    navbar, flashed messages) must stay outside. With no fragment_cache
+    set on the environment, or while templates auto-reload (debug), the
+    tag just renders its body.
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None, fragment_cache_key=lambda: ())
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def init_app(cls, app):
+        """Enable the tag, caching per worker when FRAGMENT_CACHE_SIZE is set"""
+        app.jinja_env.add_extension(cls)
+        size = app.config.get('FRAGMENT_CACHE_SIZE', 0)
+        if size:
+            app.jinja_env.fragment_cache = LocalBackend(size, app.config.get('FRAGMENT_CACHE_TTL', 3600))
+        return app.jinja_env.extensions[cls.identifier]
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name), parser.parse_expression()]
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, template, name, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or self.environment.auto_reload:
+            return caller()
+        key = ('fragment', template, name) + tuple(self.environment.fragment_cache_key())
+        html = cache.get(key)
+        if html is None:
+            self.misses += 1
+            html = caller()
+            cache.set(key, str(html))
+        else:
+            self.hits += 1
+        return Markup(html)
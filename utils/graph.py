@@ -0,0 +1,403 @@
+import heapq
+import math
+import threading
+from array import array
+
+from utils.connectivity import Connectivity
+
+# Search work done on each thread, collected by callers that report metrics
+_counters = threading.local()
+
+
+def _count(settled, pushes):
+    _counters.settled = getattr(_counters, 'settled', 0) + settled
+    _counters.pushes = getattr(_counters, 'pushes', 0) + pushes
+
+
+def take_counters():
+    """(nodes settled, heap pushes) by searches on this thread since the last call"""
+    settled, pushes = getattr(_counters, 'settled', 0), getattr(_counters, 'pushes', 0)
+    _counters.settled = _counters.pushes = 0
+    return settled, pushes
+
+
+def node_floor(node):
+    """Floor number of a node dict; unmarked nodes are on floor 1"""
+    try:
+        return int(node.get('floor', 1))
+    except (TypeError, ValueError):
+        return 1
+
+
+class CompiledGraph:
+    """Read-only routing graph with interned node ids and CSR adjacency"""
+
+    def __init__(self, data):
+        data = data or {}
+        nodes = data.get('nodes') or {}
+        edges = data.get('edges') or {}
+
+        # Intern string ids to integers once, at load time
+        self.ids = list(nodes)
+        self.index = {node_id: i for i, node_id in enumerate(self.ids)}
+        self.node_data = [nodes[node_id] for node_id in self.ids]
+
+        self.xs = array('d', (_coord(node, 'x') for node in self.node_data))
+        self.ys = array('d', (_coord(node, 'y') for node in self.node_data))
+        self.floors = array('q', (node_floor(node) for node in self.node_data))
+
+        # offsets[i]:offsets[i + 1] slices targets/weights for node i
+        self.offsets = array('l', [0])
+        self.targets = array('l')
+        self.weights = array('d')
+        for node_id in self.ids:
+            for neighbor, weight in _iter_neighbors(edges.get(node_id)):
+                j = self.index.get(neighbor)
+                if j is None:
+                    continue
+                if weight is None:
+                    weight = self._euclidean(self.index[node_id], j)
+                self.targets.append(j)
+                self.weights.append(float(weight))
+            self.offsets.append(len(self.targets))
+
+        self.has_coordinates = bool(self.ids) and not any(
+            math.isnan(v) for v in self.xs + self.ys)
+        self.heuristic_scale = self._heuristic_scale() if self.has_coordinates else 0.0
+        self._reverse = None
+        # Optional DistanceTable answering queries without search
+        self.all_pairs = None
+        # Optional ContractionHierarchy for large graphs
+        self.contraction = None
+        self._connectivity = None
+
+    @classmethod
+    def from_parts(cls, ids, index, node_data, xs, ys, floors, offsets, targets, weights,
+                   has_coordinates, heuristic_scale):
+        """Assemble a graph from prebuilt tables, e.g. views of a mapped file"""
+        graph = cls.__new__(cls)
+        graph.ids = ids
+        graph.index = index
+        graph.node_data = node_data
+        graph.xs, graph.ys, graph.floors = xs, ys, floors
+        graph.offsets, graph.targets, graph.weights = offsets, targets, weights
+        graph.has_coordinates = has_coordinates
+        graph.heuristic_scale = heuristic_scale
+        graph._reverse = None
+        graph.all_pairs = None
+        graph.contraction = None
+        graph._connectivity = None
+        return graph
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, node_id):
+        return node_id in self.index
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def neighbors(self, i):
+        """Yield (target, weight) pairs for interned node i"""
+        for k in range(self.offsets[i], self.offsets[i + 1]):
+            yield self.targets[k], self.weights[k]
+
+    @property
+    def reverse(self):
+        """CSR arrays of the transposed graph, built on first use"""
+        if self._reverse is None:
+            incoming = [[] for _ in self.ids]
+            for i in range(len(self.ids)):
+                for j, weight in self.neighbors(i):
+                    incoming[j].append((i, weight))
+            offsets, targets, weights = array('l', [0]), array('l'), array('d')
+            for edges in incoming:
+                for i, weight in edges:
+                    targets.append(i)
+                    weights.append(weight)
+                offsets.append(len(targets))
+            self._reverse = (offsets, targets, weights)
+        return self._reverse
+
+    @property
+    def connectivity(self):
+        """Component labels of this graph version, computed on first use"""
+        if self._connectivity is None:
+            self._connectivity = Connectivity(self)
+        return self._connectivity
+
+    def straight_line(self, i, j):
+        """Lower bound on the route length between interned nodes i and j"""
+        return self.heuristic_scale * math.hypot(self.xs[i] - self.xs[j], self.ys[i] - self.ys[j])
+
+    def to_dict(self):
+        """Rebuild the {'nodes', 'edges'} JSON schema from the compiled form"""
+        edges = {}
+        for i, node_id in enumerate(self.ids):
+            neighbors = {self.ids[j]: w for j, w in self.neighbors(i)}
+            if neighbors:
+                edges[node_id] = neighbors
+        return {'nodes': dict(zip(self.ids, self.node_data)), 'edges': edges}
+
+    def _heuristic_scale(self):
+        # Weights may be scaled (time, penalties) relative to map units, so
+        # shrink the straight-line distance by the smallest weight/length
+        # ratio of any edge to keep the heuristic admissible.
+        scale = math.inf
+        for i in range(len(self.ids)):
+            for j, weight in self.neighbors(i):
+                length = math.hypot(self.xs[i] - self.xs[j], self.ys[i] - self.ys[j])
+                if length > 0:
+                    scale = min(scale, weight / length)
+        return 0.0 if scale == math.inf else max(scale, 0.0)
+
+    def _euclidean(self, i, j):
+        dx = self.xs[i] - self.xs[j]
+        dy = self.ys[i] - self.ys[j]
+        distance = math.hypot(dx, dy)
+        return 1.0 if math.isnan(distance) else distance
+
+
+def _coord(node, key):
+    try:
+        return float(node[key])
+    except (KeyError, TypeError, ValueError):
+        return float('nan')
+
+
+def _iter_neighbors(neighbors):
+    """Accept both {neighbor: weight} and the editor's [neighbor, ...] form"""
+    if not neighbors:
+        return ()
+    if isinstance(neighbors, dict):
+        return neighbors.items()
+    return ((neighbor, None) for neighbor in neighbors)
+
+
+def compile_graph(data):
+    """Compile a JSON graph dict, passing already compiled graphs through"""
+    if isinstance(data, CompiledGraph):
+        return data
+    return CompiledGraph(data)
+
+
+def build_result(graph, path_indices, distance, settled):
+    """Convert an interned path back into the public route result"""
+    ids = graph.ids
+    node_data = graph.node_data
+    return {
+        'path': [ids[i] for i in path_indices],
+        'distance': distance,
+        'nodes': [node_data[i] for i in path_indices],
+        'settled': settled
+    }
+
+
+def unwind(predecessors, source, target):
+    """Follow a predecessor map from target back to source"""
+    path = [target]
+    current = target
+    while current != source:
+        current = predecessors[current]
+        path.append(current)
+    path.reverse()
+    return path
+
+
+def unreachable(graph, start, end):
+    """True when component labels rule out any route from start to end"""
+    source = graph.index.get(start)
+    target = graph.index.get(end)
+    return source is not None and target is not None and not graph.connectivity.may_reach(source, target)
+
+
+def dijkstra(graph, start, end):
+    """Dijkstra over a CompiledGraph; state grows only with visited nodes"""
+    return _unidirectional(graph, start, end, use_heuristic=False)
+
+
+def astar(graph, start, end):
+    """A* guided by the graph's scaled straight-line heuristic"""
+    if not graph.has_coordinates:
+        return bidirectional(graph, start, end)
+    return _unidirectional(graph, start, end, use_heuristic=True)
+
+
+def _unidirectional(graph, start, end, use_heuristic):
+    source = graph.index.get(start)
+    target = graph.index.get(end)
+    if source is None or target is None:
+        return None
+
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+    xs, ys = graph.xs, graph.ys
+    scale = graph.heuristic_scale if use_heuristic else 0.0
+    tx, ty = xs[target], ys[target]
+    hypot = math.hypot
+
+    distances = {source: 0.0}
+    predecessors = {}
+    settled = set()
+    heap = [(0.0, source)]
+    heappush, heappop = heapq.heappush, heapq.heappop
+    pushes = 1
+
+    while heap:
+        _, current = heappop(heap)
+        if current in settled:
+            continue
+        settled.add(current)
+        current_distance = distances[current]
+        if current == target:
+            _count(len(settled), pushes)
+            path = unwind(predecessors, source, target)
+            return build_result(graph, path, current_distance, len(settled))
+        for k in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[k]
+            distance = current_distance + weights[k]
+            if distance < distances.get(neighbor, math.inf):
+                distances[neighbor] = distance
+                predecessors[neighbor] = current
+                if scale:
+                    distance += scale * hypot(xs[neighbor] - tx, ys[neighbor] - ty)
+                heappush(heap, (distance, neighbor))
+                pushes += 1
+
+    _count(len(settled), pushes)
+    return None
+
+
+def single_source(graph, source, stop_at=None, reverse=False):
+    """Distances and predecessors from interned source, optionally on the
+    transposed graph, stopping once every index in stop_at is settled"""
+    offsets, targets, weights = graph.reverse if reverse else (
+        graph.offsets, graph.targets, graph.weights)
+    remaining = set(stop_at) if stop_at is not None else None
+    distances = {source: 0.0}
+    predecessors = {}
+    settled = set()
+    heap = [(0.0, source)]
+    heappush, heappop = heapq.heappush, heapq.heappop
+    pushes = 1
+
+    while heap:
+        current_distance, current = heappop(heap)
+        if current in settled:
+            continue
+        settled.add(current)
+        if remaining is not None:
+            remaining.discard(current)
+            if not remaining:
+                break
+        for k in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[k]
+            distance = current_distance + weights[k]
+            if distance < distances.get(neighbor, math.inf):
+                distances[neighbor] = distance
+                predecessors[neighbor] = current
+                heappush(heap, (distance, neighbor))
+                pushes += 1
+
+    _count(len(settled), pushes)
+    distances = {i: d for i, d in distances.items() if i in settled}
+    return distances, predecessors, len(settled)
+
+
+def bidirectional(graph, start, end, use_heuristic=False):
+    """Bidirectional Dijkstra, or A* with averaged potentials when asked"""
+    source = graph.index.get(start)
+    target = graph.index.get(end)
+    if source is None or target is None:
+        return None
+    if source == target:
+        return build_result(graph, [source], 0.0, 1)
+
+    use_heuristic = use_heuristic and graph.has_coordinates and graph.heuristic_scale > 0
+    if use_heuristic:
+        # Average of the forward and backward heuristics keeps both searches
+        # consistent, so the usual meet-in-the-middle stopping rule holds.
+        def potential(v):
+            return (graph.straight_line(v, target) - graph.straight_line(source, v)) / 2
+    else:
+        def potential(v):
+            return 0.0
+
+    reverse = graph.reverse
+    directions = (
+        (graph.offsets, graph.targets, graph.weights, 1),
+        (reverse[0], reverse[1], reverse[2], -1),
+    )
+    distances = ({source: 0.0}, {target: 0.0})
+    predecessors = ({}, {})
+    settled = (set(), set())
+    heaps = ([(0.0, source)], [(0.0, target)])
+    heappush, heappop = heapq.heappush, heapq.heappop
+    best, meeting = math.inf, None
+    pushes = 2
+    # Reduced keys are offset by these constants on each side
+    offset_forward, offset_backward = -potential(source), potential(target)
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best + offset_forward + offset_backward:
+            break
+        side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+        _, current = heappop(heaps[side])
+        if current in settled[side]:
+            continue
+        settled[side].add(current)
+
+        offsets, targets, weights, sign = directions[side]
+        own, other = distances[side], distances[1 - side]
+        offset = offset_forward if side == 0 else offset_backward
+        current_distance = own[current]
+        for k in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[k]
+            distance = current_distance + weights[k]
+            if distance < own.get(neighbor, math.inf):
+                own[neighbor] = distance
+                predecessors[side][neighbor] = current
+                heappush(heaps[side], (distance + sign * potential(neighbor) + offset, neighbor))
+                pushes += 1
+                if neighbor in other and distance + other[neighbor] < best:
+                    best = distance + other[neighbor]
+                    meeting = neighbor
+
+    _count(len(settled[0]) + len(settled[1]), pushes)
+    if meeting is None:
+        return None
+    path = unwind(predecessors[0], source, meeting)
+    tail = meeting
+    while tail != target:
+        tail = predecessors[1][tail]
+        path.append(tail)
+    return build_result(graph, path, best, len(settled[0]) + len(settled[1]))
+
+
+STRATEGIES = {
+    'dijkstra': dijkstra,
+    'astar': astar,
+    'bidirectional': bidirectional,
+    'bidirectional_astar': lambda graph, start, end: bidirectional(graph, start, end, use_heuristic=True),
+    'ch': lambda graph, start, end: (graph.contraction.route(graph, start, end) if graph.contraction is not None
+                                     else bidirectional(graph, start, end)),
+}
+
+
+def search(graph, start, end, strategy='auto'):
+    """Run the named search strategy; 'auto' picks the contraction hierarchy
+    when the graph has one, else A* when coordinates allow. Graphs with a
+    precomputed all-pairs table skip the search entirely."""
+    if strategy != 'auto' and strategy not in STRATEGIES:
+        raise ValueError(f"Unknown routing strategy: {strategy}")
+    if unreachable(graph, start, end):
+        return None  # without exhausting the start's component
+    if graph.all_pairs is not None:
+        return graph.all_pairs.route(graph, start, end)
+    if strategy == 'auto':
+        if graph.contraction is not None:
+            strategy = 'ch'
+        else:
+            strategy = 'astar' if graph.has_coordinates else 'bidirectional'
+    return STRATEGIES[strategy](graph, start, end)
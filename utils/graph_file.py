@@ -0,0 +1,200 @@
+import json
+import mmap
+import struct
+from array import array
+
+from utils.graph import CompiledGraph
+from utils.graph_store import atomic_write
+
+MAGIC = b'CNGR'
+FORMAT_VERSION = 2
+# magic, format version, has coordinates, key length, nodes, edges, heuristic scale
+HEADER = struct.Struct('<4sHHIIId')
+
+
+class StringTable:
+    """Read-only sequence of strings stored as offsets into a UTF-8 blob
+
+    The blob may be the whole mapping with the strings starting at base;
+    slicing an mmap yields bytes directly, without an intermediate view.
+    """
+
+    def __init__(self, offsets, blob, base=0):
+        self.offsets = offsets
+        self.blob = blob
+        self.base = base
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, i):
+        """UTF-8 bytes of string i"""
+        return self.blob[self.base + self.offsets[i]:self.base + self.offsets[i + 1]]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return str(self.raw(i), 'utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class NodeTable(StringTable):
+    """Node dicts kept as JSON bytes and decoded on access; routing needs
+    only the numeric columns, so this is for building responses"""
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return json.loads(self.raw(i))
+
+
+class IdIndex:
+    """Node id -> interned index by binary search over ids sorted on disk
+
+    Probes compare raw UTF-8 bytes, whose order matches the ids' string
+    order, so only the id being looked up is encoded.
+    """
+
+    def __init__(self, ids, order):
+        self.ids = ids
+        self.order = order
+
+    def get(self, node_id, default=None):
+        if not isinstance(node_id, str):
+            return default
+        try:
+            key = node_id.encode('utf-8')
+        except UnicodeEncodeError:
+            return default  # lone surrogates: not an id that could be stored
+        # bisect_left, inlined: a probe is one slice of the mapping
+        order, offsets, blob, base = self.order, self.ids.offsets, self.ids.blob, self.ids.base
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            i = order[middle]
+            if blob[base + offsets[i]:base + offsets[i + 1]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(order):
+            i = order[low]
+            if blob[base + offsets[i]:base + offsets[i + 1]] == key:
+                return i
+        return default
+
+    def __getitem__(self, node_id):
+        i = self.get(node_id)
+        if i is None:
+            raise KeyError(node_id)
+        return i
+
+    def __contains__(self, node_id):
+        return self.get(node_id) is not None
+
+    def __len__(self):
+        return len(self.order)
+
+
+def _blob(strings):
+    offsets = array('q', [0])
+    parts = []
+    for text in strings:
+        encoded = text.encode('utf-8')
+        parts.append(encoded)
+        offsets.append(offsets[-1] + len(encoded))
+    return offsets, b''.join(parts)
+
+
+def _pad(payload):
+    return payload + b'\0' * (-len(payload) % 8)
+
+
+def save(graph, path, key):
+    """Write a compiled graph as a flat, mmap-friendly binary file
+
+    Layout after the header and key (every section 8-byte aligned): xs, ys,
+    floors, CSR offsets/targets/weights, id offsets + UTF-8 ids, ids' sort
+    order, node offsets + per-node JSON.
+    """
+    n = len(graph)
+    key = key.encode('utf-8')
+    id_offsets, id_blob = _blob(graph.ids)
+    node_offsets, node_blob = _blob(json.dumps(node, separators=(',', ':')) for node in graph.node_data)
+    order = array('i', sorted(range(n), key=lambda i: graph.ids[i].encode('utf-8')))
+
+    sections = [
+        _pad(HEADER.pack(MAGIC, FORMAT_VERSION, int(graph.has_coordinates), len(key), n,
+                         graph.edge_count, graph.heuristic_scale) + key),
+        array('d', graph.xs).tobytes(),
+        array('d', graph.ys).tobytes(),
+        array('q', graph.floors).tobytes(),
+        array('q', graph.offsets).tobytes(),
+        _pad(array('i', graph.targets).tobytes()),
+        array('d', graph.weights).tobytes(),
+        id_offsets.tobytes(),
+        _pad(id_blob),
+        _pad(order.tobytes()),
+        node_offsets.tobytes(),
+        node_blob
+    ]
+    atomic_write(path, b''.join(sections))
+
+
+def load(path, key):
+    """Memory-map a binary graph, or return None if it is missing or stale
+
+    Arrays are views into the mapping, so every worker process shares the
+    same pages through the OS page cache instead of holding its own copy.
+    """
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(buffer) < HEADER.size:
+        return None
+
+    magic, version, has_coordinates, key_length, n, m, heuristic_scale = HEADER.unpack_from(buffer)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    if bytes(buffer[HEADER.size:HEADER.size + key_length]) != key.encode('utf-8'):
+        return None
+
+    view = memoryview(buffer)
+    position = HEADER.size + key_length
+    position += -position % 8
+
+    def take(fmt, count, size):
+        nonlocal position
+        start = position
+        if start + size * count > len(buffer):
+            raise ValueError('truncated graph file')
+        position += size * count
+        position += -position % 8
+        return view[start:start + size * count].cast(fmt)
+
+    try:
+        xs = take('d', n, 8)
+        ys = take('d', n, 8)
+        floors = take('q', n, 8)
+        offsets = take('q', n + 1, 8)
+        targets = take('i', m, 4)
+        weights = take('d', m, 8)
+        id_offsets = take('q', n + 1, 8)
+        id_base = position
+        take('B', id_offsets[n], 1)
+        order = take('i', n, 4)
+        node_offsets = take('q', n + 1, 8)
+        node_base = position
+        take('B', node_offsets[n], 1)
+    except (TypeError, ValueError):
+        return None
+
+    # Strings are sliced from the mapping itself, straight to bytes
+    ids = StringTable(id_offsets, buffer, id_base)
+    return CompiledGraph.from_parts(ids, IdIndex(ids, order), NodeTable(node_offsets, buffer, node_base),
+                                    xs, ys, floors, offsets, targets, weights,
+                                    bool(has_coordinates), heuristic_scale)
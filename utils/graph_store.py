@@ -0,0 +1,342 @@
+import fcntl
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+MAP_NAME = re.compile(r'^[A-Za-z0-9_]+$')
+# Editor deltas apply_op understands
+MAP_OPS = ('add_node', 'update_node', 'move_node', 'delete_node', 'add_edge', 'delete_edge')
+
+
+def atomic_write(path, payload):
+    """Write bytes to path via a fsynced temp file and rename, so readers
+    only ever see the old or the new complete file. The file keeps its
+    permissions (new files get 0644; mkstemp would leave 0600)."""
+    path = Path(path)
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o644
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fchmod(f.fileno(), mode)
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def dump_graph(data):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+# Fields each editor delta needs
+OP_FIELDS = {
+    'add_node': ('id',),
+    'update_node': ('id',),
+    'move_node': ('id', 'x', 'y'),
+    'delete_node': ('id',),
+    'add_edge': ('from', 'to'),
+    'delete_edge': ('from', 'to')
+}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def check_op(op):
+    """Raise ValueError unless op is a delta apply_op can apply"""
+    if not isinstance(op, dict) or op.get('op') not in OP_FIELDS:
+        raise ValueError(f"Unknown map operation: {op.get('op') if isinstance(op, dict) else op!r}")
+    for field in OP_FIELDS[op['op']]:
+        value = op.get(field)
+        if field in ('x', 'y'):
+            if not _is_number(value):
+                raise ValueError(f"{op['op']}: {field} must be a number")
+        elif not isinstance(value, str) or not value:
+            raise ValueError(f"{op['op']}: {field} must be a node id")
+    if not isinstance(op.get('node') or {}, dict):
+        raise ValueError(f"{op['op']}: node must be an object")
+    weight = op.get('weight')
+    if weight is not None and not (_is_number(weight) and weight >= 0):
+        raise ValueError(f"{op['op']}: weight must be a non-negative number or null")
+
+
+def check_graph(data):
+    """Raise ValueError unless data is a {'nodes': {...}, 'edges': {...}} map"""
+    nodes, edges = data.get('nodes'), data.get('edges')
+    if not isinstance(nodes, dict) or not isinstance(edges, dict):
+        raise ValueError("nodes and edges must be objects")
+    if not all(isinstance(node, dict) for node in nodes.values()):
+        raise ValueError("Every node must be an object")
+    for neighbors in edges.values():
+        if isinstance(neighbors, dict):
+            if not all(weight is None or (_is_number(weight) and weight >= 0) for weight in neighbors.values()):
+                raise ValueError("Edge weights must be non-negative numbers or null")
+        elif not isinstance(neighbors, list) or not all(isinstance(node_id, str) for node_id in neighbors):
+            raise ValueError("Edges must map node ids to {neighbor: weight} or [neighbor, ...]")
+
+
+def apply_op(data, op):
+    """Apply one editor delta to a {'nodes', 'edges'} dict in place
+
+    Only the top-level dicts change: node and neighbor entries are
+    replaced, never modified, so graphs compiled from them are unaffected.
+    """
+    nodes = data.setdefault('nodes', {})
+    edges = data.setdefault('edges', {})
+    kind = op.get('op')
+
+    if kind in ('add_node', 'update_node'):
+        node_id = op['id']
+        nodes[node_id] = dict(nodes.get(node_id) or {}, **(op.get('node') or {}))
+    elif kind == 'move_node':
+        node = nodes.get(op['id'])
+        if node is not None:
+            nodes[op['id']] = dict(node, x=op['x'], y=op['y'])
+    elif kind == 'delete_node':
+        node_id = op['id']
+        nodes.pop(node_id, None)
+        edges.pop(node_id, None)
+        for source, neighbors in list(edges.items()):
+            if node_id in neighbors:
+                edges[source] = _without(neighbors, node_id)
+    elif kind == 'add_edge':
+        source, target = op['from'], op['to']
+        neighbors = edges.get(source)
+        if isinstance(neighbors, list):
+            if target not in neighbors:
+                edges[source] = neighbors + [target]
+        else:
+            neighbors = dict(neighbors or {})
+            neighbors[target] = op.get('weight')
+            edges[source] = neighbors
+    elif kind == 'delete_edge':
+        neighbors = edges.get(op['from'])
+        if neighbors is not None and op['to'] in neighbors:
+            edges[op['from']] = _without(neighbors, op['to'])
+    else:
+        raise ValueError(f"Unknown map operation: {kind}")
+
+
+def _without(neighbors, node_id):
+    if isinstance(neighbors, dict):
+        return {neighbor: weight for neighbor, weight in neighbors.items() if neighbor != node_id}
+    return [neighbor for neighbor in neighbors if neighbor != node_id]
+
+
+class GraphStore:
+    """Map graphs on disk: an atomically replaced JSON snapshot per map plus
+    an append-only journal of editor deltas, compacted into the snapshot
+
+    The last state read or written of each map is kept in memory, tagged
+    with the files' (inode, mtime, size), so a patch is validated and
+    applied against it rather than re-reading the map; another worker
+    writing the files shows up as a changed stamp and a fresh read.
+    """
+
+    def __init__(self, data_folder, compact_after=200):
+        self.data_folder = Path(data_folder)
+        self.compact_after = compact_after
+        self._current = {}  # map name -> _MapState
+
+    def graph_path(self, map_name):
+        if not MAP_NAME.match(map_name or ''):
+            raise ValueError(f"Invalid map name: {map_name!r}")
+        return self.data_folder / f'{map_name}_nodes.json'
+
+    def journal_path(self, map_name):
+        return self.data_folder / f'{map_name}_nodes.journal'
+
+    @contextmanager
+    def locked(self, map_name):
+        """Hold the cross-process write lock of a map, or of another file
+        kept beside the maps (e.g. 'overlay'); readers never block"""
+        lock_path = self.data_folder / f'.{map_name}_nodes.lock'
+        with open(lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _stamp(self, map_name):
+        stamp = []
+        for path in (self.graph_path(map_name), self.journal_path(map_name)):
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _fresh(self, map_name):
+        """The in-memory state of a map if the files have not changed since"""
+        state = self._current.get(map_name)
+        if state is not None and state.stamp == self._stamp(map_name):
+            return state
+        return None
+
+    def load(self, map_name, default_data=None):
+        """Return (data, version) with the journal replayed onto the snapshot
+
+        A missing file is created from default_data. The version is a hash
+        of snapshot and journal bytes, or None if the snapshot is corrupt.
+        The data is the caller's own copy.
+        """
+        state = self._fresh(map_name)
+        if state is None:
+            state = self._read(map_name, default_data)
+            if state.version is None:
+                return _copy(default_data or {'nodes': {}, 'edges': {}}), None
+        return _copy(state.data), state.version
+
+    def current(self, map_name):
+        """(data, version) of a map as last read or written, without copying
+
+        The data must not be modified; later patches replace its nodes and
+        edges dicts rather than changing them.
+        """
+        state = self._fresh(map_name) or self._read(map_name)
+        return state.data, state.version
+
+    def _read(self, map_name, default_data=None):
+        default_data = default_data or {'nodes': {}, 'edges': {}}
+        path = self.graph_path(map_name)
+        if not path.exists():
+            atomic_write(path, dump_graph(default_data))
+
+        # Stamped before reading: a write in between only costs a re-read
+        stamp = self._stamp(map_name)
+        raw = path.read_bytes()
+        if raw:
+            try:
+                data = json.loads(raw)
+            except ValueError:
+                return _MapState(stamp, None, None, 0, 0)
+        else:
+            data = _copy(default_data)
+
+        journal = b''
+        journal_path = self.journal_path(map_name)
+        if journal_path.exists():
+            journal = journal_path.read_bytes()
+            for line in journal.splitlines():
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    continue  # torn final line from a crash mid-append
+                apply_op(data, op)
+
+        state = _MapState(stamp, data, hashlib.sha1(raw + journal), len(raw) + len(journal), journal.count(b'\n'))
+        self._current[map_name] = state
+        return state
+
+    def version(self, map_name):
+        """The version load() would report, from file bytes alone (no JSON
+        parsing); None if the snapshot does not exist yet"""
+        state = self._fresh(map_name)
+        if state is not None and state.data is not None:
+            return state.version
+        try:
+            raw = self.graph_path(map_name).read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            journal = self.journal_path(map_name).read_bytes()
+        except FileNotFoundError:
+            journal = b''
+        return _version(raw, journal)
+
+    def save(self, map_name, data):
+        """Replace a map's snapshot atomically and drop its journal"""
+        check_graph(data)
+        path = self.graph_path(map_name)
+        payload = dump_graph(data)
+        with self.locked(map_name):
+            atomic_write(path, payload)
+            self._drop_journal(map_name)
+            self._current[map_name] = _MapState(self._stamp(map_name), _copy(data), hashlib.sha1(payload),
+                                                len(payload), 0)
+
+    def patch(self, map_name, ops):
+        """Append editor deltas to the journal, compacting when it grows long
+
+        Every op is checked before anything is applied or written. Returns
+        (data, version) as for current().
+        """
+        for op in ops:
+            check_op(op)
+        self.graph_path(map_name)
+        with self.locked(map_name):
+            state = self._fresh(map_name) or self._read(map_name)
+            if state.version is None:
+                raise ValueError(f"{map_name} is unreadable; save the whole map instead")
+            data = {'nodes': dict(state.data.get('nodes') or {}), 'edges': dict(state.data.get('edges') or {})}
+            for op in ops:
+                apply_op(data, op)
+
+            lines = b''.join(json.dumps(op, separators=(',', ':')).encode('utf-8') + b'\n' for op in ops)
+            with open(self.journal_path(map_name), 'ab') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            digest = state.digest.copy()
+            digest.update(lines)
+            size, entries = state.size + len(lines), state.entries + len(ops)
+
+            if entries >= self.compact_after:
+                payload = dump_graph(data)
+                atomic_write(self.graph_path(map_name), payload)
+                self._drop_journal(map_name)
+                digest, size, entries = hashlib.sha1(payload), len(payload), 0
+            state = self._current[map_name] = _MapState(self._stamp(map_name), data, digest, size, entries)
+        return state.data, state.version
+
+    def _drop_journal(self, map_name):
+        try:
+            os.unlink(self.journal_path(map_name))
+        except FileNotFoundError:
+            pass
+
+
+class _MapState:
+    """One map's replayed data with the stamp of the files it came from, a
+    running hash and length of their bytes and the journal's entry count"""
+
+    def __init__(self, stamp, data, digest, size, entries):
+        self.stamp = stamp
+        self.data = data
+        self.digest = digest
+        self.size = size
+        self.entries = entries
+
+    @property
+    def version(self):
+        """Same as _version() of the files' bytes; None if unreadable"""
+        if self.data is None:
+            return None
+        if not self.size:
+            return 'empty'
+        return self.digest.hexdigest()[:16]
+
+
+def _version(raw, journal):
+    if not raw and not journal:
+        return 'empty'
+    return hashlib.sha1(raw + journal).hexdigest()[:16]
+
+
+def _copy(data):
+    return json.loads(json.dumps(data))
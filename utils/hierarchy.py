@@ -0,0 +1,372 @@
+import heapq
+import math
+
+from utils import graph as graphs
+from utils.graph import node_floor
+
+# Node types that join floors, mapped to the cost setting they use
+CONNECTOR_TYPES = {
+    'staircase': 'stairs',
+    'stairs': 'stairs',
+    'elevator': 'elevator',
+    'lift': 'elevator'
+}
+
+
+def link_floors(data, stair_cost, elevator_cost):
+    """Return a copy of a building graph with stairs/elevators joined across floors
+
+    Connector nodes of the same kind that share a 'shaft' (or, failing
+    that, a name) are linked between consecutive floors. Explicit edges
+    between floors get a per-floor cost instead of their planar length.
+    """
+    nodes = data.get('nodes') or {}
+    edges = {}
+    for node_id, neighbors in (data.get('edges') or {}).items():
+        if isinstance(neighbors, dict):
+            edges[node_id] = dict(neighbors)
+        else:
+            edges[node_id] = {neighbor: None for neighbor in neighbors}
+
+    def floor_cost(a, b):
+        kinds = {CONNECTOR_TYPES.get(nodes[a].get('type')), CONNECTOR_TYPES.get(nodes[b].get('type'))}
+        per_floor = elevator_cost if 'elevator' in kinds else stair_cost
+        return per_floor * abs(node_floor(nodes[a]) - node_floor(nodes[b]))
+
+    for a, neighbors in edges.items():
+        for b, weight in neighbors.items():
+            if weight is None and a in nodes and b in nodes and node_floor(nodes[a]) != node_floor(nodes[b]):
+                neighbors[b] = floor_cost(a, b)
+
+    shafts = {}
+    for node_id, node in nodes.items():
+        kind = CONNECTOR_TYPES.get(node.get('type'))
+        shaft = node.get('shaft') or node.get('name')
+        if kind and shaft:
+            shafts.setdefault((kind, shaft), []).append(node_id)
+
+    for members in shafts.values():
+        members.sort(key=lambda node_id: node_floor(nodes[node_id]))
+        for a, b in zip(members, members[1:]):
+            if node_floor(nodes[a]) == node_floor(nodes[b]):
+                continue
+            cost = floor_cost(a, b)
+            edges.setdefault(a, {}).setdefault(b, cost)
+            edges.setdefault(b, {}).setdefault(a, cost)
+
+    return {'nodes': nodes, 'edges': edges}
+
+
+class CampusRouter:
+    """Routes across the campus and building graphs through shared entrance
+    nodes, combining small local searches with an entrance distance table"""
+
+    def __init__(self, maps, previous=None):
+        # maps: {'campus': CompiledGraph, 'building_A': CompiledGraph, ...}
+        self.maps = maps
+        campus = maps.get('campus')
+
+        # Portals are nodes present in both the campus graph and a building graph
+        self.portals = {}
+        for map_name, graph in maps.items():
+            if map_name == 'campus' or campus is None:
+                continue
+            for node_id in graph.ids:
+                if node_id in campus:
+                    self.portals.setdefault(node_id, []).append(map_name)
+        self.map_portals = {map_name: [] for map_name in maps}
+        for node_id, map_names in self.portals.items():
+            self.map_portals['campus'].append(node_id)
+            for map_name in map_names:
+                self.map_portals[map_name].append(node_id)
+
+        self._build_table(previous)
+
+    def _build_table(self, previous=None):
+        """Precompute portal-to-portal distances over all maps
+
+        Local legs of maps whose graph and portals are unchanged since the
+        previous router are reused rather than searched again.
+        """
+        # Local legs: shortest path between two portals inside one map
+        self.map_legs = {}
+        for map_name, portal_ids in self.map_portals.items():
+            graph = self.maps[map_name]
+            if (previous is not None and previous.maps.get(map_name) is graph
+                    and previous.map_portals.get(map_name) == portal_ids):
+                self.map_legs[map_name] = previous.map_legs[map_name]
+                continue
+            legs = self.map_legs[map_name] = {}
+            indices = [graph.index[p] for p in portal_ids]
+            connectivity = graph.connectivity
+            for p, source in zip(portal_ids, indices):
+                reachable = [i for i in indices if connectivity.may_reach(source, i)]
+                distances, predecessors, _ = graphs.single_source(graph, source, stop_at=reachable)
+                for q, target in zip(portal_ids, indices):
+                    if p != q and target in distances:
+                        path = [graph.ids[i] for i in graphs.unwind(predecessors, source, target)]
+                        legs[(p, q)] = (distances[target], map_name, path)
+
+        self.legs = {}
+        for legs in self.map_legs.values():
+            for pair, leg in legs.items():
+                if pair not in self.legs or leg[0] < self.legs[pair][0]:
+                    self.legs[pair] = leg
+
+        outgoing = {}
+        for (p, q), (distance, _, _) in self.legs.items():
+            outgoing.setdefault(p, []).append((q, distance))
+
+        # table[p][q] = (distance, previous portal) over the leg overlay
+        self.table = {}
+        for source in self.portals:
+            best = {source: (0.0, None)}
+            heap = [(0.0, source)]
+            while heap:
+                distance, current = heapq.heappop(heap)
+                if distance > best[current][0]:
+                    continue
+                for neighbor, weight in outgoing.get(current, ()):
+                    if distance + weight < best.get(neighbor, (math.inf, None))[0]:
+                        best[neighbor] = (distance + weight, current)
+                        heapq.heappush(heap, (distance + weight, neighbor))
+            self.table[source] = best
+
+        # Portal pairs of a map that are closer through other maps than
+        # inside it (or only connected that way). Routes within a map can
+        # only gain by leaving and coming back between such a pair.
+        # For those, in-map distances to each exit and from each entry of a
+        # pair price a detour with lookups instead of two searches.
+        self.shortcuts = {}
+        self.portal_distances = {}
+        for map_name, portal_ids in self.map_portals.items():
+            legs = self.map_legs[map_name]
+            pairs = [(p, q) for p in portal_ids for q in portal_ids if p != q and q in self.table[p]
+                     and self.table[p][q][0] < legs.get((p, q), (math.inf,))[0]]
+            if not pairs:
+                continue
+            self.shortcuts[map_name] = pairs
+            graph = self.maps[map_name]
+            if previous is not None and previous.maps.get(map_name) is graph \
+                    and previous.shortcuts.get(map_name) == pairs:
+                self.portal_distances[map_name] = previous.portal_distances[map_name]
+                continue
+            to_exit = {p: graphs.single_source(graph, graph.index[p], reverse=True)[0] for p, _ in pairs}
+            from_entry = {q: graphs.single_source(graph, graph.index[q])[0] for _, q in pairs}
+            self.portal_distances[map_name] = (to_exit, from_entry)
+
+    def resolve(self, node_id):
+        """Name of the map a node id belongs to, or None"""
+        for map_name, graph in self.maps.items():
+            if map_name != 'campus' and node_id.startswith(map_name + '_') and node_id in graph:
+                return map_name
+        if 'campus' in self.maps and node_id in self.maps['campus']:
+            return 'campus'
+        owners = [name for name, graph in self.maps.items() if node_id in graph]
+        return owners[0] if len(owners) == 1 else None
+
+    def route(self, start, end, strategy='auto'):
+        """Shortest route between any two nodes on campus or in buildings
+
+        Trips within one map are answered by a local search on that map,
+        unless leaving it through one portal and coming back through
+        another is shorter (or the only way); trips between maps leave and
+        enter through portals via the table.
+        """
+        if strategy != 'auto' and strategy not in graphs.STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+
+        start_map, end_map = self.resolve(start), self.resolve(end)
+        if start_map is None or end_map is None:
+            return None
+
+        if start_map == end_map:
+            result = graphs.search(self.maps[start_map], start, end, strategy)
+            if start_map in self.shortcuts:
+                distance, pair = self._best_detour(start_map, start, end)
+                if pair is not None and (result is None or distance < result['distance']):
+                    return self._route_across(start, start_map, end, end_map, [pair])
+            if result:
+                result['segments'] = self._segments([(start_map, result['path'])])
+            return result
+
+        return self._route_across(start, start_map, end, end_map)
+
+    def _route_across(self, start, start_map, end, end_map, pairs=None):
+        if not self.map_portals[start_map] or not self.map_portals[end_map]:
+            return None
+        # Cut off from every portal on either side: no search needed
+        if not self._reaches_portal(start_map, start) or not self._reaches_portal(end_map, end, reverse=True):
+            return None
+        outbound = self._search_to_portals(start_map, start)
+        inbound = self._search_to_portals(end_map, end, reverse=True)
+        best, exit_portal, entry_portal = self._best_crossing(start_map, outbound, end_map, inbound, pairs)
+        if exit_portal is None:
+            return None
+        legs = self._crossing_legs(start_map, outbound, exit_portal, end_map, inbound, entry_portal)
+        return self._result(legs, best, outbound[3] + inbound[3])
+
+    def _best_detour(self, map_name, start, end):
+        """(distance, (exit, entry)) of the cheapest way from start to end
+        that leaves the map and comes back, or (inf, None)"""
+        graph = self.maps[map_name]
+        source, target = graph.index[start], graph.index[end]
+        to_exit, from_entry = self.portal_distances[map_name]
+        best, pair = math.inf, None
+        for p, q in self.shortcuts[map_name]:
+            head = to_exit[p].get(source)
+            tail = from_entry[q].get(target)
+            if head is not None and tail is not None and head + self.table[p][q][0] + tail < best:
+                best, pair = head + self.table[p][q][0] + tail, (p, q)
+        return best, pair
+
+    def _reaches_portal(self, map_name, node_id, reverse=False):
+        """False if component labels show no portal of the map can be reached
+        from the node (or, reversed, can reach it)"""
+        graph = self.maps[map_name]
+        source = graph.index[node_id]
+        connectivity = graph.connectivity
+        for portal in self.map_portals[map_name]:
+            i = graph.index[portal]
+            if connectivity.may_reach(i, source) if reverse else connectivity.may_reach(source, i):
+                return True
+        return False
+
+    def _search_to_portals(self, map_name, node_id, reverse=False, extra=()):
+        """Local search from a node until its map's portals (and any extra
+        interned targets) are settled; returns (source, distances, predecessors, settled)"""
+        graph = self.maps[map_name]
+        source = graph.index[node_id]
+        stop_at = [graph.index[p] for p in self.map_portals[map_name]]
+        stop_at.extend(extra)
+        # Waiting for a node the search can never reach would settle the
+        # whole component, so drop those up front
+        connectivity = graph.connectivity
+        if reverse:
+            stop_at = [i for i in stop_at if connectivity.may_reach(i, source)]
+        else:
+            stop_at = [i for i in stop_at if connectivity.may_reach(source, i)]
+        distances, predecessors, settled = graphs.single_source(graph, source, stop_at=stop_at, reverse=reverse)
+        return source, distances, predecessors, settled
+
+    def _best_crossing(self, start_map, outbound, end_map, inbound, pairs=None):
+        """Cheapest (distance, exit portal, entry portal) combination, out of
+        every portal pair or only the given (exit, entry) pairs"""
+        start_graph, end_graph = self.maps[start_map], self.maps[end_map]
+        out_distances, in_distances = outbound[1], inbound[1]
+        if pairs is None:
+            pairs = [(p, q) for p in self.map_portals[start_map] for q in self.map_portals[end_map]]
+        best, exit_portal, entry_portal = math.inf, None, None
+        for p, q in pairs:
+            head = out_distances.get(start_graph.index[p])
+            tail = in_distances.get(end_graph.index[q])
+            if head is None or tail is None or q not in self.table[p]:
+                continue
+            total = head + self.table[p][q][0] + tail
+            if total < best:
+                best, exit_portal, entry_portal = total, p, q
+        return best, exit_portal, entry_portal
+
+    def _crossing_legs(self, start_map, outbound, exit_portal, end_map, inbound, entry_portal):
+        """Unpack a crossing into (map name, [node ids]) legs"""
+        start_graph, end_graph = self.maps[start_map], self.maps[end_map]
+        legs = []
+        head_path = graphs.unwind(outbound[2], outbound[0], start_graph.index[exit_portal])
+        legs.append((start_map, [start_graph.ids[i] for i in head_path]))
+
+        overlay = []
+        current = entry_portal
+        while current != exit_portal:
+            previous = self.table[exit_portal][current][1]
+            overlay.append(self.legs[(previous, current)])
+            current = previous
+        for _, map_name, path in reversed(overlay):
+            legs.append((map_name, path))
+
+        tail_path = graphs.unwind(inbound[2], inbound[0], end_graph.index[entry_portal])
+        legs.append((end_map, [end_graph.ids[i] for i in reversed(tail_path)]))
+        return legs
+
+    def _result(self, legs, distance, settled):
+        path, nodes = [], []
+        for map_name, leg in legs:
+            graph = self.maps[map_name]
+            for node_id in leg[1:] if path else leg:
+                path.append(node_id)
+                nodes.append(graph.node_data[graph.index[node_id]])
+        return {
+            'path': path,
+            'distance': distance,
+            'nodes': nodes,
+            'settled': settled,
+            'segments': self._segments(legs)
+        }
+
+    def matrix(self, sources, targets, include_paths=False):
+        """Distances from every source to every target, one search per source
+
+        Reverse searches from each target to its portals are shared by
+        all sources. Returns (distances, paths) as row-per-source lists,
+        with None where a target is unreachable; paths is None unless
+        include_paths is set.
+        """
+        target_maps = [self.resolve(t) for t in targets]
+        inbound = {}
+        for t, map_name in zip(targets, target_maps):
+            if map_name is not None and t not in inbound and self.map_portals[map_name]:
+                inbound[t] = self._search_to_portals(map_name, t, reverse=True)
+
+        distances, paths = [], [] if include_paths else None
+        for s in sources:
+            row = [None] * len(targets)
+            path_row = [None] * len(targets)
+            start_map = self.resolve(s)
+            if start_map is not None:
+                graph = self.maps[start_map]
+                local = [graph.index[t] for t, m in zip(targets, target_maps) if m == start_map]
+                outbound = self._search_to_portals(start_map, s, extra=local)
+                for column, (t, end_map) in enumerate(zip(targets, target_maps)):
+                    if end_map is None:
+                        continue
+                    if end_map == start_map:
+                        target = graph.index[t]
+                        if target in outbound[1]:
+                            row[column] = outbound[1][target]
+                            if include_paths:
+                                path_row[column] = [graph.ids[i] for i in graphs.unwind(outbound[2], outbound[0], target)]
+                        if start_map in self.shortcuts and t in inbound:
+                            best, p, q = self._best_crossing(start_map, outbound, end_map, inbound[t],
+                                                             self.shortcuts[start_map])
+                            if p is not None and (row[column] is None or best < row[column]):
+                                row[column] = best
+                                if include_paths:
+                                    legs = self._crossing_legs(start_map, outbound, p, end_map, inbound[t], q)
+                                    path_row[column] = self._result(legs, best, 0)['path']
+                    elif t in inbound and self.map_portals[start_map]:
+                        best, p, q = self._best_crossing(start_map, outbound, end_map, inbound[t])
+                        if p is not None:
+                            row[column] = best
+                            if include_paths:
+                                legs = self._crossing_legs(start_map, outbound, p, end_map, inbound[t], q)
+                                path_row[column] = self._result(legs, best, 0)['path']
+            distances.append(row)
+            if include_paths:
+                paths.append(path_row)
+        return distances, paths
+
+    def _segments(self, legs):
+        """Split a route into per-map, per-floor runs of path indices"""
+        labels = []
+        for map_name, leg in legs:
+            graph = self.maps[map_name]
+            for node_id in leg[1:] if labels else leg:
+                floor = None if map_name == 'campus' else graph.floors[graph.index[node_id]]
+                labels.append((map_name, floor))
+
+        segments = []
+        for position, (map_name, floor) in enumerate(labels):
+            if segments and segments[-1]['map'] == map_name and segments[-1]['floor'] == floor:
+                segments[-1]['end'] = position
+            else:
+                segments.append({'map': map_name, 'floor': floor, 'start': position, 'end': position})
+        return segments
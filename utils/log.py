@@ -0,0 +1,109 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+ROOT = 'campus_nav'
+# Attributes every LogRecord has; anything else came in through extra=
+STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def get_logger(name):
+    """Logger under the app's namespace, e.g. get_logger(__name__)"""
+    return logging.getLogger(f'{ROOT}.{name}')
+
+
+class StructuredFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and extra= fields"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass at most `burst` records per message template every `interval`
+    seconds; the first record of the next window carries the dropped count"""
+
+    def __init__(self, burst=20, interval=60.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}  # (logger, template) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                if window is not None and window[2]:
+                    record.suppressed = window[2]
+                window = self._windows[key] = [now, 0, 0]
+            if window[1] >= self.burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: records are dropped (and counted) when the
+    queue to the writer thread is full"""
+
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def init_app(app):
+    """Route the app's loggers through a bounded queue to a writer thread"""
+    global _listener
+    logger = logging.getLogger(ROOT)
+    if app.config.get('LOG_DEBUG'):
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(getattr(logging, str(app.config.get('LOG_LEVEL', 'INFO')).upper(), logging.INFO))
+    if _listener is not None:
+        return  # one writer per process, shared by every app instance
+
+    if app.config.get('LOG_FILE'):
+        output = logging.FileHandler(app.config['LOG_FILE'])
+    else:
+        output = logging.StreamHandler()
+    if app.config.get('LOG_FORMAT', 'json') == 'json':
+        output.setFormatter(StructuredFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    records = queue.Queue(app.config.get('LOG_QUEUE_SIZE', 10000))
+    handler = DroppingQueueHandler(records)
+    handler.addFilter(RateLimitFilter(app.config.get('LOG_RATE_LIMIT', 20)))
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # drains what is still queued
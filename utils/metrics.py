@@ -0,0 +1,193 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils.log import get_logger
+from utils.profiler import SlowRequestSampler
+
+logger = get_logger(__name__)
+
+# Seconds; tuned for web requests and in-process searches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = (f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + ','.join(pairs) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """Monotonic count, optionally split by label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, _labels(self.labels, label_values), value
+
+
+class Histogram:
+    """Bucketed distribution of observations, per label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - began, *label_values)
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        names = self.labels + ('le',)
+        for label_values, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                yield f'{self.name}_bucket', _labels(names, label_values + (bound,)), cumulative
+            yield f'{self.name}_sum', _labels(self.labels, label_values), total
+            yield f'{self.name}_count', _labels(self.labels, label_values), count
+
+
+class Callback:
+    """Values read from elsewhere (e.g. cache statistics) at scrape time"""
+
+    def __init__(self, name, help, kind, read, labels=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.read = read  # returns {label values tuple: value}
+        self.labels = labels
+
+    def samples(self):
+        for label_values, value in sorted(self.read().items()):
+            yield self.name, _labels(self.labels, label_values), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        # Re-registering (e.g. a second app in tests) replaces the old reader
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics are per process; with several gunicorn workers each one reports its own
+REGISTRY = Registry()
+
+request_seconds = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests', labels=('endpoint', 'method')))
+requests_total = REGISTRY.register(Counter(
+    'http_requests_total', 'Requests handled', labels=('endpoint', 'status')))
+db_queries = REGISTRY.register(Histogram(
+    'db_queries_per_request', 'SQL statements executed per request', labels=('endpoint',),
+    buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100)))
+search_seconds = REGISTRY.register(Histogram(
+    'route_search_duration_seconds', 'Time computing routes (cache misses only)', labels=('strategy',)))
+serialize_seconds = REGISTRY.register(Histogram(
+    'route_serialize_duration_seconds', 'Time turning route results into responses', labels=('endpoint',)))
+search_settled = REGISTRY.register(Histogram(
+    'route_search_settled_nodes', 'Nodes settled per route search', buckets=COUNT_BUCKETS))
+search_pushes = REGISTRY.register(Histogram(
+    'route_search_heap_pushes', 'Priority queue pushes per route search', buckets=COUNT_BUCKETS))
+graph_load_seconds = REGISTRY.register(Histogram(
+    'graph_load_duration_seconds', 'Time loading one map graph, by stage', labels=('map', 'stage')))
+
+
+def _count_query(*args):
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+
+
+def init_app(app):
+    """Time every request, count its SQL statements and optionally profile
+    the slow ones with a sampling profiler"""
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+
+    sampler = None
+    if app.config.get('SLOW_REQUEST_PROFILE_MS'):
+        sampler = SlowRequestSampler(app.config['SLOW_REQUEST_PROFILE_MS'] / 1000,
+                                     folder=app.config.get('SLOW_REQUEST_PROFILE_FOLDER'))
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        if sampler is not None:
+            sampler.begin(f'{request.method} {request.path}')
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' not in g:
+            return response  # an earlier hook answered before the timer started
+        endpoint = request.endpoint or 'unmatched'
+        request_seconds.observe(time.perf_counter() - g.request_started, endpoint, request.method)
+        requests_total.inc(endpoint, response.status_code)
+        db_queries.observe(g.db_queries, endpoint)
+        return response
+
+    @app.teardown_request
+    def finish_sampling(error=None):
+        if sampler is not None:
+            report = sampler.end()
+            if report:
+                logger.warning(report, extra={'endpoint': request.endpoint})
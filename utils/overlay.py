@@ -0,0 +1,169 @@
+import hashlib
+import json
+import math
+from array import array
+
+from utils import graph as graphs
+from utils.graph_store import atomic_write
+
+
+def _factor(value):
+    """Weight multiplier of a rule; None (or 'closed') closes the edge"""
+    if value is None or value == 'closed':
+        return None
+    value = float(value)
+    if not value > 0:
+        raise ValueError(f"Weight multiplier must be positive: {value}")
+    return value
+
+
+class Overlay:
+    """Edge closures and weight multipliers layered over the map graphs
+
+    edges: {map name: {(from, to): factor}} for single directed edges.
+    nodes: {map name: {node id: factor}} for every edge into or out of a
+    node, e.g. a closed stairwell. A factor of None closes the edge.
+    profiles: {name: {node type: factor}} routing profiles; a type rule
+    applies to edges between two nodes of that type, and to edges that
+    change floor from or to one (taking the stairs, the elevator...).
+
+    Nothing is copied until a rule touches a map; then only that map's
+    weight array is, and the ids, coordinates and adjacency are shared.
+    """
+
+    def __init__(self, edges=None, nodes=None, profiles=None):
+        self.edges = edges or {}
+        self.nodes = nodes or {}
+        self.profiles = profiles or {}
+
+    @classmethod
+    def load(cls, path, profiles=None):
+        """Overlay saved at path (missing file: no closures)"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        overlay = cls(profiles=profiles)
+        for rule in data.get('edges', []):
+            overlay.edges.setdefault(rule['map'], {})[(rule['from'], rule['to'])] = _factor(rule.get('factor'))
+        for rule in data.get('nodes', []):
+            overlay.nodes.setdefault(rule['map'], {})[rule['node']] = _factor(rule.get('factor'))
+        return overlay
+
+    def save(self, path):
+        atomic_write(path, json.dumps(self.to_dict(), indent=2).encode('utf-8'))
+
+    def to_dict(self):
+        return {
+            'edges': [{'map': map_name, 'from': a, 'to': b, 'factor': factor}
+                      for map_name, rules in sorted(self.edges.items())
+                      for (a, b), factor in sorted(rules.items())],
+            'nodes': [{'map': map_name, 'node': node_id, 'factor': factor}
+                      for map_name, rules in sorted(self.nodes.items())
+                      for node_id, factor in sorted(rules.items())]
+        }
+
+    def set_edge(self, map_name, a, b, factor):
+        """Close (None) or reweight one directed edge; factor 1 clears the rule"""
+        factor = _factor(factor)
+        rules = self.edges.setdefault(map_name, {})
+        if factor == 1.0:
+            rules.pop((a, b), None)
+        else:
+            rules[(a, b)] = factor
+        if not rules:
+            del self.edges[map_name]
+
+    def set_node(self, map_name, node_id, factor):
+        """Close (None) or reweight every edge of a node; factor 1 clears the rule"""
+        factor = _factor(factor)
+        rules = self.nodes.setdefault(map_name, {})
+        if factor == 1.0:
+            rules.pop(node_id, None)
+        else:
+            rules[node_id] = factor
+        if not rules:
+            del self.nodes[map_name]
+
+    def profile(self, name):
+        """Type rules of a named profile (None: the default, no rules)"""
+        if name is None:
+            return {}
+        if name not in self.profiles:
+            raise ValueError(f"Unknown routing profile: {name}")
+        return self.profiles[name]
+
+    def fingerprint(self, map_name=None, profile=None):
+        """Short hash of the rules affecting one map (or all maps) under a
+        profile; '' when there are none"""
+        types = self.profile(profile)
+        if map_name is None:
+            rules = self.to_dict()
+        else:
+            rules = {'edges': sorted(self.edges.get(map_name, {}).items()),
+                     'nodes': sorted(self.nodes.get(map_name, {}).items())}
+        if not types and not any(rules.values()):
+            return ''
+        return hashlib.sha1(json.dumps([types, rules], sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+    def apply(self, graph, map_name, profile=None):
+        """The graph as routed under this overlay and profile
+
+        Returns the graph itself when no rule matches any of its edges.
+        Otherwise a graph sharing everything but its weights, without the
+        base graph's distance table or contraction hierarchy (those were
+        computed for the unmodified weights).
+        """
+        types = self.profile(profile)
+        node_rules = self.nodes.get(map_name, {})
+        edge_rules = self.edges.get(map_name, {})
+        if not types and not node_rules and not edge_rules:
+            return graph
+
+        offsets, targets = graph.offsets, graph.targets
+        weights = None
+        lowest = 1.0
+
+        def scale(k, factor):
+            nonlocal weights, lowest
+            if weights is None:
+                weights = array('d', graph.weights)
+            weights[k] = math.inf if factor is None else weights[k] * factor
+            if factor is not None:
+                lowest = min(lowest, factor)
+
+        if types or node_rules:
+            # One pass over every edge for rules that depend on its endpoints
+            node_factors = {graph.index[node_id]: factor for node_id, factor in node_rules.items()
+                            if node_id in graph.index}
+            kinds = [node.get('type') if node.get('type') in types else None for node in graph.node_data]
+            floors = graph.floors
+            for i in range(len(graph)):
+                for k in range(offsets[i], offsets[i + 1]):
+                    j = targets[k]
+                    if i in node_factors:
+                        scale(k, node_factors[i])
+                    if j in node_factors and j != i:
+                        scale(k, node_factors[j])
+                    if kinds[i] is None and kinds[j] is None:
+                        continue
+                    if kinds[i] == kinds[j]:
+                        scale(k, types[kinds[i]])
+                    elif floors[i] != floors[j]:
+                        for kind in {kinds[i], kinds[j]} - {None}:
+                            scale(k, types[kind])
+
+        for (a, b), factor in edge_rules.items():
+            i, j = graph.index.get(a), graph.index.get(b)
+            if i is None or j is None:
+                continue
+            for k in range(offsets[i], offsets[i + 1]):
+                if targets[k] == j:
+                    scale(k, factor)
+
+        if weights is None:
+            return graph
+        return graphs.CompiledGraph.from_parts(
+            graph.ids, graph.index, graph.node_data, graph.xs, graph.ys, graph.floors, offsets, targets, weights,
+            graph.has_coordinates, graph.heuristic_scale * lowest)
@@ -1,109 +1,667 @@
+import hashlib
 import json
-import heapq
 import os
+import threading
+import time
 from pathlib import Path
 
+from utils import graph as graphs
+from utils import contraction
+from utils import graph_file
+from utils import metrics
+from utils.distance_table import load_or_build, routing_key
+from utils.graph_store import GraphStore
+from utils.hierarchy import CampusRouter, link_floors
+from utils.route_cache import RouteCache
+from utils.route_executor import RouteExecutor, compute_route
+from utils.log import get_logger
+from utils.overlay import Overlay
+from utils.spatial_index import SpatialIndex
+
+BUILDINGS = ['A', 'B', 'C', 'AD']
+OVERLAY_FILE = 'overlay.json'
+
+logger = get_logger(__name__)
+
+
+class GraphSnapshot:
+    """One version of the map files; each map's graph is loaded on first use
+
+    Graphs whose version is unchanged are carried over from the previous
+    snapshot instead of being loaded again. Closures and routing profiles
+    (the overlay) give each map one graph per profile as routed, and each
+    profile its own router; those are carried over too while the map and
+    the rules touching it are unchanged.
+    """
+
+    def __init__(self, loader, versions, signature, previous=None, overlay=None):
+        self.versions = versions
+        self.signature = signature
+        self.overlay = overlay if overlay is not None else Overlay()
+        key = '|'.join(sorted(versions.values()))
+        if self.overlay.fingerprint():
+            key += '|' + self.overlay.fingerprint()
+        self.version = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        self._loader = loader
+        self._maps = {}
+        self._fallback = {}
+        if previous is not None:
+            self._fallback = dict(previous._maps)
+            for map_name, graph in previous._maps.items():
+                if previous.versions.get(map_name) == versions.get(map_name):
+                    self._maps[map_name] = graph
+        self._views = {}  # (map, profile) -> (base graph, fingerprint, graph as routed)
+        self._routers = {}  # profile -> CampusRouter
+        self._previous_routers = {}
+        if previous is not None:
+            for (map_name, profile), (base, fingerprint, graph) in previous._views.items():
+                if self._maps.get(map_name) is base and self._fingerprint(map_name, profile) == fingerprint:
+                    self._views[(map_name, profile)] = (base, fingerprint, graph)
+            self._previous_routers = dict(previous._routers)
+        self._spatial = {}
+        self._entrances = None
+        self._lock = threading.RLock()
+
+    def _fingerprint(self, map_name, profile):
+        try:
+            return self.overlay.fingerprint(map_name, profile)
+        except ValueError:
+            return None  # profile no longer configured
+
+    def graph(self, map_name, profile=None):
+        """Compiled graph of one map, loading it if this is the first use
+
+        With closures or a profile in effect, the graph as routed under
+        them; without, the map's own graph.
+        """
+        view = self._views.get((map_name, profile))
+        if view is not None:
+            return view[2]
+        graph = self._base_graph(map_name)
+        fingerprint = self.overlay.fingerprint(map_name, profile)  # ValueError: unknown profile
+        if not fingerprint:
+            return graph
+        with self._lock:
+            view = self._views.get((map_name, profile))
+            if view is None:
+                view = (graph, fingerprint, self.overlay.apply(graph, map_name, profile))
+                self._views[(map_name, profile)] = view
+        return view[2]
+
+    def _base_graph(self, map_name):
+        graph = self._maps.get(map_name)
+        if graph is None:
+            with self._lock:
+                graph = self._maps.get(map_name)
+                if graph is None:
+                    graph = self._loader(map_name)
+                    if graph is None:
+                        # Unreadable (e.g. mid-write): keep serving the last good graph
+                        graph = self._fallback.get(map_name)
+                        if graph is None:
+                            graph = graphs.compile_graph({})
+                    self._maps[map_name] = graph
+        return graph
+
+    @property
+    def campus_graph(self):
+        return self.graph('campus')
+
+    @property
+    def building_graphs(self):
+        return {building: self.graph(f'building_{building}') for building in BUILDINGS}
+
+    @property
+    def router(self):
+        """Cross-map router; needs every map, so this loads any still missing"""
+        return self.router_for(None)
+
+    def router_for(self, profile):
+        """Cross-map router over the graphs as routed under a profile"""
+        router = self._routers.get(profile)
+        if router is None:
+            with self._lock:
+                router = self._routers.get(profile)
+                if router is None:
+                    maps = {map_name: self.graph(map_name, profile) for map_name in self.versions}
+                    # Portal legs of maps no rule change touched are reused
+                    router = CampusRouter(maps, self._previous_routers.pop(profile, None))
+                    self._routers[profile] = router
+        return router
+
+    def resolve(self, node_id):
+        """Map a node belongs to, going by its building_<B>_ prefix and then
+        campus; unlike router.resolve this loads only those maps. None when
+        the node is in neither."""
+        for map_name in self.versions:
+            if map_name != 'campus' and node_id.startswith(map_name + '_'):
+                if node_id in self._base_graph(map_name):
+                    return map_name
+                break
+        if 'campus' in self.versions and node_id in self._base_graph('campus'):
+            return 'campus'
+        return None
+
+    def depends_on(self, map_name):
+        """Maps a route within map_name can cross
+
+        Only the map itself, unless it has two entrances to leave and come
+        back through; then also campus and every building with two
+        entrances, since a detour may pass through any of them.
+        """
+        entrances = self._entrance_counts()
+        if entrances.get(map_name, 2) < 2:
+            return [map_name]
+        return sorted({map_name, 'campus'} | {name for name, count in entrances.items() if count >= 2})
+
+    def _entrance_counts(self):
+        # Campus nodes named after a building are its possible entrances
+        if self._entrances is None:
+            with self._lock:
+                if self._entrances is None:
+                    counts = {map_name: 0 for map_name in self.versions if map_name != 'campus'}
+                    if 'campus' in self.versions:
+                        for node_id in self._base_graph('campus').ids:
+                            for map_name in counts:
+                                if node_id.startswith(map_name + '_'):
+                                    counts[map_name] += 1
+                    self._entrances = counts
+        return self._entrances
+
+    def spatial(self, map_name):
+        """Spatial index of one map, built on first use; None for unknown maps"""
+        index = self._spatial.get(map_name)
+        if index is None and map_name in self.versions:
+            with self._lock:
+                index = self._spatial.get(map_name)
+                if index is None:
+                    index = self._spatial[map_name] = SpatialIndex(self._base_graph(map_name))
+        return index
+
+
 class PathFinder:
     def __init__(self, app):
         self.app = app
         self.data_folder = Path(app.config['DATA_FOLDER'])
+        self.default_strategy = app.config.get('ROUTING_STRATEGY', 'auto')
+        self.stair_cost = app.config.get('STAIRS_FLOOR_COST', 15.0)
+        self.elevator_cost = app.config.get('ELEVATOR_FLOOR_COST', 25.0)
+        self.reload_interval = app.config.get('GRAPH_RELOAD_INTERVAL', 2.0)
+        self.all_pairs_max_nodes = app.config.get('ALL_PAIRS_MAX_NODES', 300)
+        self.contraction_min_nodes = app.config.get('CONTRACTION_MIN_NODES', 0)
+        self.profiles = app.config.get('ROUTING_PROFILES', {})
+        self.lazy = app.config.get('GRAPH_LOADING', 'lazy') == 'lazy'
+        self.route_cache = RouteCache.from_config(app.config)
+        self.executor = RouteExecutor.from_config(app.config, refresh=self._build_snapshot)
+        self._register_metrics()
+        self.store = GraphStore(self.data_folder, app.config.get('JOURNAL_COMPACT_AFTER', 200))
+        self._reload_lock = threading.Lock()
+        self._last_check = time.monotonic()
+        self._snapshot = None
         self._ensure_data_folder_exists()
-        self._load_or_initialize_graphs()
+        if not self.lazy:
+            self._load_or_initialize_graphs()
+
+        if app.config.get('GRAPH_RELOAD') == 'timer':
+            threading.Thread(target=self._watch, daemon=True).start()
+
+    def _register_metrics(self):
+        cache = self.route_cache
+        metrics.REGISTRY.register(metrics.Callback(
+            'route_cache_hits_total', 'Route cache lookups that hit', 'counter', lambda: {(): cache.hits}))
+        metrics.REGISTRY.register(metrics.Callback(
+            'route_cache_misses_total', 'Route cache lookups that missed', 'counter', lambda: {(): cache.misses}))
+        metrics.REGISTRY.register(metrics.Callback(
+            'graph_maps_loaded', 'Map graphs loaded in the current snapshot', 'gauge',
+            lambda: {(): len(self._snapshot._maps) if self._snapshot is not None else 0}))
+        executor = self.executor
+        if executor is not None:
+            metrics.REGISTRY.register(metrics.Callback(
+                'route_queue_depth', 'Distinct route searches queued or running', 'gauge',
+                lambda: {(): executor.depth}))
+            metrics.REGISTRY.register(metrics.Callback(
+                'route_executor_events_total', 'Route queries coalesced, rejected (503) or timed out (504)',
+                'counter', lambda: {('coalesced',): executor.coalesced, ('rejected',): executor.rejected,
+                                    ('timeout',): executor.timeouts}, labels=('event',)))
 
     def _ensure_data_folder_exists(self):
         """Create data folder if it doesn't exist"""
         self.data_folder.mkdir(exist_ok=True)
 
+    # The current snapshot is swapped as a whole; readers that grab it once
+    # keep a consistent view even if a reload lands mid-query.
+    @property
+    def snapshot(self):
+        if self._snapshot is None:
+            with self._reload_lock:
+                if self._snapshot is None:
+                    self._snapshot = self._build_snapshot()
+        return self._snapshot
+
+    @property
+    def campus_graph(self):
+        return self.snapshot.campus_graph
+
+    @property
+    def building_graphs(self):
+        return self.snapshot.building_graphs
+
+    @property
+    def router(self):
+        return self.snapshot.router
+
+    @property
+    def versions(self):
+        return self.snapshot.versions
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def _graph_files(self):
+        files = {'campus': 'campus_nodes.json'}
+        for building in BUILDINGS:
+            files[f'building_{building}'] = f'building_{building}_nodes.json'
+        return files
+
+    def _watched_files(self):
+        for filename in self._graph_files().values():
+            yield filename
+            yield filename[:-len('.json')] + '.journal'
+        yield OVERLAY_FILE
+
     def _load_or_initialize_graphs(self):
-        """Load existing graphs or create empty ones"""
-        self.campus_graph = self._load_or_create_graph('campus_nodes.json', {
-            'nodes': {},
-            'edges': {}
-        })
-
-        empty_building = {'nodes': {}, 'edges': {}}
-        self.building_graphs = {
-            'A': self._load_or_create_graph('building_A_nodes.json', empty_building),
-            'B': self._load_or_create_graph('building_B_nodes.json', empty_building),
-            'C': self._load_or_create_graph('building_C_nodes.json', empty_building),
-            'AD': self._load_or_create_graph('building_AD_nodes.json', empty_building)
-        }
+        """Load existing graphs or create empty ones, compiled once for routing"""
+        self._snapshot = self._build_snapshot()
 
-    def _load_or_create_graph(self, filename, default_data):
-        """Load a graph file or create it with default data"""
-        filepath = self.data_folder / filename
+    def _build_snapshot(self, previous=None):
+        """Version every graph file into a new snapshot, carrying over
+        unchanged graphs from `previous` (default: the current snapshot)
+
+        In lazy mode graphs are loaded when first used; otherwise everything
+        is loaded and compiled here, before the snapshot goes live.
+        """
+        signature = self._signature()
+        versions = {}
+        for map_name, filename in self._graph_files().items():
+            versions[map_name] = self.store.version(map_name)
+            if versions[map_name] is None:
+                # Missing: create it with default data
+                _, versions[map_name] = self._load_or_create_graph(filename, {'nodes': {}, 'edges': {}})
+                signature = None
+            versions[map_name] = versions[map_name] or 'unreadable'
+        if signature is None:
+            signature = self._signature()
+        previous = previous if previous is not None else self._snapshot
+        snapshot = GraphSnapshot(self._load_map, versions, signature, previous, self._load_overlay())
+        if not self.lazy:
+            snapshot.router  # loads and compiles every map
+        return snapshot
+
+    def _load_overlay(self):
+        """Saved closures with the configured profiles; on a bad file the
+        current ones stay in effect"""
         try:
-            if not filepath.exists():
-                with open(filepath, 'w') as f:
-                    json.dump(default_data, f, indent=2)
-                return default_data
+            return Overlay.load(self.data_folder / OVERLAY_FILE, self.profiles)
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error("Error loading overlay", extra={'file': OVERLAY_FILE, 'error': str(e)})
+            return self._snapshot.overlay if self._snapshot is not None else Overlay(profiles=self.profiles)
 
-            if os.path.getsize(filepath) == 0: #Check if the file is empty
-                return default_data
+    def update_overlay(self, change):
+        """Apply change(overlay) to the saved closures, then reload
 
-            with open(filepath, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"Error loading {filename}: {e}")
-            return default_data
+        Only graphs and portal legs of maps whose rules changed are rebuilt;
+        cached routes within other maps stay valid.
+        """
+        path = self.data_folder / OVERLAY_FILE
+        with self.store.locked('overlay'):
+            overlay = Overlay.load(path, self.profiles)
+            change(overlay)
+            overlay.save(path)
+        self.reload()
+        return overlay
 
-    def dijkstra(self, graph, start, end):
-        """Implementation of Dijkstra's algorithm for shortest path"""
-        if not graph or start not in graph.get('nodes', {}) or end not in graph.get('nodes', {}):
+    def set_edge_rule(self, map_name, start, end, factor=None, both_ways=False):
+        """Close (factor None) or reweight the edge start -> end of a map;
+        factor 1 reopens it"""
+        graph = self._rule_graph(map_name, start, end)
+        pairs = [(start, end), (end, start)] if both_ways else [(start, end)]
+        for a, b in pairs:
+            i, j = graph.index[a], graph.index[b]
+            if not any(target == j for target, _ in graph.neighbors(i)):
+                raise ValueError(f"No edge from {a} to {b} in {map_name}")
+
+        def change(overlay):
+            for a, b in pairs:
+                overlay.set_edge(map_name, a, b, factor)
+        return self.update_overlay(change)
+
+    def set_node_rule(self, map_name, node_id, factor=None):
+        """Close (factor None) or reweight every edge of a node; factor 1 reopens it"""
+        self._rule_graph(map_name, node_id)
+        return self.update_overlay(lambda overlay: overlay.set_node(map_name, node_id, factor))
+
+    def _rule_graph(self, map_name, *node_ids):
+        if map_name not in self._graph_files():
+            raise ValueError(f"Invalid map name: {map_name!r}")
+        graph = self.snapshot.graph(map_name)
+        for node_id in node_ids:
+            if node_id not in graph:
+                raise ValueError(f"Unknown node {node_id!r} in {map_name}")
+        return graph
+
+    def _load_map(self, map_name):
+        """Compiled graph with its distance table, or None if unreadable"""
+        graph, version = self._load_compiled(map_name, self._graph_files()[map_name])
+        if version is None:
             return None
+        return self._prepare(map_name, graph)
 
-        distances = {node: float('infinity') for node in graph['nodes']}
-        predecessors = {node: None for node in graph['nodes']}
-        distances[start] = 0
+    def _prepare(self, map_name, graph, previous=None):
+        """Attach the distance table or hierarchy and component labels; those
+        of the previous graph are reused when its edges and weights match"""
+        if previous is not None and len(previous) == len(graph) and routing_key(previous) == routing_key(graph):
+            graph.all_pairs, graph.contraction = previous.all_pairs, previous.contraction
+        else:
+            self._attach_distance_table(map_name, graph)
+            self._attach_contraction(map_name, graph)
+        with metrics.graph_load_seconds.time(map_name, 'components'):
+            graph.connectivity
+        return graph
 
-        priority_queue = [(0, start)]
+    def _compile(self, map_name, data):
+        if map_name == 'campus':
+            return graphs.compile_graph(data)
+        return self._compile_building(data)
 
-        while priority_queue:
-            current_distance, current_node = heapq.heappop(priority_queue)
-            if current_node == end:
-                break
-            if current_distance > distances[current_node]:
-                continue
-            for neighbor, weight in graph['edges'].get(current_node, {}).items():
-                distance = current_distance + weight
-                if distance < distances[neighbor]:
-                    distances[neighbor] = distance
-                    predecessors[neighbor] = current_node
-                    heapq.heappush(priority_queue, (distance, neighbor))
-
-        path = []
-        current = end
-        while current is not None:
-            path.insert(0, current)
-            current = predecessors.get(current, None)
-
-        if not path or path[0] != start:
+    def _artifact_key(self, version):
+        # Floor costs change building edge weights, so they are part of the key
+        return f'{version}:{self.stair_cost}:{self.elevator_cost}'
+
+    def _load_compiled(self, map_name, filename):
+        """(compiled graph, version) for one map, preferring its binary build
+
+        The .graph file is memory-mapped, so workers share its pages; it is
+        rewritten from the JSON whenever the map's content version changes.
+        """
+        binary_path = self.data_folder / f'{map_name}_nodes.graph'
+        version = self.store.version(map_name)
+        if version is not None:
+            began = time.perf_counter()
+            graph = graph_file.load(binary_path, self._artifact_key(version))
+            if graph is not None:
+                metrics.graph_load_seconds.observe(time.perf_counter() - began, map_name, 'mmap')
+                return graph, version
+
+        with metrics.graph_load_seconds.time(map_name, 'parse'):
+            data, version = self._load_or_create_graph(filename, {'nodes': {}, 'edges': {}})
+        with metrics.graph_load_seconds.time(map_name, 'compile'):
+            graph = self._compile(map_name, data)
+        if version is not None:
+            try:
+                graph_file.save(graph, binary_path, self._artifact_key(version))
+                # Serve from the mapping too, so this worker shares pages as well
+                mapped = graph_file.load(binary_path, self._artifact_key(version))
+                if mapped is not None:
+                    graph = mapped
+            except OSError as e:
+                logger.error("Error saving binary graph", extra={'path': str(binary_path), 'error': str(e)})
+        return graph, version
+
+    def _attach_distance_table(self, map_name, graph):
+        """Give small graphs a persisted all-pairs table for O(1) routing
+
+        The table is keyed on the graph's edges and weights rather than the
+        map version, so edits that do not change routing keep it.
+        """
+        if not 0 < len(graph) <= self.all_pairs_max_nodes:
+            return
+        with metrics.graph_load_seconds.time(map_name, 'distance_table'):
+            graph.all_pairs = load_or_build(graph, self.data_folder / f'{map_name}_nodes.apsp',
+                                            routing_key(graph))
+
+    def _attach_contraction(self, map_name, graph):
+        """Give large graphs a persisted contraction hierarchy, keyed like the
+        distance table on edges and weights only"""
+        if not self.contraction_min_nodes or graph.all_pairs is not None or len(graph) < self.contraction_min_nodes:
+            return
+        with metrics.graph_load_seconds.time(map_name, 'contraction'):
+            graph.contraction = contraction.load_or_build(graph, self.data_folder / f'{map_name}_nodes.ch',
+                                                          routing_key(graph))
+
+    def _signature(self):
+        """Cheap change detector: (mtime, size) of every graph and journal file"""
+        signature = {}
+        for filename in self._watched_files():
+            try:
+                stat = os.stat(self.data_folder / filename)
+                signature[filename] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                signature[filename] = None
+        return signature
+
+    def reload(self, patched=None):
+        """Re-read every graph file, e.g. after the map editor saved one
+
+        Cached routes are keyed on map content versions, so only routes
+        touching a changed map stop matching; the rest stay warm. The map
+        named by patched (just edited through the store) is compiled from
+        the store's in-memory copy instead of being read back from disk.
+        """
+        with self._reload_lock:
+            previous = self._snapshot
+            snapshot = self._build_snapshot()
+            if patched is not None and previous is not None and patched in previous._maps:
+                self._recompile(snapshot, patched, previous._maps[patched])
+            if previous is not None and self.lazy:
+                # Maps in use that changed are loaded (and their distance
+                # table or hierarchy rebuilt), as are the routers of profiles
+                # in use, before the swap: queries keep using the previous
+                # snapshot meanwhile instead of stalling on the first use
+                changed = [map_name for map_name, version in snapshot.versions.items()
+                           if map_name in previous._maps and previous.versions.get(map_name) != version]
+                profiles = list(previous._routers) if snapshot.version != previous.version else []
+                self._preload(snapshot, changed, profiles)
+            self._snapshot = snapshot
+
+    def _recompile(self, snapshot, map_name, previous):
+        data, version = self.store.current(map_name)
+        if data is None or version != snapshot.versions.get(map_name):
+            return  # changed again meanwhile: loaded from the files instead
+        with metrics.graph_load_seconds.time(map_name, 'compile'):
+            graph = self._compile(map_name, data)
+        snapshot._maps[map_name] = self._prepare(map_name, graph, previous)
+
+    def patch_map(self, map_name, ops):
+        """Journal editor deltas and swap in the edited map in the background;
+        ValueError if the map name or any op is invalid"""
+        if map_name not in self._graph_files():
+            raise ValueError(f"Invalid map name: {map_name!r}")
+        data, _ = self.store.patch(map_name, ops)
+        self.schedule_reload(patched=map_name)
+        return data
+
+    def _preload(self, snapshot, map_names, profiles=()):
+        try:
+            for map_name in map_names:
+                snapshot.graph(map_name)
+            for profile in profiles:
+                snapshot.router_for(profile)
+        except Exception:
+            logger.exception("Error preloading graphs")  # loaded on first use instead
+
+    def check_for_updates(self):
+        """Called at request boundaries: reload in the background when files change"""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        if self._snapshot is None:
+            return  # nothing loaded yet; the first use reads current files
+        if self._signature() != self._snapshot.signature and not self._reload_lock.locked():
+            self.schedule_reload()
+
+    def _reload_quietly(self, patched=None):
+        try:
+            self.reload(patched)
+        except Exception:
+            logger.exception("Error reloading graphs")
+
+    def _watch(self):
+        while True:
+            time.sleep(self.reload_interval)
+            if self._snapshot is not None and self._signature() != self._snapshot.signature:
+                self._reload_quietly()
+
+    def _compile_building(self, data):
+        """Compile a building graph with its floors joined by stairs and elevators"""
+        return graphs.compile_graph(link_floors(data, self.stair_cost, self.elevator_cost))
+
+    def _load_or_create_graph(self, filename, default_data):
+        """Load a graph file (plus its journal) or create it with default data
+
+        Returns (data, content version); the version is None if the file
+        could not be read.
+        """
+        try:
+            return self.store.load(filename[:-len('_nodes.json')], default_data)
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error("Error loading graph file", extra={'file': filename, 'error': str(e)})
+            return default_data, None
+
+    def schedule_reload(self, patched=None):
+        """Rebuild the snapshot on a background thread"""
+        threading.Thread(target=self._reload_quietly, args=(patched,), daemon=True).start()
+
+    @staticmethod
+    def _cache_key(snapshot, start, end, strategy, profile=None):
+        """Key routes on the content version of every map they depend on,
+        and on the closures and profile rules applied to those maps
+
+        Only the maps the endpoints belong to (and campus) are loaded for
+        this, so cache hits never build the cross-map router.
+        """
+        start_map, end_map = snapshot.resolve(start), snapshot.resolve(end)
+        if start_map is not None and start_map == end_map:
+            keys = []
+            for map_name in snapshot.depends_on(start_map):
+                key = snapshot.versions.get(map_name, snapshot.version)
+                rules = snapshot.overlay.fingerprint(map_name, profile)
+                keys.append(f'{key}:{rules}' if rules else key)
+            version = keys[0] if len(keys) == 1 else hashlib.sha1('|'.join(keys).encode('utf-8')).hexdigest()[:16]
+        else:
+            version = snapshot.version
+        return (version, start, end, strategy, profile)
+
+    def connectivity_report(self, map_name):
+        """Nodes of a map that routes cannot reach, as currently saved"""
+        filename = self._graph_files().get(map_name)
+        if filename is None:
             return None
+        graph, version = self._load_compiled(map_name, filename)
+        if version is None:
+            return None
+        return dict(graph.connectivity.report(graph), map=map_name)
 
-        return {
-            'path': path,
-            'distance': distances[end],
-            'nodes': [graph['nodes'][node] for node in path]
-        }
+    def route_version(self, start, end, strategy=None, profile=None):
+        """Version of the graphs a route between start and end depends on"""
+        snapshot = self.snapshot
+        snapshot.overlay.profile(profile)  # ValueError: unknown profile
+        return self._cache_key(snapshot, start, end, strategy or self.default_strategy, profile)[0]
 
-    def find_path(self, start, end):
-        """Find path between two points"""
+    def dijkstra(self, graph, start, end):
+        """Implementation of Dijkstra's algorithm for shortest path"""
+        if not graph:
+            return None
+        graph = graphs.compile_graph(graph)
+        if graphs.unreachable(graph, start, end):
+            return None
+        return graphs.dijkstra(graph, start, end)
+
+    def search(self, graph, start, end, strategy=None):
+        """Run the configured (or requested) search strategy on one graph"""
+        if not graph:
+            return None
+        return graphs.search(graphs.compile_graph(graph), start, end,
+                             strategy or self.default_strategy)
+
+    def find_path(self, start, end, strategy=None, profile=None):
+        """Find path between two points on campus, in buildings or across
+        both, optionally under a routing profile (e.g. 'no_stairs')"""
         if not start or not end:
             return None
+        snapshot = self.snapshot
+        snapshot.overlay.profile(profile)  # ValueError: unknown profile
+        strategy = strategy or self.default_strategy
+        key = self._cache_key(snapshot, start, end, strategy, profile)
+        result = self.route_cache.get(key)
+        if result is None:
+            def record(outcome):
+                result, seconds, settled, pushes = outcome
+                metrics.search_seconds.observe(seconds, strategy)
+                metrics.search_settled.observe(settled)
+                metrics.search_pushes.observe(pushes)
+                self.route_cache.set(key, result)
+
+            if self.executor is not None:
+                # Raises RouteBusy/RouteTimeout instead of tying up the request
+                result = self.executor.submit(snapshot, key, start, end, strategy, record, profile)[0]
+            else:
+                outcome = compute_route(start, end, strategy, snapshot.router_for(profile))
+                record(outcome)
+                result = outcome[0]
+        return result
+
+    def find_paths(self, sources, targets=None, include_paths=False, processes=None, profile=None):
+        """Distance matrix between many sources and targets
 
-        # Check campus graph first
-        if start in self.campus_graph.get('nodes', {}) and end in self.campus_graph.get('nodes', {}):
-            return self.dijkstra(self.campus_graph, start, end)
+        Runs one search per source; with processes > 1, sources are split
+        into that many chunks run on the route executor's pool (its forked
+        processes when ROUTE_EXECUTOR is 'process'), which is created once
+        per worker rather than per request.
+        """
+        targets = sources if targets is None else targets
+        snapshot = self.snapshot
+        snapshot.overlay.profile(profile)  # ValueError: unknown profile
+        if processes is None:
+            processes = self.app.config.get('ROUTE_MATRIX_PROCESSES', 0)
 
-        # Check building graphs
-        for building, graph in self.building_graphs.items():
-            building_prefix = f"building_{building}_"
-            if start.startswith(building_prefix) and end.startswith(building_prefix):
-                if start in graph.get('nodes', {}) and end in graph.get('nodes', {}):
-                    return self.dijkstra(graph, start, end)
+        if processes and processes > 1 and len(sources) > 1 and self.executor is not None:
+            # Raises RouteBusy if the pool's workers died
+            distances, paths = self.executor.matrix(snapshot, sources, targets, include_paths, profile,
+                                                    chunks=processes)
+        else:
+            distances, paths = snapshot.router_for(profile).matrix(sources, targets, include_paths)
 
-        # Check building entrances
-        if "_entrance" in start and "_entrance" in end:
-            return self.dijkstra(self.campus_graph, start, end)
+        result = {'sources': sources, 'targets': targets, 'distances': distances}
+        if include_paths:
+            result['paths'] = paths
+        return result
 
-        return None
\ No newline at end of file
+    def nearest(self, map_name, x, y, floor=1, kind='node'):
+        """Nearest node (or edge segment) to a point on one floor of a map
+
+        Returns None if the map is unknown or has nothing on that floor.
+        """
+        index = self.snapshot.spatial(map_name)
+        if index is None:
+            return None
+        graph = index.graph
+        if kind == 'edge':
+            hit = index.nearest_edge(x, y, floor)
+            if hit is None:
+                return None
+            i, j, distance, (px, py) = hit
+            return {'from': graph.ids[i], 'to': graph.ids[j], 'distance': distance, 'x': px, 'y': py}
+        hit = index.nearest_node(x, y, floor)
+        if hit is None:
+            return None
+        return {'id': graph.ids[hit[0]], 'node': graph.node_data[hit[0]], 'distance': hit[1]}
+
+    def nodes_within(self, map_name, x0, y0, x1, y1, floor=1):
+        """{node id: node} for every node inside a box on one floor"""
+        index = self.snapshot.spatial(map_name)
+        if index is None:
+            return None
+        graph = index.graph
+        return {graph.ids[i]: graph.node_data[i] for i in index.within(x0, y0, x1, y1, floor)}
@@ -0,0 +1,86 @@
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+
+class SlowRequestSampler:
+    """Statistical profiler for requests that run longer than a threshold
+
+    One background thread wakes every `interval` seconds and, for each
+    request past `threshold`, records the request thread's current stack.
+    Fast requests cost two dict operations; nothing is traced.
+    """
+
+    def __init__(self, threshold, interval=0.005, folder=None, top=15):
+        self.threshold = threshold
+        self.interval = interval
+        self.folder = Path(folder) if folder else None
+        self.top = top
+        self._active = {}  # thread id -> [label, started, Counter of stacks]
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def begin(self, label):
+        with self._lock:
+            self._active[threading.get_ident()] = [label, time.perf_counter(), collections.Counter()]
+
+    def end(self):
+        """Stop sampling this thread; returns a report if it was sampled"""
+        with self._lock:
+            entry = self._active.pop(threading.get_ident(), None)
+        if entry is None or not entry[2]:
+            return None
+        label, started, stacks = entry
+        report = self._report(label, time.perf_counter() - started, stacks)
+        if self.folder is not None:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{threading.get_ident()}.txt"
+            (self.folder / name).write_text(report)
+        return report
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            # Under the lock so end() never sees a stack counter mid-update
+            with self._lock:
+                due = [(tid, entry) for tid, entry in self._active.items() if now - entry[1] >= self.threshold]
+                if not due:
+                    continue
+                frames = sys._current_frames()
+                for tid, entry in due:
+                    frame = frames.get(tid)
+                    if frame is not None:
+                        stack = tuple((f.filename, f.lineno, f.name) for f in traceback.extract_stack(frame))
+                        entry[2][stack] += 1
+
+    def _report(self, label, duration, stacks):
+        total = sum(stacks.values())
+        lines = [f"Slow request {label}: {duration * 1000:.0f} ms, {total} samples "
+                 f"every {self.interval * 1000:.0f} ms after {self.threshold * 1000:.0f} ms"]
+
+        # Self time: the innermost frame of each sample
+        leaves = collections.Counter()
+        # Inclusive time: every function on the stack, once per sample
+        inclusive = collections.Counter()
+        for stack, count in stacks.items():
+            leaves[stack[-1]] += count
+            for function in {(filename, name) for filename, _, name in stack}:
+                inclusive[function] += count
+
+        lines.append("Self (innermost line):")
+        for (filename, lineno, name), count in leaves.most_common(self.top):
+            lines.append(f"  {count * 100 / total:5.1f}%  {name} ({filename}:{lineno})")
+        lines.append("Inclusive (function anywhere on the stack):")
+        for (filename, name), count in inclusive.most_common(self.top):
+            lines.append(f"  {count * 100 / total:5.1f}%  {name} ({filename})")
+
+        stack, count = stacks.most_common(1)[0]
+        lines.append(f"Most common stack ({count * 100 / total:.1f}%):")
+        for filename, lineno, name in stack:
+            lines.append(f"  {name} ({filename}:{lineno})")
+        return '\n'.join(lines) + '\n'
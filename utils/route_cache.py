@@ -0,0 +1,114 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalBackend:
+    """In-process LRU store with a per-entry TTL"""
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if self.ttl and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemcachedBackend:
+    """Shared store on a memcached-compatible server, for gunicorn workers"""
+
+    def __init__(self, servers, ttl=300):
+        import memcache  # python-memcached, only needed for this backend
+        self.client = memcache.Client(servers)
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(key):
+        # memcached keys must be short and free of whitespace
+        return 'route:' + hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self.client.get(self._key(key))
+
+    def set(self, key, value):
+        self.client.set(self._key(key), value, time=self.ttl)
+
+    def clear(self):
+        # Keys embed graph versions, so stale entries are never read again
+        # and simply expire; flushing would evict other workers' entries too.
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class RouteCache:
+    """Route results keyed by (graph version, start, end, options)"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the cache described by ROUTE_CACHE_* settings"""
+        ttl = config.get('ROUTE_CACHE_TTL', 300)
+        if config.get('ROUTE_CACHE_BACKEND', 'local') == 'memcached':
+            servers = config.get('MEMCACHED_SERVERS', '127.0.0.1:11211').split(',')
+            return cls(MemcachedBackend(servers, ttl=ttl))
+        return cls(LocalBackend(max_size=config.get('ROUTE_CACHE_SIZE', 1024), ttl=ttl))
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if value is not None:
+            self.backend.set(key, value)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.backend)
+        }
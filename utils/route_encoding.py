@@ -0,0 +1,145 @@
+import math
+
+# Node types whose floor changes are described as "take the ..."
+FLOOR_CHANGE = {'elevator': 'elevator', 'lift': 'elevator', 'stairs': 'stairs', 'staircase': 'stairs'}
+# Decimal places coordinates may be encoded with; more gains nothing for
+# map units and lets 10**precision overflow float coordinates
+MAX_PRECISION = 6
+
+
+def _coordinates(nodes):
+    """[(x, y), ...] for a route's nodes, or None if any node lacks them"""
+    points = []
+    for node in nodes:
+        try:
+            x, y = float(node['x']), float(node['y'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if math.isnan(x) or math.isnan(y):
+            return None
+        points.append((x, y))
+    return points
+
+
+def _scaled(points, precision):
+    if not 0 <= precision <= MAX_PRECISION:
+        raise ValueError(f"precision must be between 0 and {MAX_PRECISION}")
+    factor = 10 ** precision
+    return [(round(x * factor), round(y * factor)) for x, y in points]
+
+
+def delta_encode(points, precision=1):
+    """First point then per-step differences, as integers in 10^-precision units"""
+    scaled = _scaled(points, precision)
+    deltas = []
+    previous = (0, 0)
+    for point in scaled:
+        deltas.append([point[0] - previous[0], point[1] - previous[1]])
+        previous = point
+    return deltas
+
+
+def encode_polyline(points, precision=1):
+    """Encoded polyline string (the Google maps algorithm) of map coordinates"""
+    chunks = []
+    previous = (0, 0)
+    for point in _scaled(points, precision):
+        for value in (point[0] - previous[0], point[1] - previous[1]):
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous = point
+    return ''.join(chunks)
+
+
+def decode_polyline(text, precision=1):
+    """Inverse of encode_polyline"""
+    values, value, shift = [], 0, 0
+    for char in text:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    factor = 10 ** precision
+    points, x, y = [], 0, 0
+    for dx, dy in zip(values[::2], values[1::2]):
+        x, y = x + dx, y + dy
+        points.append((x / factor, y / factor))
+    return points
+
+
+def compact(result, coords='polyline', precision=1):
+    """Route result with node ids only and encoded coordinates
+
+    The full result repeats every node dict; this keeps the ids, distance
+    and per-map/floor segments. Coordinates come as an encoded polyline or
+    as [[x, y], [dx, dy], ...] deltas, in units of 10^-precision. They are
+    left out if any node on the route has no position.
+    """
+    body = {
+        'path': result['path'],
+        'distance': result['distance'],
+        'segments': result.get('segments'),
+        'precision': precision
+    }
+    points = _coordinates(result['nodes'])
+    if points is not None:
+        if coords == 'delta':
+            body['deltas'] = delta_encode(points, precision)
+        else:
+            body['polyline'] = encode_polyline(points, precision)
+    return body
+
+
+def directions(result):
+    """Step-by-step summary: one step per map/floor segment of the route"""
+    nodes = result['nodes']
+    points = _coordinates(nodes)
+    segments = result.get('segments') or [{'map': None, 'floor': None, 'start': 0, 'end': len(nodes) - 1}]
+    steps = []
+    for position, segment in enumerate(segments):
+        start, end = segment['start'], segment['end']
+        first = nodes[start]
+        if position:
+            previous = segments[position - 1]
+            if previous['map'] != segment['map']:
+                action = 'Leave the building' if segment['map'] == 'campus' else f"Enter {_place(segment['map'])}"
+                steps.append({'instruction': action, 'node': result['path'][start]})
+            elif previous['floor'] != segment['floor']:
+                via = FLOOR_CHANGE.get(nodes[previous['end']].get('type'), 'stairs')
+                steps.append({'instruction': f"Take the {via} to floor {segment['floor']}",
+                              'node': result['path'][previous['end']]})
+        length = None
+        if points is not None:
+            length = sum(math.hypot(x1 - x0, y1 - y0) for (x0, y0), (x1, y1) in zip(points[start:end], points[start + 1:end + 1]))
+        if end > start:
+            target = nodes[end].get('name') or result['path'][end]
+            if segment['map'] == 'campus':
+                instruction = f"Walk across campus to {target}"
+            elif segment['floor'] is not None:
+                instruction = f"Walk on floor {segment['floor']} to {target}"
+            else:
+                instruction = f"Walk to {target}"
+            steps.append({
+                'instruction': instruction,
+                'from': result['path'][start],
+                'to': result['path'][end],
+                'map': segment['map'],
+                'floor': segment['floor'],
+                'length': length,
+                'nodes': end - start + 1
+            })
+        elif not steps:
+            steps.append({'instruction': f"Start at {first.get('name') or result['path'][start]}",
+                          'node': result['path'][start]})
+    return steps
+
+
+def _place(map_name):
+    if map_name and map_name.startswith('building_'):
+        return f"Building {map_name[len('building_'):]}"
+    return map_name or 'the building'
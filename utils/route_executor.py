@@ -0,0 +1,200 @@
+import threading
+import time
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from utils import graph as graphs
+
+# Snapshot inherited by forked route workers, and how they replace it when
+# the graphs change (both set just before the pool forks)
+_snapshot = None
+_refresh = None
+_requested = None
+
+
+class RouteBusy(Exception):
+    """Too many route computations are already queued"""
+
+
+class RouteTimeout(Exception):
+    """A route computation did not finish within the time limit"""
+
+
+def compute_route(start, end, strategy, router=None, profile=None, version=None):
+    """(result, search seconds, settled, pushes) for one route query"""
+    if router is None:
+        router = _worker_snapshot(version).router_for(profile)
+    graphs.take_counters()  # drop work counted outside this query
+    began = time.perf_counter()
+    result = router.route(start, end, strategy)
+    seconds = time.perf_counter() - began
+    settled, pushes = graphs.take_counters()
+    return result, seconds, settled, pushes
+
+
+def compute_matrix(sources, targets, include_paths, router=None, profile=None, version=None):
+    """(distances, paths) rows for a chunk of a route matrix"""
+    if router is None:
+        router = _worker_snapshot(version).router_for(profile)
+    return router.matrix(sources, targets, include_paths)
+
+
+def _worker_snapshot(version):
+    """The forked worker's snapshot, re-read from the files once per new version
+
+    Maps that did not change are carried over, so they stay shared with
+    the parent; only changed ones are loaded in the worker.
+    """
+    global _snapshot, _requested
+    if version is not None and version != _snapshot.version and version != _requested and _refresh is not None:
+        _requested = version
+        _snapshot = _refresh(_snapshot)
+    return _snapshot
+
+
+class RouteExecutor:
+    """Runs route searches off the request thread
+
+    'thread' (the default) keeps one thread pool for the life of the worker;
+    it only runs searches in parallel on a free-threaded Python, but lets
+    slow queries time out and identical ones share a search. 'process' is
+    opt-in: it forks a pool once, sharing the compiled graphs, and its
+    workers re-read changed maps themselves (through `refresh`) instead of
+    being forked again per graph version. Only use it where forking a
+    threaded server is safe. Identical queries in flight share one
+    computation, at most `max_queue` distinct ones may be in flight, and
+    callers stop waiting after `timeout` seconds. A timed-out search keeps
+    its slot until it finishes, so slow queries turn into RouteBusy for
+    later callers rather than piling up.
+    """
+
+    def __init__(self, kind='thread', workers=2, max_queue=32, timeout=5.0, refresh=None):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown route executor {kind!r}")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.refresh = refresh
+        self._pool = None
+        self._in_flight = {}  # cache key -> Future
+        self._lock = threading.RLock()
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_config(cls, config, refresh=None):
+        """Executor described by ROUTE_EXECUTOR* settings, or None when off"""
+        kind = config.get('ROUTE_EXECUTOR', 'thread')
+        if kind == 'off':
+            return None
+        return cls('thread' if kind == 'auto' else kind,
+                   workers=config.get('ROUTE_EXECUTOR_WORKERS', 2),
+                   max_queue=config.get('ROUTE_QUEUE_LIMIT', 32),
+                   timeout=config.get('ROUTE_TIMEOUT', 5.0),
+                   refresh=refresh)
+
+    @property
+    def depth(self):
+        return len(self._in_flight)
+
+    def _pool_for(self, snapshot):
+        # Called with the lock held
+        if self._pool is not None:
+            return self._pool
+        if self.kind == 'process':
+            global _snapshot, _refresh
+            # Imported here: only the process pool needs multiprocessing
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            _snapshot, _refresh = snapshot, self.refresh
+            snapshot.router  # built before forking, so workers share it
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        else:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='route')
+        return self._pool
+
+    def submit(self, snapshot, key, start, end, strategy, on_result=None, profile=None):
+        """Compute (or join the computation of) one route and wait for it
+
+        Returns compute_route's tuple. on_result gets that tuple once per
+        computation, however many callers shared it.
+        """
+        with self._lock:
+            pool = self._pool
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                if len(self._in_flight) >= self.max_queue:
+                    self.rejected += 1
+                    raise RouteBusy(f"{len(self._in_flight)} route queries already queued")
+                pool = self._pool_for(snapshot)
+                try:
+                    if self.kind == 'process':
+                        # Workers build other profiles' routers on first use
+                        future = pool.submit(compute_route, start, end, strategy, None, profile, snapshot.version)
+                    else:
+                        future = pool.submit(compute_route, start, end, strategy, snapshot.router_for(profile))
+                except BrokenExecutor:
+                    self._pool = None  # a worker died; fork a fresh pool next time
+                    raise RouteBusy("Route workers are restarting")
+                self._in_flight[key] = future
+                future.add_done_callback(lambda done: self._finish(key, done, on_result))
+
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            raise RouteTimeout(f"Route query took longer than {self.timeout} s")
+        except BrokenExecutor:
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise RouteBusy("Route workers are restarting")
+
+    def matrix(self, snapshot, sources, targets, include_paths=False, profile=None, chunks=2):
+        """Route matrix with its source rows split into chunks run on the pool
+
+        Not coalesced, limited or timed out like single routes: the caller
+        already capped the matrix size.
+        """
+        size = -(-len(sources) // chunks)
+        with self._lock:
+            pool = self._pool_for(snapshot)
+            try:
+                if self.kind == 'process':
+                    futures = [pool.submit(compute_matrix, sources[i:i + size], targets, include_paths,
+                                           None, profile, snapshot.version)
+                               for i in range(0, len(sources), size)]
+                else:
+                    router = snapshot.router_for(profile)
+                    futures = [pool.submit(compute_matrix, sources[i:i + size], targets, include_paths, router)
+                               for i in range(0, len(sources), size)]
+            except BrokenExecutor:
+                self._pool = None
+                raise RouteBusy("Route workers are restarting")
+        try:
+            parts = [future.result() for future in futures]
+        except BrokenExecutor:
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise RouteBusy("Route workers are restarting")
+        distances = [row for part, _ in parts for row in part]
+        paths = [row for _, part in parts for row in part] if include_paths else None
+        return distances, paths
+
+    def _finish(self, key, future, on_result):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+        if on_result is not None and not future.cancelled() and future.exception() is None:
+            on_result(future.result())
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
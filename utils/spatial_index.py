@@ -0,0 +1,147 @@
+import math
+
+
+class SpatialIndex:
+    """Uniform grid over one compiled graph's nodes and edge segments, per floor
+
+    Cells are sized for a couple of nodes each, so nearest-neighbour
+    lookups inspect a few rings of cells instead of every node.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.floors = {}
+        by_floor = {}
+        for i in range(len(graph)):
+            if not (math.isnan(graph.xs[i]) or math.isnan(graph.ys[i])):
+                by_floor.setdefault(graph.floors[i], []).append(i)
+
+        for floor, members in by_floor.items():
+            xs = [graph.xs[i] for i in members]
+            ys = [graph.ys[i] for i in members]
+            area = max(max(xs) - min(xs), 1.0) * max(max(ys) - min(ys), 1.0)
+            cell = math.sqrt(2 * area / len(members))
+            self.floors[floor] = {'cell': cell, 'nodes': {}, 'segments': {}}
+            for i in members:
+                self.floors[floor]['nodes'].setdefault(self._key(floor, graph.xs[i], graph.ys[i]), []).append(i)
+
+        # Each undirected segment goes in every cell its bounding box touches
+        seen = set()
+        for i in range(len(graph)):
+            for j, _ in graph.neighbors(i):
+                pair = (min(i, j), max(i, j))
+                if i == j or pair in seen:
+                    continue
+                seen.add(pair)
+                floor = graph.floors[i]
+                if floor not in self.floors or graph.floors[j] != floor:
+                    continue
+                if math.isnan(graph.xs[j]) or math.isnan(graph.xs[i]):
+                    continue
+                cx0, cy0 = self._key(floor, min(graph.xs[i], graph.xs[j]), min(graph.ys[i], graph.ys[j]))
+                cx1, cy1 = self._key(floor, max(graph.xs[i], graph.xs[j]), max(graph.ys[i], graph.ys[j]))
+                for cx in range(cx0, cx1 + 1):
+                    for cy in range(cy0, cy1 + 1):
+                        self.floors[floor]['segments'].setdefault((cx, cy), []).append(pair)
+
+        for grid in self.floors.values():
+            keys = list(grid['nodes'])
+            grid['extent'] = (min(k[0] for k in keys), min(k[1] for k in keys),
+                              max(k[0] for k in keys), max(k[1] for k in keys))
+
+    def _key(self, floor, x, y):
+        cell = self.floors[floor]['cell']
+        return math.floor(x / cell), math.floor(y / cell)
+
+    def _rings(self, floor, x, y):
+        """Yield (ring radius in map units, cells at that ring) outward from (x, y)"""
+        if not (math.isfinite(x) and math.isfinite(y)):
+            raise ValueError("Coordinates must be finite numbers")
+        grid = self.floors[floor]
+        cell = grid['cell']
+        kx0, ky0, kx1, ky1 = grid['extent']
+        # A point outside the occupied cells starts from the nearest one; by
+        # projection, anything inside is at least hypot(outside, reach) away
+        px = min(max(x, kx0 * cell), (kx1 + 1) * cell)
+        py = min(max(y, ky0 * cell), (ky1 + 1) * cell)
+        outside = math.hypot(x - px, y - py)
+        cx, cy = min(max(math.floor(px / cell), kx0), kx1), min(max(math.floor(py / cell), ky0), ky1)
+        # Past this many rings every occupied cell has been visited
+        limit = max(cx - kx0, kx1 - cx, cy - ky0, ky1 - cy)
+        for ring in range(limit + 1):
+            if ring == 0:
+                cells = [(cx, cy)]
+            else:
+                cells = [(cx + dx, cy + dy) for dx in range(-ring, ring + 1) for dy in (-ring, ring)]
+                cells += [(cx + dx, cy + dy) for dx in (-ring, ring) for dy in range(-ring + 1, ring)]
+            # Anything in ring r is at least r - 1 cells away from (px, py)
+            yield math.hypot(outside, max(ring - 1, 0) * cell), cells
+
+    def nearest_node(self, x, y, floor=1):
+        """(node index, distance) of the node closest to (x, y), or None"""
+        if floor not in self.floors:
+            return None
+        graph, cells_by_key = self.graph, self.floors[floor]['nodes']
+        best, best_distance = None, math.inf
+        for reach, cells in self._rings(floor, x, y):
+            if reach > best_distance:
+                break
+            for key in cells:
+                for i in cells_by_key.get(key, ()):
+                    distance = math.hypot(graph.xs[i] - x, graph.ys[i] - y)
+                    if distance < best_distance:
+                        best, best_distance = i, distance
+        return None if best is None else (best, best_distance)
+
+    def nearest_edge(self, x, y, floor=1):
+        """(i, j, distance, (px, py)) for the edge segment closest to (x, y), or None"""
+        if floor not in self.floors:
+            return None
+        graph, cells_by_key = self.graph, self.floors[floor]['segments']
+        best, best_distance = None, math.inf
+        checked = set()
+        for reach, cells in self._rings(floor, x, y):
+            if reach > best_distance:
+                break
+            for key in cells:
+                for pair in cells_by_key.get(key, ()):
+                    if pair in checked:
+                        continue
+                    checked.add(pair)
+                    point = _project(x, y, graph.xs[pair[0]], graph.ys[pair[0]], graph.xs[pair[1]], graph.ys[pair[1]])
+                    distance = math.hypot(point[0] - x, point[1] - y)
+                    if distance < best_distance:
+                        best, best_distance = (pair[0], pair[1], distance, point), distance
+        return best
+
+    def within(self, x0, y0, x1, y1, floor=1):
+        """Indices of nodes inside the box, in no particular order"""
+        if not all(math.isfinite(v) for v in (x0, y0, x1, y1)):
+            raise ValueError("Coordinates must be finite numbers")
+        if floor not in self.floors:
+            return []
+        x0, x1 = min(x0, x1), max(x0, x1)
+        y0, y1 = min(y0, y1), max(y0, y1)
+        graph, cells_by_key = self.graph, self.floors[floor]['nodes']
+        cx0, cy0 = self._key(floor, x0, y0)
+        cx1, cy1 = self._key(floor, x1, y1)
+        found = []
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells_by_key):
+            keys = [key for key in cells_by_key if cx0 <= key[0] <= cx1 and cy0 <= key[1] <= cy1]
+        else:
+            keys = [(cx, cy) for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1)]
+        for key in keys:
+            for i in cells_by_key.get(key, ()):
+                if x0 <= graph.xs[i] <= x1 and y0 <= graph.ys[i] <= y1:
+                    found.append(i)
+        return found
+
+
+def _project(x, y, ax, ay, bx, by):
+    """Closest point to (x, y) on segment a-b"""
+    dx, dy = bx - ax, by - ay
+    length = dx * dx + dy * dy
+    if length == 0:
+        return ax, ay
+    t = max(0.0, min(1.0, ((x - ax) * dx + (y - ay) * dy) / length))
+    return ax + t * dx, ay + t * dy
@@ -0,0 +1,28 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Wall-clock timings of the phases of building the app"""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = []
+
+    def record(self, name, began):
+        self.phases.append((name, time.perf_counter() - began))
+
+    @contextmanager
+    def phase(self, name):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, began)
+
+    def report(self):
+        total = time.perf_counter() - self.started
+        lines = [f"Startup took {total * 1000:.1f} ms"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<20} {seconds * 1000:8.1f} ms")
+        return '\n'.join(lines)
@@ -0,0 +1,269 @@
+import gzip
+import hashlib
+import io
+import json
+import re
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from utils.graph_store import atomic_write
+from utils.svg_tiler import build_tiles
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip variants are built without it
+    brotli = None
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+NUMBER = re.compile(r'-?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?')
+URL_REF = re.compile(r'url\(#([^)]+)\)')
+# Transforms are left alone: rounding a .12 scale would visibly distort the map
+NUMERIC_ATTRIBUTES = {'d', 'points', 'x', 'y', 'x1', 'y1', 'x2', 'y2',
+                      'cx', 'cy', 'r', 'rx', 'ry', 'width', 'height', 'stroke-width'}
+# Presentation attributes children inherit, so identical values can move to the parent
+INHERITED = {'fill', 'fill-rule', 'fill-opacity', 'stroke', 'stroke-width', 'stroke-linecap',
+             'stroke-linejoin', 'stroke-miterlimit', 'stroke-dasharray', 'stroke-opacity',
+             'font-family', 'font-size', 'font-weight', 'font-style'}
+TEXT_TAGS = {f'{{{SVG_NS}}}text', f'{{{SVG_NS}}}tspan'}
+HREF_KEYS = ('href', '{http://www.w3.org/1999/xlink}href')
+# Editor bookkeeping that browsers ignore
+EDITOR_NAMESPACES = ('{http://www.inkscape.org/namespaces/inkscape}',
+                     '{http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd}')
+
+
+def _register_namespaces(source):
+    """Keep the document's own prefixes instead of ElementTree's ns0, ns1..."""
+    for _, (prefix, uri) in ET.iterparse(io.BytesIO(source), events=('start-ns',)):
+        ET.register_namespace(prefix, uri)
+    ET.register_namespace('', SVG_NS)
+
+
+def _round_numbers(value, precision):
+    def shorten(match):
+        text = match.group(0)
+        if '.' not in text or 'e' in text or 'E' in text:
+            return text
+        rounded = f'{float(text):.{precision}f}'.rstrip('0').rstrip('.')
+        if rounded in ('-0', ''):
+            rounded = '0'
+        return rounded
+    return NUMBER.sub(shorten, value)
+
+
+def _strip_editor_data(root, referenced):
+    """Drop editor metadata and ids nothing links to"""
+    for element in root.iter():
+        for child in list(element):
+            if isinstance(child.tag, str) and child.tag.startswith(EDITOR_NAMESPACES):
+                element.remove(child)
+        for name in list(element.attrib):
+            if name.startswith(EDITOR_NAMESPACES):
+                del element.attrib[name]
+        if element is not root and element.get('id') is not None and element.get('id') not in referenced:
+            del element.attrib['id']
+
+
+def _expand_styles(root):
+    """Turn inherited properties in style="" into attributes so they can be hoisted"""
+    for element in root.iter():
+        style = element.get('style')
+        if not style:
+            continue
+        remaining = []
+        for declaration in style.split(';'):
+            name, _, value = declaration.partition(':')
+            name, value = name.strip(), value.strip()
+            if not name:
+                continue
+            if name in INHERITED and '!' not in value:
+                element.set(name, value)
+            else:
+                remaining.append(f'{name}:{value}')
+        if remaining:
+            element.set('style', ';'.join(remaining))
+        else:
+            del element.attrib['style']
+
+
+def _dedupe_clip_paths(root):
+    """Point every reference at the first of a set of identical clipPaths"""
+    canonical, replacements = {}, {}
+    for clip in root.iter(f'{{{SVG_NS}}}clipPath'):
+        clip_id = clip.get('id')
+        if clip_id is None:
+            continue
+        attributes = sorted((k, v) for k, v in clip.attrib.items() if k != 'id')
+        key = repr(attributes) + ''.join(ET.tostring(child, encoding='unicode') for child in clip)
+        if key in canonical:
+            replacements[clip_id] = canonical[key]
+        else:
+            canonical[key] = clip_id
+    if replacements:
+        for element in root.iter():
+            for name, value in element.attrib.items():
+                if 'url(#' in value:
+                    element.set(name, URL_REF.sub(
+                        lambda m: f'url(#{replacements.get(m.group(1), m.group(1))})', value))
+    return len(replacements)
+
+
+def _referenced_ids(root):
+    referenced = set()
+    for element in root.iter():
+        for name, value in element.attrib.items():
+            referenced.update(URL_REF.findall(value))
+            if name in HREF_KEYS and value.startswith('#'):
+                referenced.add(value[1:])
+    return referenced
+
+
+def _strip_unused_defs(root):
+    referenced = _referenced_ids(root)
+    removed = 0
+    for defs in root.iter(f'{{{SVG_NS}}}defs'):
+        for child in list(defs):
+            if child.get('id') not in referenced:
+                defs.remove(child)
+                removed += 1
+    return removed
+
+
+def _hoist_shared_attributes(element):
+    """Move attributes every child repeats onto their group"""
+    for child in element:
+        _hoist_shared_attributes(child)
+    children = list(element)
+    if element.tag != f'{{{SVG_NS}}}g' or not children:
+        return
+
+    for name in INHERITED:
+        values = {child.get(name) for child in children}
+        if len(values) == 1 and None not in values:
+            element.set(name, values.pop())
+            for child in children:
+                del child.attrib[name]
+
+    # A shared child transform composes after the group's own transform;
+    # not safe when the group clips/masks in its own coordinate system
+    if any(element.get(name) for name in ('clip-path', 'mask', 'filter')):
+        return
+    transforms = {child.get('transform') for child in children}
+    if len(transforms) == 1 and None not in transforms:
+        transform = transforms.pop()
+        own = element.get('transform')
+        element.set('transform', f'{own} {transform}' if own else transform)
+        for child in children:
+            del child.attrib['transform']
+
+
+def _strip_whitespace(element):
+    if element.tag not in TEXT_TAGS:
+        if element.text and not element.text.strip():
+            element.text = None
+        for child in element:
+            if child.tail and not child.tail.strip():
+                child.tail = None
+            _strip_whitespace(child)
+
+
+def optimize(source, precision=1):
+    """Return a smaller but visually equivalent SVG document (bytes)"""
+    _register_namespaces(source)
+    root = ET.fromstring(source)
+    _strip_editor_data(root, _referenced_ids(root))
+    _expand_styles(root)
+    _dedupe_clip_paths(root)
+    _strip_unused_defs(root)
+    for element in root.iter():
+        for name in NUMERIC_ATTRIBUTES.intersection(element.attrib):
+            element.set(name, _round_numbers(element.get(name), precision))
+    _hoist_shared_attributes(root)
+    _strip_whitespace(root)
+    return ET.tostring(root, encoding='utf-8', short_empty_elements=True)
+
+
+class MapBuilder:
+    """Builds optimized, pre-compressed map variants and serves their metadata"""
+
+    def __init__(self, source_folder, build_folder, precision=1, tile_levels=3):
+        self.source_folder = Path(source_folder)
+        self.build_folder = Path(build_folder)
+        self.precision = precision
+        self.tile_levels = tile_levels
+        self._lock = threading.Lock()
+        self._tiles = {}
+
+    def sources(self):
+        return sorted(self.source_folder.glob('*.svg'))
+
+    def manifest_path(self, name):
+        return self.build_folder / f'{name}.json'
+
+    def build(self, name):
+        """Optimize one map and write .svg, .svg.gz (and .svg.br), its tile
+        pyramid and a manifest"""
+        source_path = self.source_folder / f'{name}.svg'
+        optimized = optimize(source_path.read_bytes(), self.precision)
+        self.build_folder.mkdir(parents=True, exist_ok=True)
+
+        variants = {'identity': optimized,
+                    'gzip': gzip.compress(optimized, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['br'] = brotli.compress(optimized, quality=9)
+        suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+        for encoding, payload in variants.items():
+            atomic_write(self.build_folder / f'{name}.svg{suffixes[encoding]}', payload)
+        build_tiles(name, optimized, self.build_folder / 'tiles', self.tile_levels)
+
+        manifest = {
+            'etag': hashlib.sha1(optimized).hexdigest()[:20],
+            'source_mtime': source_path.stat().st_mtime,
+            'source_size': source_path.stat().st_size,
+            'encodings': {encoding: len(payload) for encoding, payload in variants.items()}
+        }
+        atomic_write(self.manifest_path(name), json.dumps(manifest).encode('utf-8'))
+        return manifest
+
+    def build_all(self):
+        return {path.stem: self.build(path.stem) for path in self.sources()}
+
+    def manifest(self, name):
+        """Manifest for a built map, building it first if missing or outdated"""
+        source_path = self.source_folder / f'{name}.svg'
+        if not source_path.is_file():
+            return None
+        try:
+            manifest = json.loads(self.manifest_path(name).read_bytes())
+            if manifest['source_mtime'] == source_path.stat().st_mtime:
+                return manifest
+        except (OSError, ValueError, KeyError):
+            pass
+        with self._lock:
+            return self.build(name)
+
+    def variant_path(self, name, encoding):
+        suffix = {'identity': '', 'gzip': '.gz', 'br': '.br'}[encoding]
+        return self.build_folder / f'{name}.svg{suffix}'
+
+    def tiles(self, name):
+        """Tile pyramid manifest for a map, kept in memory per build"""
+        manifest = self.manifest(name)
+        if manifest is None:
+            return None
+        cached = self._tiles.get(name)
+        if cached is not None and cached[0] == manifest['etag']:
+            return cached[1]
+        path = self.build_folder / 'tiles' / name / 'tiles.json'
+        if not path.is_file():
+            with self._lock:
+                build_tiles(name, self.variant_path(name, 'identity').read_bytes(),
+                            self.build_folder / 'tiles', self.tile_levels)
+        tiles = json.loads(path.read_bytes())
+        tiles['etag'] = manifest['etag']
+        self._tiles[name] = (manifest['etag'], tiles)
+        return tiles
+
+    def tile_path(self, name, zoom, x, y, encoding):
+        suffix = '.gz' if encoding == 'gzip' else ''
+        return self.build_folder / 'tiles' / name / str(zoom) / f'{x}_{y}.svg{suffix}'
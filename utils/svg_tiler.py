@@ -0,0 +1,278 @@
+import gzip
+import json
+import math
+import re
+import xml.etree.ElementTree as ET
+from pathlib import Path
+
+from utils.graph_store import atomic_write
+
+SVG_NS = 'http://www.w3.org/2000/svg'
+DRAWABLE = {f'{{{SVG_NS}}}{tag}' for tag in
+            ('path', 'line', 'rect', 'circle', 'ellipse', 'polyline', 'polygon', 'text', 'image', 'use')}
+CONTAINERS = {f'{{{SVG_NS}}}{tag}' for tag in ('g', 'a', 'switch')}
+PATH_TOKEN = re.compile(r'([MmLlHhVvCcSsQqTtAaZz])|(-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+NUMBER = re.compile(r'-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+TRANSFORM = re.compile(r'(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)')
+URL_REF = re.compile(r'url\(#([^)]+)\)')
+PATH_ARGS = {'M': 2, 'L': 2, 'H': 1, 'V': 1, 'C': 6, 'S': 4, 'Q': 4, 'T': 2, 'A': 7, 'Z': 0}
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def _multiply(m, n):
+    a, b, c, d, e, f = m
+    a2, b2, c2, d2, e2, f2 = n
+    return (a * a2 + c * b2, b * a2 + d * b2,
+            a * c2 + c * d2, b * c2 + d * d2,
+            a * e2 + c * f2 + e, b * e2 + d * f2 + f)
+
+
+def parse_transform(value):
+    """SVG transform list as an affine (a, b, c, d, e, f) matrix"""
+    matrix = IDENTITY
+    for name, args in TRANSFORM.findall(value or ''):
+        v = [float(x) for x in NUMBER.findall(args)]
+        if name == 'matrix' and len(v) == 6:
+            step = tuple(v)
+        elif name == 'translate':
+            step = (1, 0, 0, 1, v[0] if v else 0, v[1] if len(v) > 1 else 0)
+        elif name == 'scale':
+            sx = v[0] if v else 1
+            step = (sx, 0, 0, v[1] if len(v) > 1 else sx, 0, 0)
+        elif name == 'rotate' and v:
+            angle = math.radians(v[0])
+            cos, sin = math.cos(angle), math.sin(angle)
+            step = (cos, sin, -sin, cos, 0, 0)
+            if len(v) == 3:
+                step = _multiply(_multiply((1, 0, 0, 1, v[1], v[2]), step), (1, 0, 0, 1, -v[1], -v[2]))
+        elif name == 'skewX' and v:
+            step = (1, 0, math.tan(math.radians(v[0])), 1, 0, 0)
+        elif name == 'skewY' and v:
+            step = (1, math.tan(math.radians(v[0])), 0, 1, 0, 0)
+        else:
+            continue
+        matrix = _multiply(matrix, step)
+    return matrix
+
+
+def _path_points(d):
+    """Endpoints and control points of a path; their hull bounds the shape"""
+    points = []
+    command, args = None, []
+    x = y = start_x = start_y = 0.0
+
+    def flush(command, args):
+        nonlocal x, y, start_x, start_y
+        upper = command.upper()
+        relative = command != upper
+        if upper == 'H':
+            x = args[0] + (x if relative else 0)
+        elif upper == 'V':
+            y = args[0] + (y if relative else 0)
+        elif upper == 'A':
+            rx, ry = abs(args[0]), abs(args[1])
+            nx, ny = args[5] + (x if relative else 0), args[6] + (y if relative else 0)
+            radius = max(rx, ry)
+            points.extend([(nx - radius, ny - radius), (nx + radius, ny + radius)])
+            x, y = nx, ny
+        else:
+            for i in range(0, len(args), 2):
+                px, py = args[i] + (x if relative else 0), args[i + 1] + (y if relative else 0)
+                points.append((px, py))
+            x, y = points[-1]
+        if upper == 'M':
+            start_x, start_y = x, y
+        points.append((x, y))
+
+    for letter, number in PATH_TOKEN.findall(d or ''):
+        if letter:
+            command, args = letter, []
+            if letter in 'Zz':
+                x, y = start_x, start_y
+            continue
+        if command is None or command in 'Zz':
+            continue
+        args.append(float(number))
+        if len(args) == PATH_ARGS[command.upper()]:
+            flush(command, args)
+            args = []
+            # Extra coordinate pairs after a moveto are implicit linetos
+            if command == 'M':
+                command = 'L'
+            elif command == 'm':
+                command = 'l'
+    return points
+
+
+def _number(element, name, default=0.0):
+    match = NUMBER.search(element.get(name) or '')
+    return float(match.group(0)) if match else default
+
+
+def _local_bounds(element, font_size):
+    """Bounding points of one drawable element in its own user space"""
+    tag = element.tag.split('}')[-1]
+    if tag == 'path':
+        return _path_points(element.get('d'))
+    if tag == 'line':
+        return [(_number(element, 'x1'), _number(element, 'y1')), (_number(element, 'x2'), _number(element, 'y2'))]
+    if tag in ('rect', 'image'):
+        x, y = _number(element, 'x'), _number(element, 'y')
+        return [(x, y), (x + _number(element, 'width'), y + _number(element, 'height'))]
+    if tag in ('circle', 'ellipse'):
+        cx, cy = _number(element, 'cx'), _number(element, 'cy')
+        rx = _number(element, 'r') if tag == 'circle' else _number(element, 'rx')
+        ry = _number(element, 'r') if tag == 'circle' else _number(element, 'ry')
+        return [(cx - rx, cy - ry), (cx + rx, cy + ry)]
+    if tag in ('polyline', 'polygon'):
+        values = [float(v) for v in NUMBER.findall(element.get('points') or '')]
+        return list(zip(values[0::2], values[1::2]))
+    if tag == 'text':
+        x, y = _number(element, 'x'), _number(element, 'y')
+        for child in element:
+            x, y = _number(child, 'x', x), _number(child, 'y', y)
+            break
+        width = 0.6 * font_size * len(''.join(element.itertext()))
+        return [(x, y - font_size), (x + width, y)]
+    return []
+
+
+def _transformed_box(points, matrix):
+    a, b, c, d, e, f = matrix
+    xs = [a * px + c * py + e for px, py in points]
+    ys = [b * px + d * py + f for px, py in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def collect_leaves(root, view_box):
+    """(element, parent chain, root-space box) for every drawable element"""
+    leaves = []
+
+    def walk(element, chain, matrix, font_size):
+        for child in element:
+            if not isinstance(child.tag, str) or child.tag.endswith('}defs'):
+                continue
+            child_matrix = _multiply(matrix, parse_transform(child.get('transform')))
+            child_font = _number(child, 'font-size', font_size)
+            if child.tag in CONTAINERS:
+                walk(child, chain + [child], child_matrix, child_font)
+            elif child.tag in DRAWABLE:
+                points = _local_bounds(child, child_font)
+                box = _transformed_box(points, child_matrix) if points else (
+                    view_box[0], view_box[1], view_box[0] + view_box[2], view_box[1] + view_box[3])
+                leaves.append((child, chain, box))
+
+    walk(root, [], IDENTITY, 16.0)
+    return leaves
+
+
+def _view_box(root):
+    values = [float(v) for v in NUMBER.findall(root.get('viewBox') or '')]
+    if len(values) == 4:
+        return values
+    return [0.0, 0.0, _number(root, 'width', 1.0), _number(root, 'height', 1.0)]
+
+
+def _tile_document(root, defs_by_id, leaves):
+    """Pruned copy of the document holding just these leaves and their ancestors"""
+    tile = ET.Element(root.tag, {k: v for k, v in root.attrib.items() if k != 'id'})
+    copies = {}
+    referenced = set()
+
+    def copy_of(element, parent):
+        key = id(element)
+        if key not in copies:
+            copies[key] = ET.SubElement(parent, element.tag, dict(element.attrib))
+            for value in element.attrib.values():
+                referenced.update(URL_REF.findall(value))
+        return copies[key]
+
+    defs = ET.SubElement(tile, f'{{{SVG_NS}}}defs')
+    for leaf, chain, _ in leaves:
+        parent = tile
+        for ancestor in chain:
+            parent = copy_of(ancestor, parent)
+        parent.append(leaf)
+        for value in leaf.attrib.values():
+            referenced.update(URL_REF.findall(value))
+
+    for def_id in sorted(referenced):
+        if def_id in defs_by_id:
+            defs.append(defs_by_id[def_id])
+    if not len(defs):
+        tile.remove(defs)
+    return ET.tostring(tile, encoding='utf-8', short_empty_elements=True)
+
+
+def build_tiles(name, source, out_folder, levels=3, detail=256):
+    """Split an SVG into a zoom pyramid of spatial tiles plus a manifest
+
+    Level z has a 2^z x 2^z grid. Each element goes to the tile holding its
+    box centre, and tiles record the bounds of what they contain so a
+    viewport query can include elements that spill over tile edges. Below
+    the deepest level, elements smaller than a tile width / detail (about
+    a pixel) are left out. Every element carries its index in the document
+    as data-order, so clients can merge tiles back into paint order.
+    """
+    ET.register_namespace('', SVG_NS)
+    root = ET.fromstring(source)
+    view_box = _view_box(root)
+    vx, vy, vw, vh = view_box
+    defs_by_id = {}
+    for defs in root.iter(f'{{{SVG_NS}}}defs'):
+        for child in defs:
+            if child.get('id'):
+                defs_by_id[child.get('id')] = child
+    leaves = collect_leaves(root, view_box)
+    for order, (leaf, _, _) in enumerate(leaves):
+        leaf.set('data-order', str(order))
+
+    out_folder = Path(out_folder) / name
+    manifest = {'viewBox': view_box, 'levels': []}
+    for zoom in range(levels + 1):
+        grid = 2 ** zoom
+        tile_w, tile_h = vw / grid, vh / grid
+        min_size = 0.0 if zoom == levels else max(tile_w, tile_h) / detail
+        buckets = {}
+        for leaf in leaves:
+            x0, y0, x1, y1 = leaf[2]
+            if max(x1 - x0, y1 - y0) < min_size:
+                continue
+            column = min(grid - 1, max(0, int(((x0 + x1) / 2 - vx) / tile_w)))
+            row = min(grid - 1, max(0, int(((y0 + y1) / 2 - vy) / tile_h)))
+            buckets.setdefault((column, row), []).append(leaf)
+
+        tiles = []
+        for (column, row), members in sorted(buckets.items()):
+            payload = _tile_document(root, defs_by_id, members)
+            path = out_folder / str(zoom) / f'{column}_{row}.svg'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(path, payload)
+            atomic_write(path.with_name(path.name + '.gz'), gzip.compress(payload, compresslevel=9, mtime=0))
+            tiles.append({
+                'x': column,
+                'y': row,
+                'bounds': [min(m[2][0] for m in members), min(m[2][1] for m in members),
+                           max(m[2][2] for m in members), max(m[2][3] for m in members)],
+                'elements': len(members),
+                'bytes': len(payload)
+            })
+        manifest['levels'].append({'zoom': zoom, 'grid': grid, 'min_size': min_size, 'tiles': tiles})
+
+    atomic_write(out_folder / 'tiles.json', json.dumps(manifest).encode('utf-8'))
+    return manifest
+
+
+def tiles_for_viewport(manifest, x, y, width, height, pixels=1024):
+    """Pick a level for the viewport and return (zoom, tiles intersecting it)
+
+    The level is the shallowest one whose dropped detail stays under two
+    screen pixels when `width` map units are shown across `pixels` pixels.
+    """
+    pixel = width / max(pixels, 1)
+    levels = manifest['levels']
+    level = next((candidate for candidate in levels if candidate['min_size'] <= 2 * pixel), levels[-1])
+    selected = [tile for tile in level['tiles']
+                if tile['bounds'][0] <= x + width and tile['bounds'][2] >= x
+                and tile['bounds'][1] <= y + height and tile['bounds'][3] >= y]
+    return level['zoom'], selected
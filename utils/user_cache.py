@@ -0,0 +1,120 @@
+import time
+
+from flask import session
+from flask_login import UserMixin
+from sqlalchemy import event
+
+from utils.route_cache import LocalBackend
+
+# Columns that authorization checks and templates read from current_user
+FIELDS = ('id', 'email', 'role', 'is_admin')
+SESSION_KEY = '_user_snapshot'
+
+
+class SessionUser(UserMixin):
+    """Detached copy of a User row, safe to share between requests"""
+
+    def __init__(self, id, email, role, is_admin):
+        self.id = id
+        self.email = email
+        self.role = role
+        self.is_admin = bool(is_admin)
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(*(getattr(user, field) for field in FIELDS))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in FIELDS}
+
+
+class UserCache:
+    """Per-process cache behind Flask-Login's user_loader
+
+    Lookups go to the in-process TTL cache, then (optionally) to a copy of
+    the user's role kept in the signed session cookie, and only then to the
+    database. Changes to a User row evict it from this process' cache; other
+    workers see the change once their entry or the session copy expires.
+    Checks that cannot wait that long (admin_required) use fresh().
+    """
+
+    def __init__(self, load, ttl=60, max_size=4096, session_ttl=0):
+        self.load = load  # user id -> User row or None
+        self.session_ttl = session_ttl
+        self.backend = LocalBackend(max_size=max_size, ttl=ttl)
+        self.lookups = {'cache': 0, 'session': 0, 'database': 0}
+
+    @classmethod
+    def from_config(cls, config, load):
+        """Build the cache described by USER_CACHE_* settings"""
+        return cls(load,
+                   ttl=config.get('USER_CACHE_TTL', 60),
+                   max_size=config.get('USER_CACHE_SIZE', 4096),
+                   session_ttl=config.get('USER_SESSION_ROLE_TTL', 0))
+
+    def get(self, user_id):
+        user = self.backend.get(user_id)
+        if user is not None:
+            self.lookups['cache'] += 1
+            return user
+
+        user = self._from_session(user_id)
+        if user is not None:
+            self.lookups['session'] += 1
+        else:
+            self.lookups['database'] += 1
+            row = self.load(user_id)
+            if row is None:
+                return None
+            user = SessionUser.from_user(row)
+            if self.session_ttl:
+                session[SESSION_KEY] = dict(user.to_dict(), checked=time.time())
+        self.backend.set(user_id, user)
+        return user
+
+    def fresh(self, user_id):
+        """The user as the database has it now, also replacing the cached and
+        session copies; None if the row is gone"""
+        self.lookups['database'] += 1
+        row = self.load(user_id)
+        if row is None:
+            self.invalidate(user_id)
+            return None
+        user = SessionUser.from_user(row)
+        self.backend.set(user_id, user)
+        if self.session_ttl:
+            session[SESSION_KEY] = dict(user.to_dict(), checked=time.time())
+        return user
+
+    def _from_session(self, user_id):
+        if not self.session_ttl:
+            return None
+        snapshot = session.get(SESSION_KEY)
+        if not snapshot or snapshot.get('id') != user_id:
+            return None
+        if time.time() - snapshot.get('checked', 0) >= self.session_ttl:
+            return None  # re-check the role against the database
+        return SessionUser(*(snapshot.get(field) for field in FIELDS))
+
+    def invalidate(self, user_id):
+        self.backend.delete(user_id)
+
+    def clear(self):
+        self.backend.clear()
+
+    def watch(self, model):
+        """Evict users from this process' cache when their rows change
+
+        Only this process hears the event: other workers keep their copy for
+        up to the TTL, which is why admin checks go through fresh().
+        """
+        def evict(mapper, connection, target):
+            if target.id is not None:
+                self.invalidate(target.id)
+        event.listen(model, 'after_update', evict)
+        event.listen(model, 'after_delete', evict)
+
+
+def forget_session_user():
+    """Drop the session's role copy on logout"""
+    session.pop(SESSION_KEY, None)
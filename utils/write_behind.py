@@ -0,0 +1,256 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import DateTime
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue of rows, bulk-inserted by a background thread
+
+    submit() never touches the database: rows wait in the queue and are
+    inserted batch_size at a time, one transaction per batch. If the queue
+    is full (the database is slow) or a batch cannot be written (it is
+    down), rows are appended to a spill file instead and replayed once
+    inserts succeed again. Each process spills to its own file and replays
+    its own plus those left by processes that have exited. Rows still
+    queued at interpreter exit are written (or spilled) before it ends.
+    """
+
+    def __init__(self, app, db, model, spill_folder, max_size=1000, batch_size=100,
+                 flush_interval=1.0, retry_after=5.0):
+        self.app = app
+        self.db = db
+        self.table = model.__table__
+        self.spill_folder = Path(spill_folder)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_after = retry_after
+        self._queue = queue.Queue(max_size)
+        self._spill_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = threading.Event()
+        self._retry_at = 0.0
+        self._replay_due = True  # spill files may be left from a previous run
+        # Bumped from request threads (spills), the worker and atexit
+        self._counts = {'inserted': 0, 'spilled': 0, 'replayed': 0, 'dropped': 0}
+        self._counts_lock = threading.Lock()
+        self._dates = [column.name for column in self.table.columns if isinstance(column.type, DateTime)]
+        atexit.register(self.stop)
+
+    @classmethod
+    def from_config(cls, app, db, model, name):
+        """Queue for one model, described by WRITE_BEHIND_* settings"""
+        config = app.config
+        return cls(app, db, model, Path(config['WRITE_BEHIND_FOLDER']) / name,
+                   max_size=config.get('WRITE_BEHIND_QUEUE_SIZE', 1000),
+                   batch_size=config.get('WRITE_BEHIND_BATCH_SIZE', 100),
+                   flush_interval=config.get('WRITE_BEHIND_FLUSH_INTERVAL', 1.0),
+                   retry_after=config.get('WRITE_BEHIND_RETRY_AFTER', 5.0))
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    @property
+    def counts(self):
+        """Rows inserted, spilled, replayed and dropped so far (a copy)"""
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def _count(self, outcome, rows):
+        with self._counts_lock:
+            self._counts[outcome] += rows
+
+    def submit(self, row):
+        """Queue a row (a dict of column values) for insertion"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._spill([row])
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._thread is None or self._pid != os.getpid():
+            with self._spill_lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take(self.flush_interval)
+            if batch:
+                self._write(batch)
+            elif self._replay_due and time.monotonic() >= self._retry_at:
+                self._replay()
+
+    def _take(self, timeout):
+        """Up to batch_size queued rows, waiting up to timeout for the first"""
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows):
+        if time.monotonic() < self._retry_at:
+            self._spill(rows)  # database failing: don't hold rows in memory
+            return
+        try:
+            self._insert(rows)
+            self._count('inserted', len(rows))
+        except OperationalError as e:
+            logger.error("Write-behind insert failed, spilling to disk",
+                         extra={'table': self.table.name, 'rows': len(rows), 'error': str(e)})
+            self._retry_at = time.monotonic() + self.retry_after
+            self._spill(rows)
+
+    def _insert(self, rows):
+        """Insert rows in one transaction; rows the database rejects (bad
+        data rather than a connection problem) are logged and dropped"""
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                session.execute(self.table.insert(), rows)
+                session.commit()
+                return
+            except OperationalError:
+                session.rollback()
+                raise
+            except SQLAlchemyError:
+                session.rollback()
+            # One bad row fails the whole batch; find it
+            for row in rows:
+                try:
+                    session.execute(self.table.insert(), [row])
+                    session.commit()
+                except OperationalError:
+                    session.rollback()
+                    raise
+                except SQLAlchemyError as e:
+                    session.rollback()
+                    self._count('dropped', 1)
+                    logger.error("Write-behind row rejected", extra={'table': self.table.name, 'error': str(e)})
+
+    def _spill(self, rows, again=False):
+        lines = ''.join(json.dumps(row, default=_encode) + '\n' for row in rows)
+        with self._spill_lock:
+            self.spill_folder.mkdir(parents=True, exist_ok=True)
+            with open(self.spill_folder / f'{os.getpid()}.jsonl', 'a') as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            if not again:
+                self._count('spilled', len(rows))
+            self._replay_due = True
+
+    def _replay(self):
+        """Insert spilled rows: this process' file and those of exited processes"""
+        self._replay_due = False
+        if not self.spill_folder.is_dir():
+            return
+        for path in self.spill_folder.glob('*.replay'):
+            # Claimed by a process that died mid-replay: make it claimable again
+            owner = path.stem.rsplit('.', 1)[-1]
+            if owner.isdigit() and not _alive(int(owner)):
+                try:
+                    os.rename(path, path.with_name(path.stem.replace('.', '-') + '.jsonl'))
+                except FileNotFoundError:
+                    pass
+        for path in sorted(self.spill_folder.glob('*.jsonl')):
+            pid = int(path.stem) if path.stem.isdigit() else None
+            if pid != os.getpid() and _alive(pid):
+                continue
+            claimed = path.with_suffix(f'.{os.getpid()}.replay')
+            with self._spill_lock:
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue  # another process claimed it first
+            rows = self._read(claimed)
+            done = 0
+            try:
+                while done < len(rows):
+                    batch = rows[done:done + self.batch_size]
+                    self._insert(batch)
+                    done += len(batch)
+                    self._count('replayed', len(batch))
+            except OperationalError as e:
+                logger.error("Replaying spilled rows failed",
+                             extra={'table': self.table.name, 'file': str(path), 'error': str(e)})
+                self._retry_at = time.monotonic() + self.retry_after
+                self._spill(rows[done:], again=True)
+                os.unlink(claimed)
+                return
+            os.unlink(claimed)
+            logger.info("Replayed spilled rows", extra={'table': self.table.name, 'rows': len(rows)})
+
+    def _read(self, path):
+        rows = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # torn final line from a crash mid-append
+                for name in self._dates:
+                    if isinstance(row.get(name), str):
+                        row[name] = datetime.fromisoformat(row[name])
+                rows.append(row)
+        return rows
+
+    def stop(self, timeout=5.0):
+        """Stop the worker and write whatever is still queued"""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            try:
+                self._insert(batch)
+                self._count('inserted', len(batch))
+            except Exception:
+                self._spill(batch)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot store {type(value).__name__} in a spill file")
+
+
+def _alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True